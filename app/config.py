@@ -22,6 +22,10 @@ class Settings(BaseSettings):
     GTFS_ENCODING: str = "utf-8"
     ROUTE_STATIONS_CSV: str = "app/data/derived/route_stations.csv"
 
+    # Share stop_times/shapes across workers as read-only mmap datasets
+    GTFS_SHARED_DATASET: bool = False
+    GTFS_DATASET_DIR: str = "app/data/derived/static_dataset"
+
     GTFS_STOPS_CSV: str | None = "app/data/gtfs/stops.txt"
     GTFS_STOPS_BY_NUCLEUS: dict[str, str] | None = None
 
@@ -41,6 +45,30 @@ class Settings(BaseSettings):
     LIVE_POLL_MODE: str = "cron"
     IDLE_SLEEP_SECONDS: int = 600  # 10 min without traffic -> sleep
     FRESHNESS_TOLERANCE_S: int = 35
+    # Fetch positions and trip updates together (needs ENABLE_TRIP_UPDATES_POLL)
+    LIVE_UNIFIED_INGEST: bool = True
+
+    # --- Multi-worker: one poller, shared snapshots ---
+    LIVE_SHARED_SNAPSHOTS: bool = False
+    LIVE_SHARED_DIR: str | None = None  # default /dev/shm/dondeestamitren-<uid>, mode 0700
+    LIVE_SHARED_SYNC_SECONDS: int = 2
+
+    # --- Platform habits: observation log folded into the JSON snapshot every N s ---
+    PLATFORM_HABITS_COMPACT_SECONDS: int = 300
+
+    # --- Train pass recorder: optional SQLite journal replayed at boot ---
+    TRAIN_PASS_JOURNAL_PATH: str | None = None  # e.g. app/data/derived/train_passes.sqlite
+
+    # --- HTTP caching: live endpoint ETags also roll over every N s ---
+    HTTP_ETAG_MAX_AGE_S: int = 30
+    # Responses smaller than this are sent uncompressed
+    HTTP_COMPRESS_MIN_BYTES: int = 1024
+
+    # --- WebSocket publishing ---
+    WS_PUBLISH_WORKERS: int = 4
+
+    # --- Metrics: request latency histograms + Prometheus text on /metrics ---
+    METRICS_ENABLED: bool = True
 
     model_config = SettingsConfigDict(
         env_file=".env",
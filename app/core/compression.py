@@ -0,0 +1,161 @@
+# app/core/compression.py
+from __future__ import annotations
+
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:  # optional; without it only gzip is negotiated
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+COMPRESSIBLE_TYPES = frozenset(
+    {
+        "application/json",
+        "application/geo+json",
+        "application/javascript",
+        "application/xml",
+        "image/svg+xml",
+    }
+)
+
+
+def accepts_encoding(accept_encoding: str, coding: str) -> bool:
+    for part in accept_encoding.lower().split(","):
+        name, *params = part.split(";")
+        if name.strip() != coding:
+            continue
+        for param in params:
+            k, _, v = param.strip().partition("=")
+            if k == "q":
+                try:
+                    return float(v) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+def _compressible(content_type: str) -> bool:
+    ct = content_type.split(";", 1)[0].strip().lower()
+    return ct.startswith("text/") or ct in COMPRESSIBLE_TYPES or ct.endswith("+json")
+
+
+class _Encoder:
+    def __init__(self, coding: str, gzip_level: int, br_quality: int):
+        if coding == "br":
+            self._br = brotli.Compressor(quality=br_quality)
+            self._gz = None
+        else:
+            self._br = None
+            self._gz = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes, final: bool) -> bytes:
+        if self._br is not None:
+            out = self._br.process(data)
+            return out + (self._br.finish() if final else self._br.flush())
+        out = self._gz.compress(data)
+        return out + self._gz.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    """
+    Negotiated brotli/gzip for text-like responses of at least ``minimum_size``.
+
+    Single-message bodies are compressed in one go (with a real Content-Length);
+    streamed bodies are compressed chunk by chunk. Responses that already carry
+    a Content-Encoding (e.g. precompressed pages) pass through untouched.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        br_quality: int = 4,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.br_quality = br_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        ae = Headers(scope=scope).get("accept-encoding") or ""
+        if brotli is not None and accepts_encoding(ae, "br"):
+            coding = "br"
+        elif accepts_encoding(ae, "gzip"):
+            coding = "gzip"
+        else:
+            await self.app(scope, receive, send)
+            return
+
+        start: Message | None = None
+        encoder: _Encoder | None = None
+        passthrough = False
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start, encoder, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if (
+                    message["status"] < 200
+                    or message["status"] in (204, 206, 304)
+                    or "content-encoding" in headers
+                    or not _compressible(headers.get("content-type") or "")
+                ):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start = message
+                return
+
+            if message["type"] != "http.response.body":
+                # e.g. http.response.pathsend: hand over untouched
+                passthrough = True
+                if start is not None:
+                    await send(start)
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+
+            if encoder is None:
+                headers = MutableHeaders(raw=start["headers"])
+                if not more and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                encoder = _Encoder(coding, self.gzip_level, self.br_quality)
+                headers["content-encoding"] = coding
+                headers.add_vary_header("Accept-Encoding")
+                if more:
+                    del headers["content-length"]
+                else:
+                    body = encoder.chunk(body, final=True)
+                    headers["content-length"] = str(len(body))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send(start)
+
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": encoder.chunk(body, final=not more),
+                    "more_body": more,
+                }
+            )
+
+        await self.app(scope, receive, send_compressed)
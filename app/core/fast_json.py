@@ -0,0 +1,40 @@
+# app/core/fast_json.py
+from __future__ import annotations
+
+import json
+from typing import Any
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+try:  # optional; falls back to jsonable_encoder + json.dumps
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+__all__ = ["FastJSONResponse", "dumps"]
+
+
+def _default(obj: Any) -> Any:
+    # Only reached for types orjson can't encode natively (pydantic models, sets, ...)
+    return jsonable_encoder(obj)
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response encoded with orjson when available.
+
+    Plain dict/list/str/number payloads (and datetimes, dataclasses) are encoded
+    directly; ``jsonable_encoder`` only runs for the objects orjson rejects.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
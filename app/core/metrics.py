@@ -0,0 +1,217 @@
+# app/core/metrics.py
+from __future__ import annotations
+
+import math
+import threading
+import time
+from bisect import bisect_left
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+
+from starlette.routing import Mount
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; request latencies sit at the low end, feed fetches and full
+# refreshes at the high end (the poll budget is 30s)
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+# (name, type, help, [(labels, value), ...]) as produced by scrape-time collectors
+Family = tuple[str, str, str, list[tuple[dict[str, str], float]]]
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram keyed by label values.
+
+    ``observe`` is a bisect plus three increments under a lock, cheap enough
+    for the request path; buckets are only accumulated at render time.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._series: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, *labels)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = [(k, list(s[0]), s[1], s[2]) for k, s in self._series.items()]
+        lines = [f"# HELP {self.name} {_escape_help(self.help)}", f"# TYPE {self.name} histogram"]
+        for key, counts, total, n in sorted(items):
+            labels = dict(zip(self.labelnames, key, strict=True))
+            acc = 0
+            for bound, c in zip((*self.buckets, math.inf), counts, strict=True):
+                acc += c
+                lines.append(f"{self.name}_bucket{_labels({**labels, 'le': _num(bound)})} {acc}")
+            lines.append(f"{self.name}_sum{_labels(labels)} {_num(total)}")
+            lines.append(f"{self.name}_count{_labels(labels)} {n}")
+        return lines
+
+
+_registry: list[Histogram] = []
+
+
+def histogram(
+    name: str,
+    help: str,
+    labelnames: tuple[str, ...] = (),
+    buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+) -> Histogram:
+    h = Histogram(name, help, labelnames, buckets)
+    _registry.append(h)
+    return h
+
+
+HTTP_REQUEST_SECONDS = histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template.",
+    ("method", "route", "status"),
+)
+REFRESH_STAGE_SECONDS = histogram(
+    "refresh_stage_duration_seconds",
+    "Realtime refresh pipeline stage durations.",
+    ("feed", "stage"),
+)
+REPO_LOAD_SECONDS = histogram(
+    "repo_load_duration_seconds",
+    "Static GTFS repository load durations.",
+    ("repo",),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0),
+)
+
+
+def _num(v: float) -> str:
+    if math.isinf(v):
+        return "+Inf" if v > 0 else "-Inf"
+    if float(v).is_integer():
+        return str(int(v))
+    return repr(float(v))
+
+
+def _escape_help(s: str) -> str:
+    return s.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _escape_label(v: str) -> str:
+    return _escape_help(str(v)).replace('"', '\\"')
+
+
+def _labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels.items()) + "}"
+
+
+def render(families: Iterable[Family] = ()) -> str:
+    """Prometheus text exposition (0.0.4) of the registry plus scrape-time families."""
+    lines: list[str] = []
+    for h in _registry:
+        lines.extend(h.render())
+    for name, kind, help_, samples in families:
+        lines.append(f"# HELP {name} {_escape_help(help_)}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            if value is None:
+                continue
+            lines.append(f"{name}{_labels(labels)} {_num(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def route_label(scope: Scope, outer_root_path: str = "") -> str:
+    """
+    Route template a request matched (``/api/trains/{train_id}/position``), so
+    the label set stays bounded whatever the path parameters were.
+
+    Read after the app ran: routing records the matched route in the scope and
+    a Mount appends its prefix to ``root_path``; a mounted app that matched no
+    route of its own (StaticFiles) is labelled ``<prefix>/{path}``.
+    """
+    root = scope.get("root_path") or ""
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    if route is not None and path is not None and not isinstance(route, Mount):
+        return root + path
+    if root != outer_root_path:
+        return root + "/{path}"
+    return "<unmatched>"
+
+
+class MetricsMiddleware:
+    """
+    Records ``http_request_duration_seconds`` per (method, route template, status).
+
+    Pure ASGI: one ``perf_counter`` pair and a histogram observe per request.
+    Placed outermost, so the timing includes ETag checks and compression.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        root_path = scope.get("root_path") or ""
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - t0,
+                scope["method"],
+                route_label(scope, root_path),
+                str(status),
+            )
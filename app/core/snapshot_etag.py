@@ -0,0 +1,128 @@
+# app/core/snapshot_etag.py
+from __future__ import annotations
+
+import hashlib
+import re
+import time
+from urllib.parse import parse_qsl, urlencode
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.services.live_trains_cache import get_live_trains_cache
+from app.services.trip_updates_cache import get_trip_updates_cache
+from app.services.trips_repo import peek_repo as peek_trips_repo
+
+# Live views: their output only changes with the live/TU snapshots, the GTFS
+# release or the clock (bounded by the max-age bucket below).
+LIVE_PATHS = (
+    re.compile(r"^/api/trains/[^/]+/[^/]+/position$"),
+    re.compile(r"^/api/stops/[^/]+/[^/]+/services$"),
+    re.compile(r"^/trains/(?!state$|events$)[^/]+$"),
+    re.compile(r"^/trains/[^/]+/[^/]+$"),
+    re.compile(r"^/lines/[^/]+/[^/]+/trains$"),
+    re.compile(r"^/routes/[^/]+/[^/]+/stops/[^/]+$"),
+)
+
+# Request headers the handlers (or render) read; part of the tag
+VARY_HEADERS = (b"cookie", b"x-user-nucleus", b"hx-request", b"accept")
+
+# Client cache-busters that never change the response
+IGNORED_PARAMS = frozenset({"_ts"})
+
+_counters = {"not_modified": 0, "full": 0}
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(c.strip().removeprefix("W/") == opaque for c in if_none_match.split(","))
+
+
+class SnapshotETagMiddleware:
+    """
+    Weak ETags for live endpoints, answered with 304 before the handler runs.
+
+    The tag hashes the request (path, query, ``VARY_HEADERS``) together with
+    the live and trip-updates snapshot versions, the GTFS release and a
+    ``max_age_s`` clock bucket, so a poll between two refreshes costs a hash.
+    Until the trips repo is loaded (no release known) requests pass through.
+    """
+
+    def __init__(self, app: ASGIApp, max_age_s: int = 30, paths=LIVE_PATHS):
+        self.app = app
+        self.max_age_s = max(1, int(max_age_s))
+        self.paths = tuple(paths)
+
+    def _snapshot_key(self) -> tuple | None:
+        trips = peek_trips_repo()
+        if trips is None:
+            return None
+        live = get_live_trains_cache()
+        tu = get_trip_updates_cache()
+        return (
+            live.snapshot_version(),
+            live.last_snapshot_iso(),
+            tu.snapshot_version(),
+            tu.last_snapshot_iso(),
+            trips.release_token,
+            int(time.time() // self.max_age_s),
+        )
+
+    def etag_for(self, scope: Scope) -> str | None:
+        snap = self._snapshot_key()
+        if snap is None:
+            return None
+        query = scope.get("query_string", b"").decode("latin-1")
+        if query:
+            pairs = [(k, v) for k, v in parse_qsl(query, True) if k not in IGNORED_PARAMS]
+            query = urlencode(sorted(pairs))
+        headers = dict(scope.get("headers") or ())
+        h = hashlib.blake2b(digest_size=12)
+        h.update(repr((scope["path"], query, snap)).encode())
+        for name in VARY_HEADERS:
+            h.update(b"\0" + headers.get(name, b""))
+        return f'W/"{h.hexdigest()}"'
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] not in ("GET", "HEAD")
+            or not any(p.match(scope["path"]) for p in self.paths)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        etag = self.etag_for(scope)
+        if etag is None:
+            await self.app(scope, receive, send)
+            return
+
+        inm = Headers(scope=scope).get("if-none-match")
+        if inm and etag_matches(inm, etag):
+            _counters["not_modified"] += 1
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 304,
+                    "headers": [(b"etag", etag.encode()), (b"cache-control", b"no-cache")],
+                }
+            )
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        _counters["full"] += 1
+
+        async def send_with_etag(message: Message) -> None:
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                headers = MutableHeaders(scope=message)
+                headers.setdefault("etag", etag)
+                headers.setdefault("cache-control", "no-cache")
+            await send(message)
+
+        await self.app(scope, receive, send_with_etag)
+
+
+def etag_stats() -> dict[str, int]:
+    return dict(_counters)
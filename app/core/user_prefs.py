@@ -6,15 +6,12 @@ COOKIE_NAME = "demt.nucleus"
 COOKIE_MAX_AGE = 60 * 60 * 24 * 365  # 1 año
 
 
-def _catalog_slugs() -> set[str]:
-    repo = get_routes_repo()
+def _catalog_slugs() -> frozenset[str]:
+    # Rebuilt by RoutesRepo.load(), so it follows GTFS reloads
     try:
-        nuclei = repo.list_nuclei() or []
-        return {
-            (n.get("slug") or "").strip().lower() for n in nuclei if (n.get("slug") or "").strip()
-        }
+        return get_routes_repo().nucleus_slugs()
     except Exception:
-        return set()
+        return frozenset()
 
 
 def sanitize_slug(slug: str | None) -> str | None:
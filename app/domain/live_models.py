@@ -2,6 +2,9 @@
 from __future__ import annotations
 
 import re
+from array import array
+from dataclasses import dataclass, field
+from functools import lru_cache
 
 from google.transit import gtfs_realtime_pb2
 from pydantic import BaseModel, Field
@@ -55,6 +58,7 @@ class TrainPosition(BaseModel):
         return mapping.get(s.upper())
 
 
+@lru_cache(maxsize=8192)  # same trips/labels come back every poll
 def _route_from_trip_or_label(trip_id: str, label: str | None) -> str:
     s1 = (trip_id or "").strip()
     s2 = (label or "").strip()
@@ -124,6 +128,84 @@ def parse_train_gtfs_pb(
     )
 
 
+# -------- Protobuf, columnar fast path --------
+
+_STATUS_NAMES = dict((v, k) for k, v in gtfs_realtime_pb2.VehiclePosition.VehicleStopStatus.items())
+
+
+@dataclass(slots=True)
+class VehicleColumns:
+    """Vehicle positions of one feed, one list/array per field we use."""
+
+    header_ts: int = 0
+    trip_id: list[str] = field(default_factory=list)
+    train_id: list[str] = field(default_factory=list)
+    label: list[str] = field(default_factory=list)
+    lat: array = field(default_factory=lambda: array("d"))
+    lon: array = field(default_factory=lambda: array("d"))
+    stop_id: list[str] = field(default_factory=list)
+    status: array = field(default_factory=lambda: array("b"))
+    ts: array = field(default_factory=lambda: array("q"))
+
+    def __len__(self) -> int:
+        return len(self.trip_id)
+
+
+def decode_vehicle_positions(feed: gtfs_realtime_pb2.FeedMessage) -> VehicleColumns:
+    """
+    Single pass over a parsed feed reading only the fields we need. With the
+    upb runtime each access is a C-level field read, no per-entity objects.
+    """
+    cols = VehicleColumns(header_ts=int(feed.header.timestamp or 0))
+    trip_ids, train_ids, labels = cols.trip_id, cols.train_id, cols.label
+    lats, lons, stop_ids, statuses, tss = cols.lat, cols.lon, cols.stop_id, cols.status, cols.ts
+    for ent in feed.entity:
+        if not ent.HasField("vehicle"):
+            continue
+        veh = ent.vehicle
+        pos = veh.position
+        info = veh.vehicle
+        trip_ids.append(veh.trip.trip_id)
+        train_ids.append(info.id)
+        labels.append(info.label)
+        lats.append(pos.latitude)
+        lons.append(pos.longitude)
+        stop_ids.append(veh.stop_id)
+        statuses.append(veh.current_status)
+        tss.append(veh.timestamp)
+    return cols
+
+
+def positions_from_columns(cols: VehicleColumns) -> list[TrainPosition]:
+    """Same rows and filtering as parse_train_gtfs_pb."""
+    out: list[TrainPosition] = []
+    default_ts = int(cols.header_ts or 0)
+    for i in range(len(cols)):
+        trip_id = cols.trip_id[i].strip()
+        train_id = cols.train_id[i].strip()
+        label = cols.label[i]
+        route = _route_from_trip_or_label(trip_id, label)
+        if not (trip_id and route and train_id):
+            continue
+        lat = cols.lat[i]
+        lon = cols.lon[i]
+        status = cols.status[i]
+        out.append(
+            TrainPosition(
+                train_id=train_id,
+                trip_id=trip_id,
+                route_short_name=route,
+                lat=float(lat) if lat else None,
+                lon=float(lon) if lon else None,
+                stop_id=cols.stop_id[i].strip() or None,
+                current_status=_STATUS_NAMES.get(status) or _STATUS_FALLBACK.get(status),
+                ts_unix=int(cols.ts[i]) or default_ts,
+                label=label or None,
+            )
+        )
+    return out
+
+
 # -------- JSON (fallback) --------
 
 
@@ -9,13 +9,17 @@ from contextlib import asynccontextmanager, suppress
 
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
-from fastapi import FastAPI, Request
+from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
 
 from app.config import settings
+from app.core.compression import CompressionMiddleware
+from app.core.metrics import MetricsMiddleware
+from app.core.snapshot_etag import SnapshotETagMiddleware
 from app.routers.lines_api import router as lines_api
 from app.routers.live_api import router as live_api_router
+from app.routers.metrics_api import router as metrics_api_router
 from app.routers.prefs_api import router as prefs_router
 from app.routers.search_station_api import router as search_station_api_router
 from app.routers.trains_api import router as trains_api_router
@@ -23,8 +27,18 @@ from app.routers.web import router as web_router
 from app.routers.web_admin import router as web_admin_router
 from app.routers.web_alpha import router as web_alpha_router
 from app.services.gtfs_static_manager import STORE_ROOT
+from app.services.live_coordinator import (
+    KIND_LIVE,
+    KIND_TRIP_UPDATES,
+    get_live_coordinator,
+)
+from app.services.live_publisher import get_live_publisher
 from app.services.live_trains_cache import get_live_trains_cache
-from app.services.ws_manager import broadcast_train_sync, broadcast_trains_sync, set_event_loop
+from app.services.page_cache import get_page_cache
+from app.services.platform_habits import get_service as get_platform_habits
+from app.services.realtime_ingest import get_realtime_ingest
+from app.services.route_geometry import get_route_geometry
+from app.services.ws_manager import set_event_loop
 
 scheduler: BackgroundScheduler | None = None
 
@@ -63,10 +77,17 @@ _app_state = AppState()
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 
 
-class ActivityMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        _app_state.last_activity_ts = time.time()
-        return await call_next(request)
+class ActivityMiddleware:
+    """Records the last HTTP request for adaptive polling; static assets don't count."""
+
+    def __init__(self, app: ASGIApp, skip_prefixes: tuple[str, ...] = ("/static/",)):
+        self.app = app
+        self.skip_prefixes = skip_prefixes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and not scope["path"].startswith(self.skip_prefixes):
+            _app_state.last_activity_ts = time.time()
+        await self.app(scope, receive, send)
 
 
 def build_scheduler() -> BackgroundScheduler:
@@ -74,88 +95,58 @@ def build_scheduler() -> BackgroundScheduler:
     mode = (settings.LIVE_POLL_MODE or "adaptive").strip().lower()
     log = logging.getLogger("scheduler")
 
-    if mode != "on_demand":
-        get_live_trains_cache().refresh()
-        if getattr(settings, "ENABLE_TRIP_UPDATES_POLL", False):
-            with suppress(Exception):
-                from app.services.trip_updates_cache import get_trip_updates_cache
+    # With several workers only the one holding the poller lock talks to Renfe;
+    # the others load its published snapshots (see LiveCoordinator).
+    coord = get_live_coordinator()
 
-                get_trip_updates_cache().refresh()
+    def is_poller() -> bool:
+        return coord is None or coord.try_lead()
 
-    def job_live():
+    # Positions and trip updates in one pass (see RealtimeIngest); else two offset jobs
+    poll_tu = getattr(settings, "ENABLE_TRIP_UPDATES_POLL", False)
+    unified = poll_tu and getattr(settings, "LIVE_UNIFIED_INGEST", True)
+
+    def refresh_live():
         cache = get_live_trains_cache()
-        cache.refresh()
+        if unified:
+            from app.services.trip_updates_cache import get_trip_updates_cache
+
+            get_realtime_ingest().run()
+            if coord is not None:
+                coord.publish(KIND_TRIP_UPDATES, get_trip_updates_cache().export_state())
+        else:
+            cache.refresh()
+        if coord is not None:
+            coord.publish(KIND_LIVE, cache.export_state())
+
+    def refresh_tu():
+        from app.services.trip_updates_cache import get_trip_updates_cache
 
-        # Broadcast to WebSocket subscribers
-        try:
-            from app.services.ws_manager import get_ws_manager
-
-            manager = get_ws_manager()
-
-            # Get nuclei with active subscribers
-            active_nuclei = manager.active_nuclei_blocking()
-
-            for nucleus in active_nuclei:
-                trains = cache.get_by_nucleus(nucleus)
-                if trains:
-                    # Convert trains to dicts for JSON serialization
-                    trains_data = []
-                    train_subs = set()
-                    try:
-                        train_subs = manager.trains_for_nucleus_blocking(nucleus)
-                    except Exception:
-                        train_subs = set()
-                    train_subs_norm = {str(x) for x in train_subs}
-
-                    for t in trains:
-                        # Basic payload for list view
-                        payload = {
-                            "train_id": getattr(t, "train_id", None),
-                            "label": getattr(t, "label", None),
-                            "route_id": getattr(t, "route_id", None),
-                            "route_short_name": getattr(t, "route_short_name", None),
-                            "direction_id": getattr(t, "direction_id", None),
-                            "stop_id": getattr(t, "stop_id", None),
-                            "current_status": getattr(t, "current_status", None),
-                            "lat": getattr(t, "lat", None),
-                            "lon": getattr(t, "lon", None),
-                            "timestamp": getattr(t, "timestamp", None),
-                        }
-                        trains_data.append(payload)
-
-                        # For subscribed trains, build complete payload with /position structure
-                        tid = payload.get("train_id")
-                        if tid and str(tid) in train_subs_norm:
-                            try:
-                                # Build complete payload using shared function
-                                # (matches HTTP /position structure)
-                                from app.routers.trains_api import build_train_position_payload
-
-                                complete_payload = build_train_position_payload(
-                                    nucleus, str(tid), tz="Europe/Madrid"
-                                )
-
-                                if complete_payload:
-                                    broadcast_train_sync(nucleus, complete_payload)
-                                else:
-                                    # Fallback to basic payload if train is not live
-                                    broadcast_train_sync(nucleus, payload)
-                            except Exception as detail_error:
-                                log.debug(
-                                    "Error building train detail for %s: %s", tid, detail_error
-                                )
-                                # Fallback to basic payload
-                                broadcast_train_sync(nucleus, payload)
-
-                    broadcast_trains_sync(nucleus, trains_data)
-        except Exception as e:
-            log.debug("WebSocket broadcast error: %s", e)
+        tu_cache = get_trip_updates_cache()
+        tu_cache.refresh()
+        if coord is not None:
+            coord.publish(KIND_TRIP_UPDATES, tu_cache.export_state())
+
+    if mode != "on_demand":
+        if is_poller():
+            refresh_live()
+            if poll_tu and not unified:
+                with suppress(Exception):
+                    refresh_tu()
+        else:
+            with suppress(Exception):
+                coord.sync_from_leader()
+
+    def job_live():
+        # Broadcasting to WebSocket subscribers runs on the event loop, triggered
+        # by the cache's snapshot listener (see LivePublisher).
+        if is_poller():
+            refresh_live()
         return
 
     def job_tu():
-        from app.services.trip_updates_cache import get_trip_updates_cache
-
-        get_trip_updates_cache().refresh()
+        if is_poller():
+            refresh_tu()
         return
 
     if mode in {"cron", "adaptive"}:
@@ -167,7 +158,7 @@ def build_scheduler() -> BackgroundScheduler:
             coalesce=True,
             replace_existing=True,
         )
-        if getattr(settings, "ENABLE_TRIP_UPDATES_POLL", False):
+        if poll_tu and not unified:
             s.add_job(
                 job_tu,
                 CronTrigger(second="10,40"),
@@ -177,11 +168,35 @@ def build_scheduler() -> BackgroundScheduler:
                 replace_existing=True,
             )
 
+    if coord is not None and mode in {"cron", "adaptive"}:
+
+        def job_sync_shared():
+            if coord.is_leader():
+                return
+            try:
+                coord.report_activity(_app_state.last_activity_ts)
+                coord.sync_from_leader()
+            except Exception:
+                log.exception("shared snapshot sync error")
+
+        s.add_job(
+            job_sync_shared,
+            "interval",
+            seconds=max(1, int(settings.LIVE_SHARED_SYNC_SECONDS)),
+            id="sync_shared_snapshots",
+            max_instances=1,
+            coalesce=True,
+            replace_existing=True,
+        )
+
     if mode == "adaptive":
 
         def idle_manager():
             try:
-                idle = time.time() - _app_state.last_activity_ts
+                last_activity = _app_state.last_activity_ts
+                if coord is not None:
+                    last_activity = max(last_activity, coord.shared_last_activity())
+                idle = time.time() - last_activity
                 idle_limit = int(getattr(settings, "IDLE_SLEEP_SECONDS", 600))
 
                 should_pause = idle > idle_limit
@@ -214,6 +229,32 @@ def build_scheduler() -> BackgroundScheduler:
 
     elif mode == "on_demand":
         log.info("Modo on_demand: sin polling de fondo.")
+
+    def job_compact_platform_habits():
+        try:
+            get_platform_habits().compact()
+        except Exception:
+            log.exception("platform habits compaction error")
+
+    def job_warm_route_geometry():
+        try:
+            get_route_geometry().warm()
+        except Exception:
+            log.exception("route geometry warm-up error")
+
+    # One-off: map geometry for every route-dir of the current release
+    s.add_job(job_warm_route_geometry, id="warm_route_geometry", replace_existing=True)
+
+    s.add_job(
+        job_compact_platform_habits,
+        "interval",
+        seconds=max(30, int(settings.PLATFORM_HABITS_COMPACT_SECONDS)),
+        id="compact_platform_habits",
+        max_instances=1,
+        coalesce=True,
+        replace_existing=True,
+    )
+
     gw_log = logging.getLogger("gtfs-static")
 
     def job_watch_gtfs_static():
@@ -240,6 +281,15 @@ def build_scheduler() -> BackgroundScheduler:
                     from app.services.routes_repo import get_repo as get_routes_repo
 
                     get_routes_repo().reload()
+                with suppress(Exception):
+                    from app.services.shapes_repo import get_repo as get_shapes_repo
+
+                    get_shapes_repo().reload()
+                # Rendered pages were tagged with the old release; drop them only
+                # once every repo has switched over
+                get_page_cache().invalidate()
+                get_route_geometry().invalidate()
+                get_route_geometry().warm()
         except Exception:
             gw_log.exception("Error vigilando GTFS")
 
@@ -269,7 +319,12 @@ async def lifespan(app: FastAPI) -> AsyncIterator[None]:
     import asyncio
 
     # Set event loop for WebSocket broadcasts from scheduler jobs
-    set_event_loop(asyncio.get_event_loop())
+    loop = asyncio.get_event_loop()
+    set_event_loop(loop)
+
+    publisher = get_live_publisher()
+    publisher.start(loop)
+    get_live_trains_cache().add_listener(publisher.notify)
 
     scheduler = build_scheduler()
     scheduler.start()
@@ -278,10 +333,23 @@ async def lifespan(app: FastAPI) -> AsyncIterator[None]:
     finally:
         if scheduler:
             scheduler.shutdown(wait=False)
+        await publisher.stop()
+        with suppress(Exception):
+            get_platform_habits().compact()
+        coord = get_live_coordinator()
+        if coord is not None:
+            coord.release()
 
 
 app = FastAPI(title="dondeestamitren", lifespan=lifespan)
+# Added first so it runs inside ActivityMiddleware: 304s still count as activity
+app.add_middleware(SnapshotETagMiddleware, max_age_s=settings.HTTP_ETAG_MAX_AGE_S)
 app.add_middleware(ActivityMiddleware)
+# Compresses whatever the stack produced (precompressed pages pass through)
+app.add_middleware(CompressionMiddleware, minimum_size=settings.HTTP_COMPRESS_MIN_BYTES)
+if settings.METRICS_ENABLED:
+    # Outermost, so the latency covers the whole stack (compression included)
+    app.add_middleware(MetricsMiddleware)
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
 app.include_router(lines_api)
@@ -290,6 +358,8 @@ app.include_router(web_router)
 app.include_router(live_api_router)
 app.include_router(prefs_router)
 app.include_router(search_station_api_router)
+if settings.METRICS_ENABLED:
+    app.include_router(metrics_api_router)
 
 # --- Alpha endpoints ---
 alpha_app = FastAPI(docs_url=None, redoc_url=None)
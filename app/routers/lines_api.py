@@ -1,6 +1,11 @@
 # app/routers/lines_api.py
-from fastapi import APIRouter, HTTPException, Query
+import hashlib
 
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import Response
+
+from app.core.snapshot_etag import etag_matches
+from app.services.route_geometry import get_route_geometry
 from app.services.routes_repo import get_repo
 
 router = APIRouter(prefix="/api", tags=["lines"])
@@ -22,3 +27,28 @@ def line_detail(key: str, direction_id: str = Query(default="", description="0|1
         "length_km": line.length_km,
         "stations": [vars(s) for s in line.stations],
     }
+
+
+@router.get("/routes/{route_id}/geometry")
+def route_geometry(
+    request: Request,
+    route_id: str,
+    direction_id: str = Query(default="", description="0|1 o vacío"),
+    z: float | None = Query(default=None, ge=0, le=24, description="Zoom del mapa"),
+    v: str | None = Query(default=None, description="Release GTFS con la que se generó la URL"),
+):
+    hit = get_route_geometry().body(route_id, direction_id, z)
+    if hit is None:
+        raise HTTPException(404, "Route geometry not found")
+    release, body = hit
+    etag = f'W/"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+    # URLs carry the release they were built for: those never change
+    if release and v == release:
+        cache_control = "public, max-age=31536000, immutable"
+    else:
+        cache_control = "no-cache"
+    headers = {"etag": etag, "cache-control": cache_control}
+    inm = request.headers.get("if-none-match")
+    if inm and etag_matches(inm, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
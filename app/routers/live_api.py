@@ -2,7 +2,10 @@ from __future__ import annotations
 
 from fastapi import APIRouter, Query
 
+from app.services import train_pass_recorder
+from app.services.live_coordinator import get_live_coordinator
 from app.services.platform_habits import get_service as get_platform_habits
+from app.services.realtime_ingest import get_realtime_ingest
 from app.services.renfe_client import get_client
 
 router = APIRouter(tags=["live"])
@@ -27,6 +30,24 @@ def raw_trains_pb():
     }
 
 
+@router.get("/_debug/live-coordinator")
+def debug_live_coordinator():
+    coord = get_live_coordinator()
+    if coord is None:
+        return {"enabled": False}
+    return {"enabled": True, **coord.stats()}
+
+
+@router.get("/_debug/realtime-ingest")
+def debug_realtime_ingest():
+    return get_realtime_ingest().stats()
+
+
+@router.get("/_debug/train-pass-recorder")
+def debug_train_pass_recorder():
+    return train_pass_recorder.stats()
+
+
 @router.post("/_debug/platforms/observe")
 def debug_platforms_observe(
     nucleus: str,
@@ -0,0 +1,150 @@
+# app/routers/metrics_api.py
+from __future__ import annotations
+
+import time
+
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+from app.core import metrics
+from app.core.snapshot_etag import etag_stats
+from app.services.live_publisher import get_live_publisher
+from app.services.live_trains_cache import get_live_trains_cache
+from app.services.page_cache import get_page_cache
+from app.services.route_geometry import get_route_geometry
+from app.services.trip_updates_cache import get_trip_updates_cache
+from app.services.ws_manager import get_ws_manager
+
+router = APIRouter(tags=["metrics"])
+
+
+def _cache_families(caches: dict[str, dict]) -> list[metrics.Family]:
+    """BoundedCache.stats() dicts -> hit/miss/eviction counters and size gauges."""
+    fields = (
+        ("cache_hits_total", "counter", "Cache lookups served from the cache.", "hits"),
+        ("cache_misses_total", "counter", "Cache lookups that had to compute.", "misses"),
+        ("cache_evictions_total", "counter", "Entries evicted by the size bound.", "evictions"),
+        ("cache_hit_ratio", "gauge", "hits / (hits + misses) since start.", "hit_ratio"),
+        ("cache_entries", "gauge", "Entries currently held.", "size"),
+    )
+    return [
+        (name, kind, help_, [({"cache": c}, st.get(key)) for c, st in caches.items()])
+        for name, kind, help_, key in fields
+    ]
+
+
+def _live_families(feeds: dict[str, dict]) -> list[metrics.Family]:
+    now = time.time()
+    publisher = get_live_publisher().stats()
+    return [
+        (
+            "realtime_items",
+            "gauge",
+            "Entities held by each realtime cache.",
+            [({"feed": f}, st.get("items")) for f, st in feeds.items()],
+        ),
+        (
+            "realtime_snapshot_age_seconds",
+            "gauge",
+            "Age of the feed header timestamp of the last merged snapshot.",
+            [
+                ({"feed": f}, now - st["last_snapshot_ts"])
+                for f, st in feeds.items()
+                if st.get("last_snapshot_ts")
+            ],
+        ),
+        (
+            "realtime_errors_streak",
+            "gauge",
+            "Consecutive failed fetches.",
+            [({"feed": f}, st.get("errors_streak")) for f, st in feeds.items()],
+        ),
+        (
+            "live_publish_skipped_snapshots_total",
+            "counter",
+            "Snapshots coalesced because a publish was still running.",
+            [({}, publisher["skipped_snapshots"])],
+        ),
+    ]
+
+
+def _ws_families() -> list[metrics.Family]:
+    manager = get_ws_manager()
+    stats = manager.get_stats()
+    totals = manager.queue_totals()
+    queues = stats["queues"]
+    return [
+        (
+            "ws_connections",
+            "gauge",
+            "Open WebSocket connections.",
+            [({}, stats["total_connections"])],
+        ),
+        (
+            "ws_queue_depth",
+            "gauge",
+            "Messages pending in per-connection send queues.",
+            [({}, queues["depth_total"])],
+        ),
+        (
+            "ws_queue_max_lag_seconds",
+            "gauge",
+            "Age of the oldest pending message over all connections.",
+            [({}, queues["max_lag_s"])],
+        ),
+        ("ws_messages_sent_total", "counter", "Frames written.", [({}, totals["sent"])]),
+        ("ws_bytes_sent_total", "counter", "JSON bytes written.", [({}, totals["bytes_sent"])]),
+        (
+            "ws_messages_dropped_total",
+            "counter",
+            "Messages dropped by full send queues.",
+            [({}, totals["dropped"])],
+        ),
+        (
+            "ws_messages_coalesced_total",
+            "counter",
+            "Messages replaced by a newer one of the same kind.",
+            [({}, totals["coalesced"])],
+        ),
+        (
+            "ws_slow_disconnects_total",
+            "counter",
+            "Connections closed as slow consumers.",
+            [({}, stats["slow_disconnects"])],
+        ),
+    ]
+
+
+def collect() -> list[metrics.Family]:
+    live = get_live_trains_cache().debug_state()
+    tu = get_trip_updates_cache().debug_state()
+    caches = {
+        "pages": get_page_cache().stats(),
+        "trip_resolved_ctx": tu["resolved_ctx_cache"],
+        "trip_direction_infer": tu["direction_infer_cache"],
+    }
+    etags = etag_stats()
+    geometry = get_route_geometry().stats()
+    return [
+        *_cache_families(caches),
+        (
+            "http_etag_responses_total",
+            "counter",
+            "Snapshot-ETag answers by outcome.",
+            [({"result": k}, v) for k, v in etags.items()],
+        ),
+        (
+            "route_geometry_bytes",
+            "gauge",
+            "Encoded route geometry held in memory.",
+            [({}, geometry["bytes"])],
+        ),
+        *_live_families({"vehicle_positions": live, "trip_updates": tu}),
+        *_ws_families(),
+    ]
+
+
+@router.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    # async: the WebSocket queues are only touched from the event loop
+    return Response(content=metrics.render(collect()), media_type=metrics.CONTENT_TYPE)
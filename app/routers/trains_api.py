@@ -7,20 +7,19 @@ import time
 from typing import Any
 
 from fastapi import APIRouter, HTTPException, Query, WebSocket, WebSocketDisconnect
-from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse
 
+from app.core.fast_json import FastJSONResponse
 from app.services.eta_projector import build_rt_arrival_times_from_vm
+from app.services.live_publisher import get_live_publisher
 from app.services.live_trains_cache import get_live_trains_cache
 from app.services.routes_repo import get_repo as get_routes_repo
-from app.services.shapes_repo import get_repo as get_shapes_repo
 from app.services.stops_repo import get_repo as get_stops_repo
 from app.services.train_services_index import _haversine_m, _latlon, build_train_detail_vm
 from app.services.ws_manager import get_ws_manager
 from app.viewkit import hhmm_local, safe_get_field
 from app.viewmodels.train_detail import build_train_detail_view
 
-router = APIRouter(prefix="/api", tags=["trains"])
+router = APIRouter(prefix="/api", tags=["trains"], default_response_class=FastJSONResponse)
 
 
 def _pick_time(row: dict | None, fields: tuple[str, ...]) -> int | None:
@@ -78,78 +77,6 @@ def _train_as_dict(train) -> dict[str, Any] | None:
     return info
 
 
-def _route_geojson_from_vm(vm: dict[str, Any], train_obj: Any) -> tuple[dict | None, dict | None]:
-    route_geojson = None
-    route_stops_geojson = None
-    try:
-        route_obj = vm.get("route")
-        unified = vm.get("unified") or {}
-        route_id = (
-            getattr(route_obj, "route_id", None)
-            or (unified.get("route_id") if isinstance(unified, dict) else None)
-            or getattr(train_obj, "route_id", None)
-        )
-        direction_id = (
-            getattr(route_obj, "direction_id", None)
-            or (unified.get("direction_id") if isinstance(unified, dict) else None)
-            or getattr(train_obj, "direction_id", None)
-        )
-        poly = None
-        if route_id:
-            poly = get_shapes_repo().polyline_for_route(route_id, direction_id)
-        if poly:
-            coords = [
-                [float(p.lon), float(p.lat)]
-                for p in poly
-                if getattr(p, "lat", None) is not None and getattr(p, "lon", None) is not None
-            ]
-            if len(coords) > 500:
-                step = max(1, len(coords) // 500)
-                coords = coords[::step]
-            if coords:
-                route_geojson = {"type": "LineString", "coordinates": coords}
-
-        stops_src = (vm.get("trip") or {}).get("stops") or []
-        if not stops_src and route_obj and getattr(route_obj, "stations", None):
-            stops_src = [
-                {
-                    "stop_id": st.stop_id,
-                    "stop_name": st.stop_name,
-                    "lat": getattr(st, "lat", None),
-                    "lon": getattr(st, "lon", None),
-                    "seq": getattr(st, "seq", None),
-                }
-                for st in getattr(route_obj, "stations", [])
-            ]
-        if stops_src:
-            features = []
-            for st in stops_src:
-                try:
-                    lat_s = float(st.get("lat"))
-                    lon_s = float(st.get("lon"))
-                except Exception:
-                    continue
-                if lat_s is None or lon_s is None:
-                    continue
-                features.append(
-                    {
-                        "type": "Feature",
-                        "geometry": {"type": "Point", "coordinates": [lon_s, lat_s]},
-                        "properties": {
-                            "stop_id": st.get("stop_id"),
-                            "name": st.get("stop_name") or st.get("name"),
-                            "seq": st.get("seq"),
-                        },
-                    }
-                )
-            if features:
-                route_stops_geojson = {"type": "FeatureCollection", "features": features}
-    except Exception:
-        route_geojson = None
-        route_stops_geojson = None
-    return route_geojson, route_stops_geojson
-
-
 def _train_type_label_text(status_view: Any) -> str:
     label = safe_get_field(status_view, "train_type_label", "")
     seen_age = safe_get_field(status_view, "seen_age_seconds")
@@ -723,7 +650,7 @@ def live_train_position(
     if payload is None:
         raise HTTPException(404, detail="Train not found or not live")
 
-    return JSONResponse(jsonable_encoder(payload))
+    return FastJSONResponse(payload)
 
 
 @router.get(
@@ -955,7 +882,7 @@ def upcoming_services_for_stop(
     if include_variants:
         variants = [
             {"route_id": rid, "direction_id": did}
-            for rid, did in stops_repo._variant_routes_for_stop(
+            for rid, did in get_routes_repo().variant_routes_for_stop(
                 route_id, dir_norm if dir_norm else None, stop_id
             )
         ]
@@ -971,17 +898,19 @@ def upcoming_services_for_stop(
         "direction_id": getattr(route_obj, "direction_id", dir_norm or ""),
     }
 
-    return {
-        "stop": _stop_as_dict(stop),
-        "route": route_info,
-        "requested_route_id": route_id,
-        "resolved_direction": dir_norm or "",
-        "limit": limit,
-        "tz": tz,
-        "include_variants": include_variants,
-        "variants_considered": variants,
-        "services": services,
-    }
+    return FastJSONResponse(
+        {
+            "stop": _stop_as_dict(stop),
+            "route": route_info,
+            "requested_route_id": route_id,
+            "resolved_direction": dir_norm or "",
+            "limit": limit,
+            "tz": tz,
+            "include_variants": include_variants,
+            "variants_considered": variants,
+            "services": services,
+        }
+    )
 
 
 # ---------------------- WebSocket endpoint ----------------------
@@ -995,10 +924,13 @@ async def websocket_trains(websocket: WebSocket, nucleus: str):
     Messages from client:
     - {"type": "subscribe", "station_id": "12345"} - Subscribe to specific station
     - {"type": "subscribe_train", "train_id": "TR123"} - Subscribe to a specific train
+    - {"type": "resync"} - Request a full trains snapshot (e.g. after a seq gap)
     - {"type": "ping"} - Keep-alive ping
 
     Messages to client:
-    - {"type": "trains_update", "data": [...]} - Train positions updated
+    - {"type": "trains_update", "seq": N, "data": [...]} - Full snapshot of nucleus trains
+    - {"type": "trains_delta", "seq": N, "base_seq": N-1, "added": [...],
+       "changed": {train_id: {field: value}}, "removed": [train_id]} - Changes since base_seq
     - {"type": "train_update", "train_id": "...", "data": {...}} - Specific train update
     - {"type": "arrivals_update", "station_id": "...", "data": [...]} - Arrivals for station
     - {"type": "pong"} - Response to ping
@@ -1023,6 +955,7 @@ async def websocket_trains(websocket: WebSocket, nucleus: str):
                     "station_id": None,
                 },
             )
+            await manager.send_snapshot(websocket, nucleus_norm)
 
         # Listen for messages
         while True:
@@ -1033,6 +966,9 @@ async def websocket_trains(websocket: WebSocket, nucleus: str):
                 if msg_type == "ping":
                     await manager.send_to_connection(websocket, {"type": "pong"})
 
+                elif msg_type == "resync":
+                    await manager.send_snapshot(websocket, nucleus_norm)
+
                 elif msg_type == "subscribe":
                     station_id = (data.get("station_id") or "").strip() or None
                     await manager.subscribe(websocket, nucleus_norm, station_id)
@@ -1119,4 +1055,6 @@ async def websocket_trains(websocket: WebSocket, nucleus: str):
 @router.get("/ws/stats")
 async def websocket_stats():
     """Get WebSocket connection statistics."""
-    return get_ws_manager().get_stats()
+    stats = get_ws_manager().get_stats()
+    stats["publisher"] = get_live_publisher().stats()
+    return stats
@@ -2,7 +2,6 @@
 import re
 from collections import defaultdict
 from contextlib import suppress
-from math import atan2, cos, radians, sin, sqrt
 
 from fastapi import APIRouter, HTTPException, Query, Request
 from fastapi.responses import HTMLResponse
@@ -10,9 +9,10 @@ from fastapi.responses import HTMLResponse
 from app.services.eta_projector import build_rt_arrival_times_from_vm
 from app.services.lines_index import get_index as get_lines_index
 from app.services.live_trains_cache import get_live_trains_cache
+from app.services.page_cache import get_page_cache
 from app.services.platform_habits import get_service as get_platform_habits
+from app.services.route_geometry import get_route_geometry
 from app.services.routes_repo import get_repo as get_routes_repo
-from app.services.shapes_repo import get_repo as get_shapes_repo
 from app.services.stations_repo import get_repo as get_stations_repo
 from app.services.stops_repo import get_repo as get_stops_repo
 from app.services.train_services_index import build_train_detail_vm
@@ -28,76 +28,20 @@ def _matches_station(qnorm: str, st) -> bool:
     )
 
 
-def _route_geojson_from_vm(vm: dict, train_obj) -> tuple[dict | None, dict | None]:
-    route_geojson = None
-    route_stops_geojson = None
-    try:
-        route_obj = vm.get("route")
-        unified = vm.get("unified") or {}
-        route_id = (
-            getattr(route_obj, "route_id", None)
-            or (unified.get("route_id") if isinstance(unified, dict) else None)
-            or getattr(train_obj, "route_id", None)
-        )
-        direction_id = (
-            getattr(route_obj, "direction_id", None)
-            or (unified.get("direction_id") if isinstance(unified, dict) else None)
-            or getattr(train_obj, "direction_id", None)
-        )
-        poly = None
-        if route_id:
-            poly = get_shapes_repo().polyline_for_route(route_id, direction_id)
-        if poly:
-            coords = [
-                [float(p.lon), float(p.lat)]
-                for p in poly
-                if getattr(p, "lat", None) is not None and getattr(p, "lon", None) is not None
-            ]
-            if len(coords) > 500:
-                step = max(1, len(coords) // 500)
-                coords = coords[::step]
-            if coords:
-                route_geojson = {"type": "LineString", "coordinates": coords}
-
-        stops_src = (vm.get("trip") or {}).get("stops") or []
-        if not stops_src and route_obj and getattr(route_obj, "stations", None):
-            stops_src = [
-                {
-                    "stop_id": st.stop_id,
-                    "stop_name": st.stop_name,
-                    "lat": getattr(st, "lat", None),
-                    "lon": getattr(st, "lon", None),
-                    "seq": getattr(st, "seq", None),
-                }
-                for st in getattr(route_obj, "stations", [])
-            ]
-        if stops_src:
-            features = []
-            for st in stops_src:
-                try:
-                    lat_s = float(st.get("lat"))
-                    lon_s = float(st.get("lon"))
-                except Exception:
-                    continue
-                if lat_s is None or lon_s is None:
-                    continue
-                features.append(
-                    {
-                        "type": "Feature",
-                        "geometry": {"type": "Point", "coordinates": [lon_s, lat_s]},
-                        "properties": {
-                            "stop_id": st.get("stop_id"),
-                            "name": st.get("stop_name") or st.get("name"),
-                            "seq": st.get("seq"),
-                        },
-                    }
-                )
-            if features:
-                route_stops_geojson = {"type": "FeatureCollection", "features": features}
-    except Exception:
-        route_geojson = None
-        route_stops_geojson = None
-    return route_geojson, route_stops_geojson
+def _route_ref_from_vm(vm: dict, train_obj) -> tuple[str | None, str | None]:
+    route_obj = vm.get("route")
+    unified = vm.get("unified") or {}
+    route_id = (
+        getattr(route_obj, "route_id", None)
+        or (unified.get("route_id") if isinstance(unified, dict) else None)
+        or getattr(train_obj, "route_id", None)
+    )
+    direction_id = (
+        getattr(route_obj, "direction_id", None)
+        or (unified.get("direction_id") if isinstance(unified, dict) else None)
+        or getattr(train_obj, "direction_id", None)
+    )
+    return route_id, direction_id
 
 
 def _attach_lines_to_stations_for_nucleus(
@@ -121,40 +65,35 @@ def _attach_lines_to_mixed_nuclei(stations: list, stations_repo, max_lines: int
             st.lines = lines_map.get(st.station_id, [])
 
 
-def _haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    R = 6371.0
-    dlat = radians(lat2 - lat1)
-    dlon = radians(lon2 - lon1)
-    a = sin(dlat / 2.0) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2.0) ** 2
-    c = 2 * atan2(sqrt(1 - a), sqrt(a))
-    return R * c
-
-
-def _filter_sort_stations(
-    stations: list,
+def _nearest_stations(
+    stations_repo,
+    nucleus_slug: str | None,
     q: str | None,
-    lat: float | None,
-    lon: float | None,
+    lat: float,
+    lon: float,
     limit: int,
 ) -> list:
+    accept = None
     if q:
         qnorm = normalize_text(q)
-        stations = [st for st in stations if _matches_station(qnorm, st)]
 
-    if lat is not None and lon is not None:
+        def accept(st) -> bool:
+            return _matches_station(qnorm, st)
 
-        def _dist(st):
-            try:
-                return _haversine_km(float(st.lat), float(st.lon), float(lat), float(lon))
-            except Exception:
-                return float("inf")
+    hits = stations_repo.nearest(
+        float(lat), float(lon), max(1, int(limit or 50)), nucleus_slug=nucleus_slug, accept=accept
+    )
+    return [st for st, _ in hits]
 
-        stations.sort(key=_dist)
-    else:
-        stations.sort(
-            key=lambda st: (normalize_text(getattr(st, "name", "")), getattr(st, "station_id", ""))
-        )
 
+def _filter_sort_stations(stations: list, q: str | None, limit: int) -> list:
+    if q:
+        qnorm = normalize_text(q)
+        stations = [st for st in stations if _matches_station(qnorm, st)]
+
+    stations.sort(
+        key=lambda st: (normalize_text(getattr(st, "name", "")), getattr(st, "station_id", ""))
+    )
     return stations[: max(1, int(limit or 50))]
 
 
@@ -204,25 +143,38 @@ def home(request: Request):
 
 @router.get("/routes/", response_class=HTMLResponse)
 def routes(request: Request):
+    page_cache = get_page_cache()
+    cached = page_cache.lookup(request)
+    if cached is not None:
+        return cached
+
     repo = get_routes_repo()
     routes_list = repo.list_routes()
 
     if not routes_list:
         raise HTTPException(404, "No routes")
 
-    return render(
+    return page_cache.store(
         request,
-        "routes.html",
-        {
-            "routes": routes_list,
-            "repo": repo,
-            "nucleus": None,
-        },
+        render(
+            request,
+            "routes.html",
+            {
+                "routes": routes_list,
+                "repo": repo,
+                "nucleus": None,
+            },
+        ),
     )
 
 
 @router.get("/routes/{nucleus}", response_class=HTMLResponse)
 def nucleus_routes(request: Request, nucleus: str):
+    page_cache = get_page_cache()
+    cached = page_cache.lookup(request)
+    if cached is not None:
+        return cached
+
     repo = get_routes_repo()
     nucleus = (nucleus or "").lower()
     routes_list = repo.list_lines_grouped_by_route(nucleus)
@@ -230,14 +182,17 @@ def nucleus_routes(request: Request, nucleus: str):
     if not routes_list:
         raise HTTPException(404, f"'{nucleus}' without routes.")
 
-    return render(
+    return page_cache.store(
         request,
-        "routes.html",
-        {
-            "nucleus": mk_nucleus(nucleus),
-            "routes": routes_list,
-            "repo": repo,
-        },
+        render(
+            request,
+            "routes.html",
+            {
+                "nucleus": mk_nucleus(nucleus),
+                "routes": routes_list,
+                "repo": repo,
+            },
+        ),
     )
 
 
@@ -274,6 +229,11 @@ def route_page_by_id(
 
 @router.get("/lines", response_class=HTMLResponse)
 def lines_list(request: Request):
+    page_cache = get_page_cache()
+    cached = page_cache.lookup(request)
+    if cached is not None:
+        return cached
+
     repo = get_routes_repo()
     lines = get_lines_index().list_lines()
     nuclei = repo.list_nuclei()
@@ -282,20 +242,28 @@ def lines_list(request: Request):
         for n in nuclei
         if (n.get("slug") and n.get("name"))
     }
-    return render(
+    return page_cache.store(
         request,
-        "lines.html",
-        {
-            "lines": lines,
-            "nucleus": None,
-            "repo": repo,
-            "nucleus_names_by_id": nucleus_names_by_id,
-        },
+        render(
+            request,
+            "lines.html",
+            {
+                "lines": lines,
+                "nucleus": None,
+                "repo": repo,
+                "nucleus_names_by_id": nucleus_names_by_id,
+            },
+        ),
     )
 
 
 @router.get("/lines/{nucleus}", response_class=HTMLResponse)
 def lines_by_nucleus(request: Request, nucleus: str):
+    page_cache = get_page_cache()
+    cached = page_cache.lookup(request)
+    if cached is not None:
+        return cached
+
     repo = get_routes_repo()
     nucleus = (nucleus or "").strip().lower()
     lines = [
@@ -307,15 +275,18 @@ def lines_by_nucleus(request: Request, nucleus: str):
         for n in nuclei
         if (n.get("slug") and n.get("name"))
     }
-    return render(
+    return page_cache.store(
         request,
-        "lines.html",
-        {
-            "lines": lines,
-            "nucleus": mk_nucleus(nucleus),
-            "repo": repo,
-            "nucleus_names_by_id": nucleus_names_by_id,
-        },
+        render(
+            request,
+            "lines.html",
+            {
+                "lines": lines,
+                "nucleus": mk_nucleus(nucleus),
+                "repo": repo,
+                "nucleus_names_by_id": nucleus_names_by_id,
+            },
+        ),
     )
 
 
@@ -586,26 +557,33 @@ def stations_all_list(
     lon: float | None = Query(default=None),
     limit: int | None = Query(default=None, ge=1, le=1000),
 ):
+    # Coordinate lookups are per-user; plain and text listings only depend on GTFS
+    page_cache = get_page_cache() if lat is None and lon is None else None
+    if page_cache is not None:
+        cached = page_cache.lookup(request)
+        if cached is not None:
+            return cached
+
     routes_repo = get_routes_repo()
     stations_repo = get_stations_repo()
 
-    all_stations: list = []
     nuclei = routes_repo.list_nuclei()
-    slugs = []
-    for n in nuclei:
-        slug = (n.get("slug") or "").strip().lower()
-        if slug:
-            slugs.append(slug)
-            all_stations.extend(stations_repo.list_by_nucleus(slug))
+    slugs = [s for s in ((n.get("slug") or "").strip().lower() for n in nuclei) if s]
 
     eff_limit = _effective_station_limit(limit, q=q, lat=lat, lon=lon, default_all=200)
-    stations = _filter_sort_stations(all_stations, q=q, lat=lat, lon=lon, limit=eff_limit)
+    if lat is not None and lon is not None:
+        stations = _nearest_stations(stations_repo, None, q=q, lat=lat, lon=lon, limit=eff_limit)
+    else:
+        all_stations: list = []
+        for slug in slugs:
+            all_stations.extend(stations_repo.list_by_nucleus(slug))
+        stations = _filter_sort_stations(all_stations, q=q, limit=eff_limit)
 
     station_lines_lookup: dict[str, dict[str, list]] = {}
     for slug in slugs:
         station_lines_lookup[slug] = stations_repo.get_lines_map_for_nucleus(slug, max_lines=6)
 
-    return render(
+    response = render(
         request,
         "stations.html",
         {
@@ -619,6 +597,7 @@ def stations_all_list(
             "station_lines_lookup": station_lines_lookup,
         },
     )
+    return page_cache.store(request, response) if page_cache is not None else response
 
 
 @router.get("/stations/{nucleus}", response_class=HTMLResponse)
@@ -683,13 +662,23 @@ def stations_list(
             },
         )
 
-    stations = stations_repo.list_by_nucleus(nucleus)
+    page_cache = get_page_cache() if lat is None and lon is None else None
+    if page_cache is not None:
+        cached = page_cache.lookup(request)
+        if cached is not None:
+            return cached
+
     eff_limit = _effective_station_limit(limit, q=q, lat=lat, lon=lon, default_all=50)
-    stations = _filter_sort_stations(stations, q=q, lat=lat, lon=lon, limit=eff_limit)
+    if lat is not None and lon is not None:
+        stations = _nearest_stations(stations_repo, nucleus, q=q, lat=lat, lon=lon, limit=eff_limit)
+    else:
+        stations = _filter_sort_stations(
+            stations_repo.list_by_nucleus(nucleus), q=q, limit=eff_limit
+        )
 
     station_lines_map = stations_repo.get_lines_map_for_nucleus(nucleus, max_lines=6)
 
-    return render(
+    response = render(
         request,
         "stations.html",
         {
@@ -703,6 +692,7 @@ def stations_list(
             "station_lines_map": station_lines_map,
         },
     )
+    return page_cache.store(request, response) if page_cache is not None else response
 
 
 # --- TRAINS ---
@@ -809,7 +799,6 @@ def train_detail(
         repo,
         last_seen_stop_id=train_last_stop_id,
     )
-    route_geojson, route_stops_geojson = _route_geojson_from_vm(vm, train_obj)
 
     return render(
         request,
@@ -830,8 +819,6 @@ def train_detail(
             "rt_arrival_times": rt_arrival_times,
             "train_last_seen_stop_id": train_last_stop_id,
             "train_detail_view": detail_view,
-            "route_geojson": route_geojson,
-            "route_stops_geojson": route_stops_geojson,
             "position_api": (
                 f"/api/trains/{nucleus}/{identifier}/position?train_id={train_id}"
                 if train_id and vm.get("kind") == "live"
@@ -883,85 +870,13 @@ def train_map(
         raise HTTPException(404, "Train position unavailable")
     train_id = getattr(train_obj, "train_id", "")
 
-    route_geojson = None
-    route_stops_geojson = None
+    route_id, direction_id = _route_ref_from_vm(vm, train_obj)
+    geometry = get_route_geometry()
     route_debug = {
-        "route_id": None,
-        "direction_id": None,
-        "coords": 0,
+        "route_id": route_id,
+        "direction_id": direction_id,
+        "release": geometry.release(),
     }
-    try:
-        route_obj = vm.get("route")
-        unified = vm.get("unified") or {}
-        route_id = (
-            getattr(route_obj, "route_id", None)
-            or (unified.get("route_id") if isinstance(unified, dict) else None)
-            or getattr(train_obj, "route_id", None)
-        )
-        direction_id = (
-            getattr(route_obj, "direction_id", None)
-            or (unified.get("direction_id") if isinstance(unified, dict) else None)
-            or getattr(train_obj, "direction_id", None)
-        )
-        poly = None
-        if route_id:
-            poly = get_shapes_repo().polyline_for_route(route_id, direction_id)
-        if poly:
-            coords = [
-                [float(p.lon), float(p.lat)]
-                for p in poly
-                if p.lat is not None and p.lon is not None
-            ]
-            if len(coords) > 500:
-                step = max(1, len(coords) // 500)
-                coords = coords[::step]
-            route_geojson = {"type": "LineString", "coordinates": coords}
-            route_debug.update(
-                {"route_id": route_id, "direction_id": direction_id, "coords": len(coords)}
-            )
-        else:
-            route_debug.update({"route_id": route_id, "direction_id": direction_id, "coords": 0})
-
-        # Stops as point collection
-        stops_src = (vm.get("trip") or {}).get("stops") or []
-        if not stops_src and route_obj and getattr(route_obj, "stations", None):
-            stops_src = [
-                {
-                    "stop_id": st.stop_id,
-                    "stop_name": st.stop_name,
-                    "lat": getattr(st, "lat", None),
-                    "lon": getattr(st, "lon", None),
-                    "seq": getattr(st, "seq", None),
-                }
-                for st in getattr(route_obj, "stations", [])
-            ]
-        if stops_src:
-            features = []
-            for st in stops_src:
-                try:
-                    lat_s = float(st.get("lat"))
-                    lon_s = float(st.get("lon"))
-                except Exception:
-                    continue
-                if lat_s is None or lon_s is None:
-                    continue
-                features.append(
-                    {
-                        "type": "Feature",
-                        "geometry": {"type": "Point", "coordinates": [lon_s, lat_s]},
-                        "properties": {
-                            "stop_id": st.get("stop_id"),
-                            "name": st.get("stop_name") or st.get("name"),
-                            "seq": st.get("seq"),
-                        },
-                    }
-                )
-            if features:
-                route_stops_geojson = {"type": "FeatureCollection", "features": features}
-    except Exception:
-        route_geojson = None
-        route_stops_geojson = None
-        route_debug = {"route_id": None, "direction_id": None, "coords": 0}
 
     return render(
         request,
@@ -972,8 +887,7 @@ def train_map(
             "train": train_obj,
             "train_service": vm.get("unified"),
             "route": vm.get("route"),
-            "route_geojson": route_geojson,
-            "route_stops_geojson": route_stops_geojson,
+            "geometry_api": geometry.url(route_id, direction_id) if route_id else None,
             "route_debug": route_debug,
             "last_snapshot": cache.last_snapshot_iso(),
             "position_api": f"/api/trains/{nucleus}/{identifier}/position?train_id={train_id}",
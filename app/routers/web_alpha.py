@@ -13,14 +13,16 @@ from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 
 from app.domain.models import ScheduledTrain
+from app.routers.web import _route_ref_from_vm
 from app.services.eta_projector import _build_alpha_stop_rows_for_train_detail
 from app.services.lines_index import get_index as get_lines_index
 from app.services.live_trains_cache import get_live_trains_cache
+from app.services.page_cache import get_page_cache
 from app.services.platform_habits import get_service as get_platform_habits
+from app.services.route_geometry import get_route_geometry
 from app.services.route_trains_index import build_route_trains_index as build_trains_index
 from app.services.routes_repo import get_repo as get_routes_repo
 from app.services.scheduled_trains_repo import get_repo as get_scheduled_repo
-from app.services.shapes_repo import get_repo as get_shapes_repo
 from app.services.stations_repo import get_repo as get_stations_repo
 from app.services.stops_repo import get_repo as get_stops_repo
 from app.services.train_services_index import (
@@ -1171,82 +1173,13 @@ def train_map(
         raise HTTPException(404, "Train position unavailable")
     train_id = getattr(train_obj, "train_id", "")
 
-    route_geojson = None
-    route_stops_geojson = None
+    route_id, direction_id = _route_ref_from_vm(vm, train_obj)
+    geometry = get_route_geometry()
     route_debug = {
-        "route_id": None,
-        "direction_id": None,
-        "coords": 0,
+        "route_id": route_id,
+        "direction_id": direction_id,
+        "release": geometry.release(),
     }
-    try:
-        route_obj = vm.get("route")
-        unified = vm.get("unified") or {}
-        route_id = (
-            getattr(route_obj, "route_id", None)
-            or (unified.get("route_id") if isinstance(unified, dict) else None)
-            or getattr(train_obj, "route_id", None)
-        )
-        direction_id = (
-            getattr(route_obj, "direction_id", None)
-            or (unified.get("direction_id") if isinstance(unified, dict) else None)
-            or getattr(train_obj, "direction_id", None)
-        )
-        poly = None
-        if route_id:
-            poly = get_shapes_repo().polyline_for_route(route_id, direction_id)
-        if poly:
-            coords = [
-                [float(p.lon), float(p.lat)]
-                for p in poly
-                if p.lat is not None and p.lon is not None
-            ]
-            if len(coords) > 500:
-                step = max(1, len(coords) // 500)
-                coords = coords[::step]
-            route_geojson = {"type": "LineString", "coordinates": coords}
-            route_debug.update(
-                {"route_id": route_id, "direction_id": direction_id, "coords": len(coords)}
-            )
-        else:
-            route_debug.update({"route_id": route_id, "direction_id": direction_id, "coords": 0})
-
-        stops_src = (vm.get("trip") or {}).get("stops") or []
-        if not stops_src and route_obj and getattr(route_obj, "stations", None):
-            stops_src = [
-                {
-                    "stop_id": st.stop_id,
-                    "stop_name": st.stop_name,
-                    "lat": getattr(st, "lat", None),
-                    "lon": getattr(st, "lon", None),
-                    "seq": getattr(st, "seq", None),
-                }
-                for st in getattr(route_obj, "stations", [])
-            ]
-        if stops_src:
-            features = []
-            for st in stops_src:
-                try:
-                    lat_s = float(st.get("lat"))
-                    lon_s = float(st.get("lon"))
-                except Exception:
-                    continue
-                features.append(
-                    {
-                        "type": "Feature",
-                        "geometry": {"type": "Point", "coordinates": [lon_s, lat_s]},
-                        "properties": {
-                            "stop_id": st.get("stop_id"),
-                            "name": st.get("stop_name") or st.get("name"),
-                            "seq": st.get("seq"),
-                        },
-                    }
-                )
-            if features:
-                route_stops_geojson = {"type": "FeatureCollection", "features": features}
-    except Exception:
-        route_geojson = None
-        route_stops_geojson = None
-        route_debug = {"route_id": None, "direction_id": None, "coords": 0}
 
     return templates.TemplateResponse(
         "train_map.html",
@@ -1256,8 +1189,7 @@ def train_map(
             "train": train_obj,
             "train_service": vm.get("unified"),
             "route": vm.get("route"),
-            "route_geojson": route_geojson,
-            "route_stops_geojson": route_stops_geojson,
+            "geometry_api": geometry.url(route_id, direction_id) if route_id else None,
             "route_debug": route_debug,
             "last_snapshot": cache.last_snapshot_iso(),
             "position_api": f"/api/trains/{nucleus}/{identifier}/position?train_id={train_id}",
@@ -1422,6 +1354,12 @@ def train_timetables_all(
     srepo = get_scheduled_repo()
 
     yyyymmdd = int(date) if date else _today_yyyymmdd(tz)
+    # Timetables only change with the GTFS release (and the day when no date is given)
+    page_cache = get_page_cache()
+    cached = page_cache.lookup(request, yyyymmdd)
+    if cached is not None:
+        return cached
+
     items = srepo.list_for_date(yyyymmdd)
 
     rows = []
@@ -1462,20 +1400,24 @@ def train_timetables_all(
     end = start + page_size
     page_rows = rows[start:end]
 
-    return templates.TemplateResponse(
-        "train_timetables.html",
-        {
-            "request": request,
-            "rows": page_rows,
-            "repo": rrepo,
-            "nucleus": None,
-            "route": None,
-            "yyyymmdd": yyyymmdd,
-            "page": page,
-            "page_size": page_size,
-            "total": total,
-            "title": "Programados — Todos",
-        },
+    return page_cache.store(
+        request,
+        templates.TemplateResponse(
+            "train_timetables.html",
+            {
+                "request": request,
+                "rows": page_rows,
+                "repo": rrepo,
+                "nucleus": None,
+                "route": None,
+                "yyyymmdd": yyyymmdd,
+                "page": page,
+                "page_size": page_size,
+                "total": total,
+                "title": "Programados — Todos",
+            },
+        ),
+        yyyymmdd,
     )
 
 
@@ -1497,6 +1439,12 @@ def train_timetables_by_nucleus(
         raise HTTPException(404, "That nucleus doesn't exist.")
 
     yyyymmdd = int(date) if date else _today_yyyymmdd(tz)
+    # Timetables only change with the GTFS release (and the day when no date is given)
+    page_cache = get_page_cache()
+    cached = page_cache.lookup(request, yyyymmdd)
+    if cached is not None:
+        return cached
+
     items = srepo.list_for_date(yyyymmdd)
 
     rows = []
@@ -1539,20 +1487,24 @@ def train_timetables_by_nucleus(
     end = start + page_size
     page_rows = rows[start:end]
 
-    return templates.TemplateResponse(
-        "train_timetables.html",
-        {
-            "request": request,
-            "rows": page_rows,
-            "repo": rrepo,
-            "nucleus": mk_nucleus(nucleus),
-            "route": None,
-            "yyyymmdd": yyyymmdd,
-            "page": page,
-            "page_size": page_size,
-            "total": total,
-            "title": f"Programados — Núcleo {nucleus.upper()}",
-        },
+    return page_cache.store(
+        request,
+        templates.TemplateResponse(
+            "train_timetables.html",
+            {
+                "request": request,
+                "rows": page_rows,
+                "repo": rrepo,
+                "nucleus": mk_nucleus(nucleus),
+                "route": None,
+                "yyyymmdd": yyyymmdd,
+                "page": page,
+                "page_size": page_size,
+                "total": total,
+                "title": f"Programados — Núcleo {nucleus.upper()}",
+            },
+        ),
+        yyyymmdd,
     )
 
 
@@ -1572,6 +1524,11 @@ def train_timetables_by_route(
 
     nucleus = (nucleus or "").strip().lower()
     yyyymmdd = int(date) if date else _today_yyyymmdd(tz)
+    # Timetables only change with the GTFS release (and the day when no date is given)
+    page_cache = get_page_cache()
+    cached = page_cache.lookup(request, yyyymmdd)
+    if cached is not None:
+        return cached
 
     lv_any = (
         rrepo.get_by_route_and_dir(route_id, "")
@@ -1629,19 +1586,23 @@ def train_timetables_by_route(
     end = start + page_size
     page_rows = rows[start:end]
 
-    return templates.TemplateResponse(
-        "train_timetables.html",
-        {
-            "request": request,
-            "rows": page_rows,
-            "repo": rrepo,
-            "nucleus": mk_nucleus(nucleus),
-            "route": lv_any,
-            "yyyymmdd": yyyymmdd,
-            "page": page,
-            "page_size": page_size,
-            "total": total,
-            "title": f"Programados — {route_id} "
-            f"({'dir ' + did_filter if did_filter else 'ambas dirs'})",
-        },
+    return page_cache.store(
+        request,
+        templates.TemplateResponse(
+            "train_timetables.html",
+            {
+                "request": request,
+                "rows": page_rows,
+                "repo": rrepo,
+                "nucleus": mk_nucleus(nucleus),
+                "route": lv_any,
+                "yyyymmdd": yyyymmdd,
+                "page": page,
+                "page_size": page_size,
+                "total": total,
+                "title": f"Programados — {route_id} "
+                f"({'dir ' + did_filter if did_filter else 'ambas dirs'})",
+            },
+        ),
+        yyyymmdd,
     )
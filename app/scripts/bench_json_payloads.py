@@ -0,0 +1,168 @@
+# app/scripts/bench_json_payloads.py
+"""
+Micro-benchmark: encoding and compressing the large live API payloads.
+
+    python -m app.scripts.bench_json_payloads [--stops 30] [--services 30] [--repeat 200]
+
+Builds synthetic /api/trains/.../position and /api/stops/.../services payloads
+shaped like the real ones and compares jsonable_encoder + JSONResponse (the
+previous path) against FastJSONResponse, plus raw/gzip/brotli body sizes as
+sent by CompressionMiddleware.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import json
+import random
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.core.compression import brotli
+from app.core.fast_json import FastJSONResponse, orjson
+
+
+def _stop(i: int, rnd: random.Random) -> dict:
+    hhmm = f"{6 + i // 6:02d}:{(i * 7) % 60:02d}"
+    return {
+        "stop_id": f"{17000 + i}",
+        "station_id": f"{17000 + i}",
+        "name": f"Estación de prueba {i} - Intercambiador",
+        "status_class": rnd.choice(["passed", "current", "upcoming"]),
+        "station_position": rnd.choice(["start", "middle", "end"]),
+        "is_next_stop": False,
+        "is_current_stop": False,
+        "normalized_status": rnd.choice(["PASSED", "CURRENT", "UPCOMING"]),
+        "times": {
+            "rt": {
+                "hhmm": hhmm,
+                "epoch": 1_760_000_000 + i * 180,
+                "delay_min": rnd.randint(0, 6),
+                "delay_s": rnd.randint(0, 360),
+            },
+            "show_rt": True,
+            "scheduled": hhmm,
+            "show_scheduled": rnd.random() < 0.3,
+            "delay_value": rnd.randint(0, 6),
+        },
+        "platform": {
+            "value": str(rnd.randint(1, 8)),
+            "source": rnd.choice(["live", "habitual", None]),
+            "confidence": round(rnd.random(), 3),
+        },
+    }
+
+
+def _position_payload(n_stops: int, rnd: random.Random) -> dict:
+    return {
+        "train": {
+            "id": "23456",
+            "vehicle_id": "C1-23456",
+            "route_id": "10T0001C1",
+            "direction_id": "0",
+            "kind": "live",
+            "seen": {"iso": "2025-10-09T08:15:03+02:00", "age_s": 12},
+            "is_ghost_train": False,
+        },
+        "position": {
+            "lat": 40.4168 + rnd.random() / 10,
+            "lon": -3.7038 + rnd.random() / 10,
+            "heading": 182.0,
+            "ts_unix": 1_760_000_000,
+            "available": True,
+        },
+        "segment": {
+            "from_stop": {"id": "17001", "name": "Atocha"},
+            "to_stop": {"id": "17002", "name": "Recoletos"},
+            "dep_epoch": 1_760_000_000,
+            "arr_epoch": 1_760_000_180,
+            "progress_pct": 42.5,
+        },
+        "stops": {"count": n_stops, "items": [_stop(i, rnd) for i in range(n_stops)]},
+    }
+
+
+def _services_payload(n_services: int, rnd: random.Random) -> dict:
+    services = []
+    for i in range(n_services):
+        services.append(
+            {
+                "status": rnd.choice(["scheduled", "live"]),
+                "eta_seconds": i * 240,
+                "epoch": 1_760_000_000 + i * 240,
+                "hhmm": f"{8 + i // 15:02d}:{(i * 4) % 60:02d}",
+                "delay_seconds": rnd.randint(0, 300),
+                "confidence": rnd.choice(["high", "medium", "low"]),
+                "source": "tu",
+                "trip_id": f"1001{i:04d}C1",
+                "service_instance_id": f"1001{i:04d}C1:20251009",
+                "route_id": "10T0001C1",
+                "direction_id": "0",
+                "vehicle_id": f"C1-{23000 + i}",
+                "train_id": str(23000 + i),
+                "row": {"stop_sequence": i + 1, "arrival_time": "08:00:00"},
+                "platform_info": {"value": str(rnd.randint(1, 8)), "observed": True},
+                "train": {"lat": 40.4, "lon": -3.7, "current_stop_id": "17001"},
+                "train_seen": {"iso": "2025-10-09T08:15:03+02:00", "age_s": 8},
+                "current_stop_id": "17001",
+                "current_stop_name": "Atocha",
+                "next_stop_id": "17002",
+                "next_stop_name": "Recoletos",
+                "next_stop_progress_pct": 37.0,
+            }
+        )
+    return {
+        "stop": {"stop_id": "17000", "name": "Madrid - Atocha Cercanías"},
+        "route": {"route_id": "10T0001C1", "route_short_name": "C1", "direction_id": "0"},
+        "variants_considered": [{"route_id": "10T0002C1", "direction_id": "0"}],
+        "services": services,
+    }
+
+
+def _best(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(3):
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        best = min(best, time.perf_counter() - t0)
+    return best / repeat
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--stops", type=int, default=30)
+    ap.add_argument("--services", type=int, default=30)
+    ap.add_argument("--repeat", type=int, default=200)
+    args = ap.parse_args()
+
+    rnd = random.Random(7)
+    payloads = {
+        "position": _position_payload(args.stops, rnd),
+        "services": _services_payload(args.services, rnd),
+    }
+    print(f"orjson: {'yes' if orjson is not None else 'no'}  brotli: {'yes' if brotli else 'no'}")
+    for name, payload in payloads.items():
+        old_body = JSONResponse(jsonable_encoder(payload)).body
+        new_body = FastJSONResponse(payload).body
+        same = json.loads(new_body) == json.loads(old_body)
+        t_old = _best(lambda p=payload: JSONResponse(jsonable_encoder(p)), args.repeat)
+        t_new = _best(lambda p=payload: FastJSONResponse(p), args.repeat)
+        gz = gzip.compress(new_body, compresslevel=6, mtime=0)
+        t_gz = _best(lambda b=new_body: gzip.compress(b, compresslevel=6), args.repeat)
+        print(f"\n{name}: equivalent={same}")
+        print(f"  jsonable_encoder + json  {t_old * 1e6:9.1f} us")
+        print(f"  FastJSONResponse         {t_new * 1e6:9.1f} us  ({t_old / t_new:.1f}x)")
+        print(f"  body raw   {len(new_body):7d} B")
+        print(f"  body gzip  {len(gz):7d} B  ({len(gz) / len(new_body):.0%}, {t_gz * 1e6:.0f} us)")
+        if brotli is not None:
+            br = brotli.compress(new_body, quality=4)
+            print(f"  body br    {len(br):7d} B  ({len(br) / len(new_body):.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
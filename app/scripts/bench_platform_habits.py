@@ -0,0 +1,130 @@
+# app/scripts/bench_platform_habits.py
+"""
+Micro-benchmark: PlatformHabits predictions over a synthetic store.
+
+    python -m app.scripts.bench_platform_habits [--keys 10000] [--queries 2000]
+
+Compares the running decayed weights against recomputing 2^(-age/half_life)
+over every stored timestamp (the previous _aggregate), on a stop-board-like
+workload: one habitual_for per (route, stop) row.
+"""
+
+from __future__ import annotations
+
+import argparse
+import math
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from app.services.platform_habits import MAX_TS_PER_PLATFORM, PlatformHabits
+
+
+def _legacy_blacklisted(key, bl: list[tuple[str, str, str]]) -> bool:
+    nuc, route, stop = key
+    for bnuc, bstop, broute in bl:
+        if bnuc and bnuc != nuc:
+            continue
+        if bstop and bstop != stop:
+            continue
+        if broute and broute not in ("*", route):
+            continue
+        return True
+    return False
+
+
+def _legacy_aggregate(svc: PlatformHabits, keyset: set, now: float):
+    res: dict[str, tuple[float, float]] = {}
+    for key in keyset:
+        for plat, ts_list in svc.store.get(key, {}).items():
+            if _legacy_blacklisted(key, svc.blacklist):
+                continue
+            w_sum = 0.0
+            last_seen = 0.0
+            for ts in ts_list:
+                age_days = max(0.0, (now - float(ts)) / 86400.0)
+                w_sum += math.pow(2.0, -age_days / svc.half_life_days)
+                last_seen = max(last_seen, float(ts))
+            if w_sum > 0.0:
+                cur_w, cur_last = res.get(plat, (0.0, 0.0))
+                res[plat] = (cur_w + w_sum, max(cur_last, last_seen))
+    return res
+
+
+def _build(n_keys: int, tmp: Path, seed: int = 7) -> PlatformHabits:
+    rnd = random.Random(seed)
+    blacklist = tmp / "blacklist.csv"
+    blacklist.write_text(
+        "nucleus,stop_id,route_id\n"
+        + "".join(f"bench,S{i},*\n" for i in range(0, 400, 7))
+        + "".join(f",S{i},R{i % 40}\n" for i in range(1, 400, 11)),
+        encoding="utf-8",
+    )
+    svc = PlatformHabits(
+        json_path=tmp / "habits.json", csv_path=tmp / "habits.csv", blacklist_csv=blacklist
+    )
+    svc._canonical_nucleus_for_route = lambda rid: "bench"  # no GTFS needed
+    svc._append_log = lambda *a: None
+    now = time.time()
+    n_stops = max(1, n_keys // 25)
+    keys = {(f"R{rnd.randrange(40)}", f"S{rnd.randrange(n_stops)}") for _ in range(n_keys * 2)}
+    for rid, sid in list(keys)[:n_keys]:
+        for plat in rnd.sample(["1", "2", "3", "4"], rnd.randint(1, 3)):
+            ts = now - 200 * 86400
+            for _ in range(rnd.randint(20, MAX_TS_PER_PLATFORM + 20)):
+                ts += rnd.uniform(60, 3 * 86400)
+                svc.observe(nucleus="bench", route_id=rid, stop_id=sid, platform=plat, epoch=ts)
+    return svc
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--keys", type=int, default=10_000)
+    ap.add_argument("--queries", type=int, default=2_000)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        t0 = time.perf_counter()
+        svc = _build(args.keys, Path(d))
+        t_build = time.perf_counter() - t0
+        n_ts = sum(len(v) for pm in svc.store.values() for v in pm.values())
+
+        rnd = random.Random(1)
+        keys = list(svc.store)
+        queries = [rnd.choice(keys) for _ in range(args.queries)]
+        now = time.time()
+
+        mismatches = 0
+        for key in queries[:200]:
+            a = svc._aggregate({key}, now)
+            b = _legacy_aggregate(svc, {key}, now)
+            if a.keys() != b.keys() or any(
+                not math.isclose(a[p][0], b[p][0], rel_tol=1e-9) or a[p][1] != b[p][1] for p in a
+            ):
+                mismatches += 1
+
+        def board(aggregate):
+            for nuc, rid, sid in queries:
+                for key_set in svc._candidate_key_sets(nuc, rid, sid):
+                    if aggregate(key_set, now):
+                        break
+
+        t0 = time.perf_counter()
+        board(lambda ks, n: _legacy_aggregate(svc, ks, n))
+        t_legacy = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        board(svc._aggregate)
+        t_new = time.perf_counter() - t0
+
+    print(f"keys: {len(keys)}  timestamps: {n_ts}  blacklist rules: {len(svc.blacklist)}")
+    print(f"store built (observe x{n_ts}) in {t_build:.2f}s")
+    print(f"mismatches vs recomputation: {mismatches}/200")
+    per = 1e6 / len(queries)
+    print(f"recompute per query  {t_legacy * per:9.1f} us")
+    print(f"running weights      {t_new * per:9.1f} us  ({t_legacy / t_new:.1f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
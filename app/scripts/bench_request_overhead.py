@@ -0,0 +1,159 @@
+# app/scripts/bench_request_overhead.py
+"""
+Micro-benchmark: fixed per-request cost of the middleware stack.
+
+    python -m app.scripts.bench_request_overhead [--requests 2000]
+
+Drives ASGI apps in-process (no sockets) with a page-like request that
+resolves the nucleus cookie and with a small static file. Compares the
+previous stack (BaseHTTPMiddleware activity hop, nucleus slugs rebuilt from
+list_nuclei() per call) against the current one (pure-ASGI ActivityMiddleware
+that skips /static, release-cached frozen slug set), with the ETag and
+compression middlewares in both, plus a bare app as the floor and the
+current stack wrapped in MetricsMiddleware (per-route latency histogram).
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
+from fastapi.staticfiles import StaticFiles
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.core.compression import CompressionMiddleware
+from app.core.metrics import MetricsMiddleware
+from app.core.snapshot_etag import SnapshotETagMiddleware
+from app.core.user_prefs import COOKIE_NAME, get_current_nucleus
+from app.main import ActivityMiddleware, _app_state
+from app.services.routes_repo import get_repo as get_routes_repo
+
+STATIC_PATH = "/static/img/icon-cercanias.svg"
+
+
+def _legacy_current_nucleus(request: Request) -> str | None:
+    def sanitize(slug: str | None) -> str | None:
+        if not slug:
+            return None
+        nuclei = get_routes_repo().list_nuclei() or []
+        slugs = {
+            (n.get("slug") or "").strip().lower() for n in nuclei if (n.get("slug") or "").strip()
+        }
+        s = slug.strip().lower()
+        return s if s in slugs else None
+
+    return sanitize(request.cookies.get(COOKIE_NAME)) or sanitize(
+        request.headers.get("X-User-Nucleus")
+    )
+
+
+class _LegacyActivityMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        _app_state.last_activity_ts = time.time()
+        return await call_next(request)
+
+
+def _build(stack: str) -> FastAPI:
+    app = FastAPI()
+    resolve = _legacy_current_nucleus if stack == "legacy" else get_current_nucleus
+
+    @app.get("/page")
+    def page(request: Request):
+        return PlainTextResponse(resolve(request) or "-")
+
+    app.mount("/static", StaticFiles(directory="app/static"), name="static")
+    if stack != "bare":
+        app.add_middleware(SnapshotETagMiddleware)
+        app.add_middleware(_LegacyActivityMiddleware if stack == "legacy" else ActivityMiddleware)
+        app.add_middleware(CompressionMiddleware)
+    if stack == "metrics":
+        app.add_middleware(MetricsMiddleware)
+    return app
+
+
+async def _drive(app, path: str, n: int) -> float:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"host", b"bench"),
+            (b"accept-encoding", b"gzip, br"),
+            (b"cookie", f"{COOKIE_NAME}=madrid".encode()),
+        ],
+        "client": ("127.0.0.1", 1),
+        "server": ("bench", 80),
+    }
+    status = []
+    idle = asyncio.Event()  # never set: the client stays connected
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    async def request():
+        sent = False
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await idle.wait()
+
+        await app(dict(scope), receive, send)
+
+    await request()  # builds the middleware stack
+    if status[-1] != 200:
+        raise SystemExit(f"{path}: HTTP {status[-1]}")
+    t0 = time.perf_counter()
+    for _ in range(n):
+        await request()
+    return (time.perf_counter() - t0) / n
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=2_000)
+    args = ap.parse_args()
+
+    repo = get_routes_repo()
+    print(f"nuclei: {len(repo.nucleus_slugs())}")
+
+    async def run():
+        results = {}
+        for stack in ("bare", "legacy", "current", "metrics"):
+            app = _build(stack)
+            results[stack] = [
+                min([await _drive(app, path, args.requests) for _ in range(3)])
+                for path in ("/page", STATIC_PATH)
+            ]
+        return results
+
+    results = asyncio.run(run())
+    print(f"{'stack':<8} {'page':>10} {'static':>10}   (us/request)")
+    for stack, (t_page, t_static) in results.items():
+        print(f"{stack:<8} {t_page * 1e6:10.1f} {t_static * 1e6:10.1f}")
+    legacy, current, metered = results["legacy"], results["current"], results["metrics"]
+    print(
+        f"current vs legacy: page {legacy[0] / current[0]:.2f}x, "
+        f"static {legacy[1] / current[1]:.2f}x"
+    )
+    print(
+        f"metrics overhead: page {(metered[0] - current[0]) * 1e6:+.1f} us, "
+        f"static {(metered[1] - current[1]) * 1e6:+.1f} us"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
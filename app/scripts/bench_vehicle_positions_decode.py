@@ -0,0 +1,93 @@
+# app/scripts/bench_vehicle_positions_decode.py
+"""
+Micro-benchmark: per-entity parse_train_gtfs_pb vs the columnar decoder.
+
+    python -m app.scripts.bench_vehicle_positions_decode [feed.pb] [--repeat N] [--scale K]
+
+``--scale`` replicates the entities K times to approximate a national feed.
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+
+from google.protobuf.internal import api_implementation
+from google.transit import gtfs_realtime_pb2
+
+from app.domain.live_models import (
+    decode_vehicle_positions,
+    parse_train_gtfs_pb,
+    positions_from_columns,
+)
+
+DEFAULT_FEED = Path("app/static/debug/vehicle_positions_example.pb")
+
+
+def _load(path: Path, scale: int) -> bytes:
+    raw = path.read_bytes()
+    if scale <= 1:
+        return raw
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.ParseFromString(raw)
+    ents = list(feed.entity)
+    for _ in range(scale - 1):
+        feed.entity.extend(ents)
+    return feed.SerializeToString()
+
+
+def _best(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("feed", nargs="?", default=str(DEFAULT_FEED))
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("--scale", type=int, default=1)
+    args = ap.parse_args()
+
+    raw = _load(Path(args.feed), args.scale)
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.ParseFromString(raw)
+    header_ts = int(feed.header.timestamp or 0)
+
+    def legacy():
+        return [
+            tp
+            for ent in feed.entity
+            if (tp := parse_train_gtfs_pb(ent, default_ts=header_ts)) is not None
+        ]
+
+    def columnar():
+        return positions_from_columns(decode_vehicle_positions(feed))
+
+    a, b = legacy(), columnar()
+    assert [t.model_dump() for t in a] == [t.model_dump() for t in b], "decoders disagree"
+
+    t_parse = _best(lambda: gtfs_realtime_pb2.FeedMessage().ParseFromString(raw), args.repeat)
+    t_legacy = _best(legacy, args.repeat)
+    t_decode = _best(lambda: decode_vehicle_positions(feed), args.repeat)
+    t_columnar = _best(columnar, args.repeat)
+
+    n = len(feed.entity)
+    print(f"protobuf runtime: {api_implementation.Type()}")
+    print(f"entities: {n}  trains: {len(b)}  bytes: {len(raw)}")
+    print(f"ParseFromString          {t_parse * 1e3:8.2f} ms")
+    print(f"parse_train_gtfs_pb      {t_legacy * 1e3:8.2f} ms  ({t_legacy / n * 1e6:.2f} us/ent)")
+    print(f"decode_vehicle_positions {t_decode * 1e3:8.2f} ms  ({t_decode / n * 1e6:.2f} us/ent)")
+    print(
+        f"decode + TrainPosition   {t_columnar * 1e3:8.2f} ms  "
+        f"({t_legacy / t_columnar:.1f}x vs per-entity)"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -82,6 +82,12 @@ def _load_state() -> dict:
     return {}
 
 
+def active_release_token() -> str | None:
+    """Identifier of the active GTFS release (None before the first download)."""
+    state = _load_state()
+    return state.get("active_release") or state.get("sha256")
+
+
 def _save_state(state: dict) -> None:
     STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
     STATE_FILE.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
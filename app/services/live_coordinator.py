@@ -0,0 +1,205 @@
+# app/services/live_coordinator.py
+from __future__ import annotations
+
+import contextlib
+import logging
+import os
+import pickle
+import stat
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+from app.config import settings
+
+try:  # POSIX only; without it every worker polls on its own
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore[assignment]
+
+log = logging.getLogger("live_coordinator")
+
+LOCK_FILE = "poller.lock"
+ACTIVITY_FILE = "activity"
+SNAPSHOT_SUFFIX = ".snapshot"
+
+# Snapshot kinds published by the leader
+KIND_LIVE = "live"
+KIND_TRIP_UPDATES = "trip_updates"
+
+
+def _default_shared_dir() -> Path:
+    # /dev/shm is a tmpfs: snapshots never touch the disk
+    base = Path("/dev/shm") if Path("/dev/shm").is_dir() else Path(tempfile.gettempdir())
+    uid = os.getuid() if hasattr(os, "getuid") else 0
+    return base / f"dondeestamitren-{uid}"
+
+
+def _ensure_private_dir(root: Path) -> None:
+    """
+    Create ``root`` as 0700 and refuse it unless it is a real directory owned
+    by us that nobody else can write to: followers unpickle whatever lies in
+    it, so a directory another local user could plant files in is code
+    execution in every worker.
+    """
+    root.mkdir(mode=0o700, parents=True, exist_ok=True)
+    st = os.lstat(root)
+    if not stat.S_ISDIR(st.st_mode):
+        raise PermissionError(f"{root} is not a directory")
+    if hasattr(os, "getuid") and st.st_uid != os.getuid():
+        raise PermissionError(f"{root} is owned by uid {st.st_uid}, not {os.getuid()}")
+    if st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(f"{root} is group/world-writable (mode {st.st_mode & 0o777:o})")
+
+
+class LiveCoordinator:
+    """
+    Single-poller coordination between uvicorn workers of the same host.
+
+    Workers race for an exclusive ``flock`` on ``poller.lock``; the holder is
+    the leader and is the only one polling Renfe. After each refresh it
+    publishes the parsed cache state as a pickled snapshot (atomic rename)
+    in a private shared directory, by default on ``/dev/shm``. Followers only
+    stat the snapshot files and load the ones that changed. If the leader dies
+    the kernel drops its lock and the next follower that tries takes over.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        _ensure_private_dir(self.root)
+        self._lock_fh = None
+        self._loaded_mtime_ns: dict[str, int] = {}
+        self._mutex = threading.Lock()
+        self._published: dict[str, int] = {}
+        self._loaded: dict[str, int] = {}
+        self._last_load_took_s: dict[str, float] = {}
+
+    # ---------------- Leadership ----------------
+    def is_leader(self) -> bool:
+        return self._lock_fh is not None
+
+    def try_lead(self) -> bool:
+        """Become the poller if nobody else is. Non-blocking, idempotent."""
+        if fcntl is None:
+            return True
+        with self._mutex:
+            if self._lock_fh is not None:
+                return True
+            fh = open(self.root / LOCK_FILE, "a+")  # noqa: SIM115 - held for process life
+            try:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                fh.close()
+                return False
+            fh.seek(0)
+            fh.truncate()
+            fh.write(str(os.getpid()))
+            fh.flush()
+            self._lock_fh = fh
+        log.info("live_coordinator leader pid=%s root=%s", os.getpid(), self.root)
+        return True
+
+    def release(self) -> None:
+        with self._mutex:
+            fh, self._lock_fh = self._lock_fh, None
+        if fh is not None:
+            with contextlib.suppress(Exception):
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+            fh.close()
+
+    # ---------------- Snapshots ----------------
+    def _snapshot_path(self, kind: str) -> Path:
+        return self.root / f"{kind}{SNAPSHOT_SUFFIX}"
+
+    def publish(self, kind: str, state: dict[str, Any]) -> None:
+        """Atomically replace the snapshot of ``kind`` (leader only)."""
+        payload = pickle.dumps(
+            {"pid": os.getpid(), "published_at": time.time(), "state": state},
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+        path = self._snapshot_path(kind)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.write_bytes(payload)
+        os.replace(tmp, path)
+        self._published[kind] = self._published.get(kind, 0) + 1
+
+    def load_if_newer(self, kind: str) -> dict[str, Any] | None:
+        """Return the published state of ``kind`` if it changed since the last load."""
+        path = self._snapshot_path(kind)
+        try:
+            mtime_ns = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+        if self._loaded_mtime_ns.get(kind) == mtime_ns:
+            return None
+        t0 = time.perf_counter()
+        try:
+            fd = os.open(path, os.O_RDONLY | getattr(os, "O_NOFOLLOW", 0))
+            with open(fd, "rb") as fh:
+                data = pickle.loads(fh.read())
+        except Exception as e:
+            log.warning("live_coordinator load %s failed: %r", kind, e)
+            return None
+        self._loaded_mtime_ns[kind] = mtime_ns
+        self._loaded[kind] = self._loaded.get(kind, 0) + 1
+        self._last_load_took_s[kind] = time.perf_counter() - t0
+        return data.get("state")
+
+    def sync_from_leader(self) -> None:
+        """Load any new trip updates / live snapshot into this worker's caches."""
+        # Trip updates first: importing the live snapshot notifies WS listeners
+        state = self.load_if_newer(KIND_TRIP_UPDATES)
+        if state is not None:
+            from app.services.trip_updates_cache import get_trip_updates_cache
+
+            get_trip_updates_cache().import_state(state)
+        state = self.load_if_newer(KIND_LIVE)
+        if state is not None:
+            from app.services.live_trains_cache import get_live_trains_cache
+
+            get_live_trains_cache().import_state(state)
+
+    # ---------------- Shared activity (for adaptive idle mode) ----------------
+    def report_activity(self, ts: float) -> None:
+        path = self.root / ACTIVITY_FILE
+        with contextlib.suppress(Exception):
+            path.touch(exist_ok=True)
+            os.utime(path, (ts, ts))
+
+    def shared_last_activity(self) -> float:
+        try:
+            return (self.root / ACTIVITY_FILE).stat().st_mtime
+        except OSError:
+            return 0.0
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "pid": os.getpid(),
+            "leader": self.is_leader(),
+            "root": str(self.root),
+            "published": dict(self._published),
+            "loaded": dict(self._loaded),
+            "last_load_took_s": {k: round(v, 4) for k, v in self._last_load_took_s.items()},
+        }
+
+
+_coordinator: LiveCoordinator | None = None
+_coordinator_refused = False
+
+
+def get_live_coordinator() -> LiveCoordinator | None:
+    """Coordinator when LIVE_SHARED_SNAPSHOTS is on, else None (single-process mode)."""
+    global _coordinator, _coordinator_refused
+    if not settings.LIVE_SHARED_SNAPSHOTS:
+        return None
+    if _coordinator is None and not _coordinator_refused:
+        root = Path(settings.LIVE_SHARED_DIR) if settings.LIVE_SHARED_DIR else None
+        try:
+            _coordinator = LiveCoordinator(root or _default_shared_dir())
+        except PermissionError as e:
+            # Every worker then polls on its own, as without LIVE_SHARED_SNAPSHOTS
+            log.error("live_coordinator disabled, unsafe shared dir: %s", e)
+            _coordinator_refused = True
+    return _coordinator
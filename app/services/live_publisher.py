@@ -0,0 +1,176 @@
+# app/services/live_publisher.py
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from app.config import settings
+from app.core.metrics import REFRESH_STAGE_SECONDS
+from app.services.live_trains_cache import METRICS_FEED, get_live_trains_cache
+from app.services.ws_manager import get_ws_manager
+
+log = logging.getLogger("live_publisher")
+
+
+def basic_train_payload(t) -> dict[str, Any]:
+    """Lightweight train payload used in nucleus list broadcasts."""
+    return {
+        "train_id": getattr(t, "train_id", None),
+        "label": getattr(t, "label", None),
+        "route_id": getattr(t, "route_id", None),
+        "route_short_name": getattr(t, "route_short_name", None),
+        "direction_id": getattr(t, "direction_id", None),
+        "stop_id": getattr(t, "stop_id", None),
+        "current_status": getattr(t, "current_status", None),
+        "lat": getattr(t, "lat", None),
+        "lon": getattr(t, "lon", None),
+        "timestamp": getattr(t, "timestamp", None),
+    }
+
+
+class LivePublisher:
+    """
+    Refresh -> publish pipeline for WebSocket subscribers.
+
+    The live cache refresh (scheduler thread) only signals a new snapshot
+    version; an asyncio consumer on the app loop builds nucleus and train
+    payloads concurrently, with the heavy per-train view models running in a
+    bounded executor. Snapshots that arrive while a publish is still running
+    are coalesced, so a large nucleus never delays the next poll.
+    """
+
+    def __init__(self, max_workers: int = 4, tz: str = "Europe/Madrid"):
+        self._tz = tz
+        self._max_workers = max(1, int(max_workers))
+        self._executor: ThreadPoolExecutor | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._pending_version: int | None = None
+        self._published_version: int | None = None
+        self._last_publish_took_s: float = 0.0
+        self._skipped: int = 0
+
+    # -------- Lifecycle --------
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        if self._task is not None:
+            return
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self._max_workers, thread_name_prefix="live-publish"
+        )
+        self._task = loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    # -------- Producer side (any thread) --------
+    def notify(self, version: int) -> None:
+        """Signal that a new live snapshot is available. Never blocks."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self._on_snapshot, version)
+
+    def _on_snapshot(self, version: int) -> None:
+        if self._pending_version is not None:
+            self._skipped += 1
+        self._pending_version = version
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    # -------- Consumer side (event loop) --------
+    async def _run(self) -> None:
+        assert self._wakeup is not None
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            version = self._pending_version
+            self._pending_version = None
+            if version is None:
+                continue
+            t0 = time.perf_counter()
+            try:
+                await self.publish()
+            except Exception as e:
+                log.debug("live publish error: %s", e)
+            self._published_version = version
+            self._last_publish_took_s = time.perf_counter() - t0
+            REFRESH_STAGE_SECONDS.observe(self._last_publish_took_s, METRICS_FEED, "broadcast")
+
+    async def publish(self) -> None:
+        manager = get_ws_manager()
+        nuclei = await manager.active_nuclei()
+        if nuclei:
+            await asyncio.gather(*(self._publish_nucleus(n) for n in nuclei))
+
+    async def _publish_nucleus(self, nucleus: str) -> None:
+        manager = get_ws_manager()
+        # An empty list still goes out: it turns into a delta removing every train
+        trains = get_live_trains_cache().get_by_nucleus(nucleus)
+        trains_data = [basic_train_payload(t) for t in trains]
+        train_subs = await manager.trains_for_nucleus(nucleus)
+        subscribed = [p for p in trains_data if p["train_id"] and str(p["train_id"]) in train_subs]
+
+        await asyncio.gather(
+            manager.publish_trains(nucleus, trains_data),
+            *(self._publish_train(nucleus, p) for p in subscribed),
+        )
+
+    async def _publish_train(self, nucleus: str, basic: dict[str, Any]) -> None:
+        from app.routers.trains_api import build_train_position_payload
+
+        manager = get_ws_manager()
+        tid = str(basic["train_id"])
+        payload: dict[str, Any] | None = None
+        try:
+            loop = asyncio.get_running_loop()
+            payload = await loop.run_in_executor(
+                self._executor, build_train_position_payload, nucleus, tid, self._tz
+            )
+        except Exception as e:
+            log.debug("Error building train detail for %s: %s", tid, e)
+        # Fallback to basic payload if train is not live or the build failed
+        await manager.broadcast_to_train(
+            nucleus,
+            tid,
+            {
+                "type": "train_update",
+                "nucleus": nucleus,
+                "train_id": tid,
+                "timestamp": int(time.time() * 1000),
+                "data": payload or basic,
+            },
+        )
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "workers": self._max_workers,
+            "published_version": self._published_version,
+            "pending_version": self._pending_version,
+            "skipped_snapshots": self._skipped,
+            "last_publish_took_s": round(self._last_publish_took_s, 3),
+        }
+
+
+_publisher: LivePublisher | None = None
+
+
+def get_live_publisher() -> LivePublisher:
+    global _publisher
+    if _publisher is None:
+        _publisher = LivePublisher(max_workers=settings.WS_PUBLISH_WORKERS)
+    return _publisher
@@ -6,13 +6,16 @@ import logging
 import re
 import time
 from collections import defaultdict, deque
+from collections.abc import Callable
 from dataclasses import dataclass
 from datetime import UTC, datetime
 
+from app.core.metrics import REFRESH_STAGE_SECONDS
 from app.domain.live_models import (
     TrainPosition,
+    decode_vehicle_positions,
     parse_train_gtfs_json,
-    parse_train_gtfs_pb,
+    positions_from_columns,
 )
 from app.services.common_fetch import fetch_with_retry
 from app.services.platform_habits import get_service as get_platform_habits
@@ -35,6 +38,9 @@ MISSING_TTL_SECONDS = 15 * 60
 
 log = logging.getLogger("live_trains")
 
+# Label for the refresh stage timings (see app.core.metrics)
+METRICS_FEED = "vehicle_positions"
+
 
 @dataclass
 class _TrainEntry:
@@ -75,6 +81,12 @@ class LiveTrainsCache:
         # Cache for route lookups by (short_name, stop_id)
         self._route_lookup_cache: dict[tuple[str, str], tuple[str, str, str] | None] = {}
 
+        # Snapshot version, bumped on every views rebuild (only done when the
+        # entries changed), and its listeners with the last version they saw
+        self._version: int = 0
+        self._listeners: list[Callable[[int], None]] = []
+        self._notified_version: int = 0
+
     # ---------------- Platform ----------------
     _PLATFORM_RE = re.compile(r"PLATF\.\(\s*([^)]+?)\s*\)", re.IGNORECASE)
 
@@ -328,12 +340,12 @@ class LiveTrainsCache:
 
         return metrics
 
-    def _enrich_route_and_direction_from_trip(self, tp: TrainPosition) -> None:
+    def _enrich_route_and_direction_from_trip(self, tp: TrainPosition, resolve=None) -> None:
         trip_id = (getattr(tp, "trip_id", "") or "").strip()
         if not trip_id:
             return
         with contextlib.suppress(Exception):
-            ctx = get_trip_updates_cache().get_resolved_ctx(trip_id)
+            ctx = (resolve or get_trip_updates_cache().get_resolved_ctx)(trip_id)
             if ctx:
                 if not getattr(tp, "route_id", None) and getattr(ctx, "route_id", None):
                     tp.route_id = ctx.route_id
@@ -365,7 +377,7 @@ class LiveTrainsCache:
             self._last_fetch_took_s = time.time() - t0
             return None, f"pb_exc: {e!r}"
 
-    def _parse_pb(self, feed) -> tuple[int, int, list[TrainPosition]]:
+    def _parse_pb(self, feed, resolve=None) -> tuple[int, int, list[TrainPosition]]:
         header_ts = int(getattr(getattr(feed, "header", None), "timestamp", 0) or 0)
         now_s = int(time.time())
         items: list[TrainPosition] = []
@@ -374,29 +386,20 @@ class LiveTrainsCache:
         lines_repo = get_lines_repo()
         self._ensure_stop_nucleus_index()
 
-        ents = getattr(feed, "entity", []) or []
+        t0 = time.perf_counter()
+        cols = decode_vehicle_positions(feed)
+        t_decode = time.perf_counter()
+        REFRESH_STAGE_SECONDS.observe(t_decode - t0, METRICS_FEED, "decode")
         p_used = p_final = p_tent = p_nomap = 0
 
-        for ent in ents:
-            tp = parse_train_gtfs_pb(ent, default_ts=header_ts)
-            if not tp:
-                continue
-            if not getattr(tp, "label", None):
-                try:
-                    lbl = getattr(
-                        getattr(getattr(ent, "vehicle", None), "vehicle", None), "label", None
-                    )
-                    if lbl:
-                        tp.label = str(lbl)
-                except Exception:
-                    pass
+        for tp in positions_from_columns(cols):
             rid = trips_repo.route_id_for_trip(tp.trip_id) or ""
             if rid:
                 tp.route_id = rid
                 tp.nucleus_slug = lines_repo.nucleus_for_route_id(rid)
             else:
                 self._fill_route_from_short_and_stop(tp)
-            self._enrich_route_and_direction_from_trip(tp)
+            self._enrich_route_and_direction_from_trip(tp, resolve)
             rid_eff = getattr(tp, "route_id", None) or rid
             tp.nucleus_slug = self._nucleus_for_stop(tp.stop_id) or (
                 lines_repo.nucleus_for_route_id(rid_eff) if rid_eff else None
@@ -410,11 +413,12 @@ class LiveTrainsCache:
 
             self._enrich_platform_from_parsed_train(tp)
             items.append(tp)
+        REFRESH_STAGE_SECONDS.observe(time.perf_counter() - t_decode, METRICS_FEED, "enrich")
 
         self._log(
             "parsed_pb",
             header_ts=header_ts,
-            entities=len(ents),
+            entities=len(cols),
             items=len(items),
             parity_used=p_used,
             parity_final=p_final,
@@ -440,7 +444,7 @@ class LiveTrainsCache:
             self._last_fetch_took_s = time.time() - t0
             return None, f"client_exc: {e!r}"
 
-    def _parse_json(self, raw: dict) -> tuple[int, int, list[TrainPosition]]:
+    def _parse_json(self, raw: dict, resolve=None) -> tuple[int, int, list[TrainPosition]]:
         hdr = raw.get("header") or {}
         try:
             header_ts = int(hdr.get("timestamp") or 0)
@@ -456,6 +460,8 @@ class LiveTrainsCache:
             lines_repo = get_lines_repo()
             self._ensure_stop_nucleus_index()
             p_used = p_final = p_tent = p_nomap = 0
+            # Entities are decoded and enriched one by one here: timed as "enrich"
+            t0 = time.perf_counter()
 
             for ent in ents:
                 tp = parse_train_gtfs_json(ent, default_ts=header_ts)
@@ -474,7 +480,7 @@ class LiveTrainsCache:
                     tp.nucleus_slug = lines_repo.nucleus_for_route_id(rid)
                 else:
                     self._fill_route_from_short_and_stop(tp)
-                self._enrich_route_and_direction_from_trip(tp)
+                self._enrich_route_and_direction_from_trip(tp, resolve)
                 rid_eff = getattr(tp, "route_id", None) or rid
                 tp.nucleus_slug = self._nucleus_for_stop(tp.stop_id) or (
                     lines_repo.nucleus_for_route_id(rid_eff) if rid_eff else None
@@ -488,6 +494,7 @@ class LiveTrainsCache:
 
                 self._enrich_platform_from_parsed_train(tp)
                 items.append(tp)
+            REFRESH_STAGE_SECONDS.observe(time.perf_counter() - t0, METRICS_FEED, "enrich")
 
             self._log(
                 "parsed_json",
@@ -549,6 +556,7 @@ class LiveTrainsCache:
         return len(to_del)
 
     def _rebuild_views(self) -> None:
+        t0 = time.perf_counter()
         items = [e.tp for e in self._entries.values()]
         self._items = items
         self._by_id = {tp.train_id: tp for tp in items}
@@ -599,33 +607,113 @@ class LiveTrainsCache:
         }
         self._by_number = dict(by_num)
         self._by_trip_id = by_trip_id
+        self._version += 1
+        REFRESH_STAGE_SECONDS.observe(time.perf_counter() - t0, METRICS_FEED, "rebuild_views")
+
+    def _notify_listeners(self) -> None:
+        if self._version == self._notified_version:
+            return
+        self._notified_version = self._version
+        for cb in list(self._listeners):
+            try:
+                cb(self._version)
+            except Exception:
+                log.debug("live_trains listener error", exc_info=True)
 
     # -------- Public API --------
+    def add_listener(self, cb: Callable[[int], None]) -> None:
+        """Register a callback invoked with the snapshot version after each refresh."""
+        if cb not in self._listeners:
+            self._listeners.append(cb)
+
+    def snapshot_version(self) -> int:
+        return self._version
+
+    # Fields shared between workers (see live_coordinator)
+    _SHARED_FIELDS = (
+        "_entries",
+        "_last_fetch_s",
+        "_last_snapshot_ts",
+        "_errors_streak",
+        "_last_error",
+        "_consecutive_empty",
+        "_last_source",
+        "_last_fetch_kind",
+        "_last_fetch_took_s",
+    )
+
+    def export_state(self) -> dict:
+        return {name: getattr(self, name) for name in self._SHARED_FIELDS}
+
+    def import_state(self, state: dict) -> None:
+        """Replace the cache content with a snapshot published by the poller worker."""
+        entries = state.get("_entries") or {}
+        for tid in set(self._entries) - set(entries):
+            cleanup_train_by_vehicle(tid)
+        for name in self._SHARED_FIELDS:
+            if name in state:
+                setattr(self, name, state[name])
+        self._rebuild_views()
+        self._log("import_state", active=len(self._items))
+        self._notify_listeners()
+
     def refresh(self) -> tuple[int, float]:
-        self._last_error = None
+        with REFRESH_STAGE_SECONDS.time(METRICS_FEED, "total"):
+            return self._refresh()
 
-        data, source, err = fetch_with_retry(
-            self._fetch_pb_once,
-            self._fetch_json_once,
-            attempts=1 + FAST_RETRY_ATTEMPTS,
-            delay=FAST_RETRY_DELAY,
-            primary_label="pb",
-            fallback_label="json",
-        )
+    # Staged refresh (fetch -> parse -> apply), driven by RealtimeIngest for the pair
+
+    def fetch(self):
+        self._last_error = None
+        with REFRESH_STAGE_SECONDS.time(METRICS_FEED, "fetch"):
+            return fetch_with_retry(
+                self._fetch_pb_once,
+                self._fetch_json_once,
+                attempts=1 + FAST_RETRY_ATTEMPTS,
+                delay=FAST_RETRY_DELAY,
+                primary_label="pb",
+                fallback_label="json",
+            )
 
-        if data is None or source is None:
+    def parse(self, data, source: str, resolve=None) -> tuple[int, int, list[TrainPosition]]:
+        """``resolve(trip_id) -> TripResolvedCtx`` overrides the trip updates lookup."""
+        if source == "pb":
+            return self._parse_pb(data, resolve)
+        return self._parse_json(data, resolve)
+
+    def _refresh(self) -> tuple[int, float]:
+        data, source, err = self.fetch()
+        parsed = self.parse(data, source) if data is not None and source is not None else None
+        return self.apply(source, err, parsed)
+
+    def apply(
+        self,
+        source: str | None,
+        err: str | None,
+        parsed: tuple[int, int, list[TrainPosition]] | None,
+    ) -> tuple[int, float]:
+        """Merge a parsed snapshot (or record the fetch error) and notify listeners."""
+        result = self._apply(source, err, parsed)
+        self._notify_listeners()
+        return result
+
+    def _apply(
+        self,
+        source: str | None,
+        err: str | None,
+        parsed: tuple[int, int, list[TrainPosition]] | None,
+    ) -> tuple[int, float]:
+        """Merge a parsed snapshot (or record the fetch error when ``parsed`` is None)."""
+        if parsed is None or source is None:
             self._errors_streak += 1
             self._last_error = err
             self._log("fetch_error", error=self._last_error, errors_streak=self._errors_streak)
             now_s = int(time.time())
-            self._sweep_expired(now_s)
-            self._rebuild_views()
+            if self._sweep_expired(now_s):
+                self._rebuild_views()
             return len(self._items), self._last_fetch_s
 
-        if source == "pb":
-            header_ts, now_s, items = self._parse_pb(data)
-        else:
-            header_ts, now_s, items = self._parse_json(data)
+        header_ts, now_s, items = parsed
         self._last_source = source
 
         # ---- Parsing and merge
@@ -637,7 +725,8 @@ class LiveTrainsCache:
         if not items:
             self._consecutive_empty += 1
             removed = self._sweep_expired(now_s)
-            self._rebuild_views()
+            if removed:
+                self._rebuild_views()
             self._log(
                 "refresh_empty_keep",
                 header_ts=header_ts,
@@ -648,8 +737,10 @@ class LiveTrainsCache:
             return len(self._items), self._last_fetch_s
 
         self._consecutive_empty = 0
+        t0 = time.perf_counter()
         updated, created = self._merge_snapshot(items, now_s, header_ts)
         removed = self._sweep_expired(now_s)
+        REFRESH_STAGE_SECONDS.observe(time.perf_counter() - t0, METRICS_FEED, "merge")
         self._rebuild_views()
 
         self._log(
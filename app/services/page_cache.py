@@ -0,0 +1,115 @@
+# app/services/page_cache.py
+from __future__ import annotations
+
+import gzip
+import logging
+from dataclasses import dataclass
+from typing import Any
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from app.core.compression import accepts_encoding
+from app.core.user_prefs import COOKIE_NAME
+from app.utils.bounded_cache import BoundedCache
+
+try:  # optional; without it only gzip variants are kept
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+log = logging.getLogger("page_cache")
+
+PAGE_CACHE_MAX = 512
+# Bodies below this are served as-is (compression overhead beats the savings)
+COMPRESS_MIN_BYTES = 1024
+
+
+@dataclass(frozen=True)
+class CachedPage:
+    body: bytes
+    media_type: str
+    gzip_body: bytes | None = None
+    br_body: bytes | None = None
+
+
+class PageCache:
+    """
+    Rendered HTML of pages that only depend on static GTFS data.
+
+    Keyed by the request (base URL, path, query, nucleus preference, referer,
+    which templates read) plus caller extras, and tagged with the GTFS release:
+    a release swap drops every page at once. gzip/brotli bodies are compressed
+    once at store time and picked per request from Accept-Encoding.
+    """
+
+    def __init__(self, maxsize: int = PAGE_CACHE_MAX):
+        self._pages = BoundedCache(maxsize)
+
+    def _key(self, request: Request, extra: tuple) -> tuple:
+        h = request.headers
+        return (
+            str(request.base_url),
+            request.url.path,
+            request.url.query,
+            request.cookies.get(COOKIE_NAME) or "",
+            h.get("x-user-nucleus") or "",
+            h.get("referer") or "",
+            extra,
+        )
+
+    def _retag(self) -> None:
+        from app.services.trips_repo import get_repo as get_trips_repo
+
+        if self._pages.retag(get_trips_repo().release_token):
+            log.info("page_cache: release changed, cache dropped")
+
+    def invalidate(self) -> None:
+        self._pages.clear()
+
+    def lookup(self, request: Request, *extra: Any) -> Response | None:
+        """Cached response for this request, or None (then build it and call store)."""
+        self._retag()
+        page = self._pages.get(self._key(request, extra))
+        return self._respond(request, page) if page is not None else None
+
+    def store(self, request: Request, response: Response, *extra: Any) -> Response:
+        """Cache a freshly rendered 200 response and return the negotiated variant."""
+        if response.status_code != 200 or not isinstance(response.body, bytes):
+            return response
+        body = response.body
+        gz = br = None
+        if len(body) >= COMPRESS_MIN_BYTES:
+            gz = gzip.compress(body, compresslevel=6, mtime=0)
+            if brotli is not None:
+                br = brotli.compress(body, quality=9)
+        page = CachedPage(
+            body=body, media_type=response.media_type or "text/html", gzip_body=gz, br_body=br
+        )
+        self._pages.put(self._key(request, extra), page)
+        return self._respond(request, page)
+
+    def _respond(self, request: Request, page: CachedPage) -> Response:
+        ae = request.headers.get("accept-encoding") or ""
+        headers = {"vary": "Accept-Encoding"}
+        body = page.body
+        if page.br_body is not None and accepts_encoding(ae, "br"):
+            body = page.br_body
+            headers["content-encoding"] = "br"
+        elif page.gzip_body is not None and accepts_encoding(ae, "gzip"):
+            body = page.gzip_body
+            headers["content-encoding"] = "gzip"
+        return Response(content=body, media_type=page.media_type, headers=headers)
+
+    def stats(self) -> dict[str, Any]:
+        return {**self._pages.stats(), "brotli": brotli is not None}
+
+
+_page_cache: PageCache | None = None
+
+
+def get_page_cache() -> PageCache:
+    global _page_cache
+    if _page_cache is None:
+        _page_cache = PageCache()
+    return _page_cache
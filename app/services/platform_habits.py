@@ -4,7 +4,9 @@ from __future__ import annotations
 import contextlib
 import csv
 import json
+import logging
 import math
+import os
 import threading
 from dataclasses import dataclass
 from pathlib import Path
@@ -12,6 +14,13 @@ from time import time
 
 from app.config import settings
 
+try:  # optional; without it only one process may write the observation log
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+log = logging.getLogger("platform_habits")
+
 HALF_LIFE_DAYS_DEFAULT = 30.0
 PUBLISH_MIN_EFFECTIVE = 8.0
 STALE_MAX_DAYS = 180.0
@@ -37,6 +46,11 @@ def _decay_weight(age_days: float, half_life_days: float) -> float:
     return math.pow(2.0, -age_days / half_life_days)
 
 
+# Compiled blacklist field that matches anything: an empty field, or "*" in the
+# route column (a literal "*" nucleus or stop only matches itself)
+_ANY = None
+
+
 @dataclass
 class PlatformHabitPrediction:
     primary: str | None = None
@@ -67,11 +81,30 @@ class PlatformHabits:
         self.json_path = json_path or (der / "platform_habits.json")
         self.csv_path = csv_path or (der / "platform_habits.csv")
         self.blacklist_csv = blacklist_csv or (der / "platform_habits_blacklist.csv")
+        # Accepted observations are appended here; compact() folds them into json_path.
+        # Workers share both files and serialize on an flock of lock_path.
+        self.log_path = self.json_path.with_suffix(".log")
+        self.lock_path = self.json_path.with_suffix(".lock")
 
         self.store: dict[tuple[str, str, str], dict[str, list[float]]] = {}
+        # Secondary indexes over store keys: stop_id -> keys, (nucleus, stop_id) -> keys
+        self._keys_by_stop: dict[str, set[tuple[str, str, str]]] = {}
+        self._keys_by_nuc_stop: dict[tuple[str, str], set[tuple[str, str, str]]] = {}
+        # Running decayed weight per (key, platform): [weight at ref_ts, ref_ts, last_seen]
+        self._weights: dict[tuple[str, str, str], dict[str, list[float]]] = {}
         self.blacklist: list[tuple[str, str, str]] = []
+        self._blacklist_set: set[tuple[str | None, str | None, str | None]] = set()
         self._lock = threading.RLock()
 
+        # Sequence of the last logged observation and of the last one in the snapshot;
+        # shared by all workers (each one reads the others' lines before appending)
+        self._log_seq = 0
+        self._snapshot_seq = 0
+        # Bytes of log_path already applied, and (mtime_ns, size) of the snapshot they follow
+        self._log_offset = 0
+        self._snapshot_stamp: tuple[int, int] | None = None
+        self._lock_fh = None
+
         self._load()
 
     def _canonical_nucleus_for_route(self, route_id: str) -> str:
@@ -106,17 +139,28 @@ class PlatformHabits:
         canon_nuc = self._canonical_nucleus_for_route(rid)
         if not canon_nuc:
             return
-        ts = epoch if epoch is not None else _now()
+        ts = float(epoch if epoch is not None else _now())
         key = (canon_nuc, rid, sid)
-        with self._lock:
-            bucket = self.store.setdefault(key, {})
-            arr = bucket.setdefault(p, [])
-            if arr and abs(float(ts) - float(arr[-1])) < THROTTLE_SECONDS:
-                return
-            arr.append(float(ts))
-            if len(arr) > MAX_TS_PER_PLATFORM:
-                del arr[:-MAX_TS_PER_PLATFORM]
-        self._save_json_async()
+        with self._log_locked():
+            self._sync_log()
+            if self._apply(key, p, ts):
+                self._append_log(key, p, ts)
+
+    def _apply(self, key: tuple[str, str, str], p: str, ts: float) -> bool:
+        """Record ``ts`` for ``key``/``p`` unless throttled. Caller holds the lock."""
+        bucket = self.store.get(key)
+        if bucket is None:
+            bucket = self.store[key] = {}
+            self._index_key(key)
+        arr = bucket.setdefault(p, [])
+        if arr and abs(ts - float(arr[-1])) < THROTTLE_SECONDS:
+            return False
+        arr.append(ts)
+        trimmed = arr[:-MAX_TS_PER_PLATFORM] if len(arr) > MAX_TS_PER_PLATFORM else []
+        if trimmed:
+            del arr[:-MAX_TS_PER_PLATFORM]
+        self._update_weight(key, p, ts, trimmed, arr)
+        return True
 
     def habitual_for(
         self,
@@ -224,30 +268,86 @@ class PlatformHabits:
         rid = route_id or ""
         sid = stop_id or ""
         with self._lock:
-            keys = set(self.store.keys())
-        lvl1 = {(nuc, rid, sid)} if (nuc, rid, sid) in keys else set()
-        lvl2 = {k for k in keys if k[0] == nuc and k[2] == sid} if sid else set()
-        lvl3 = {k for k in keys if k[2] == sid} if sid else set()
+            lvl1 = {(nuc, rid, sid)} if (nuc, rid, sid) in self.store else set()
+            lvl2 = set(self._keys_by_nuc_stop.get((nuc, sid), ())) if sid else set()
+            lvl3 = set(self._keys_by_stop.get(sid, ())) if sid else set()
         return [s for s in (lvl1, lvl2, lvl3) if s]
 
+    def _index_key(self, key: tuple[str, str, str]) -> None:
+        nuc, _rid, sid = key
+        self._keys_by_stop.setdefault(sid, set()).add(key)
+        self._keys_by_nuc_stop.setdefault((nuc, sid), set()).add(key)
+
+    def _rebuild_indexes(self) -> None:
+        self._keys_by_stop = {}
+        self._keys_by_nuc_stop = {}
+        for key in self.store:
+            self._index_key(key)
+
+    def _half_life_s(self) -> float:
+        return self.half_life_days * 86400.0
+
+    def _update_weight(
+        self, key: tuple[str, str, str], plat: str, ts: float, trimmed: list[float], arr
+    ) -> None:
+        """O(1) update of the running weight after appending ``ts`` and dropping ``trimmed``."""
+        hl = self._half_life_s()
+        agg = self._weights.setdefault(key, {}).get(plat)
+        if agg is None:
+            self._weights[key][plat] = self._weight_from_list(arr)
+            return
+        w, ref, last = agg
+        if ts >= ref:
+            w = w * math.pow(2.0, -(ts - ref) / hl) + 1.0
+            ref = ts
+        else:
+            w += math.pow(2.0, -(ref - ts) / hl)
+        for old in trimmed:
+            w -= math.pow(2.0, -max(0.0, ref - old) / hl)
+        if ts > last:
+            last = ts
+        elif trimmed and last in trimmed:
+            last = max(arr)
+        agg[0], agg[1], agg[2] = max(0.0, w), ref, last
+
+    def _weight_from_list(self, ts_list: list[float]) -> list[float]:
+        if not ts_list:
+            return [0.0, 0.0, 0.0]
+        hl = self._half_life_s()
+        ref = max(ts_list)
+        w = sum(math.pow(2.0, -(ref - float(t)) / hl) for t in ts_list)
+        return [w, ref, ref]
+
+    def _rebuild_weights(self) -> None:
+        self._weights = {
+            key: {plat: self._weight_from_list(ts_list) for plat, ts_list in pmap.items()}
+            for key, pmap in self.store.items()
+        }
+
     def _aggregate(self, keyset: set, now: float) -> dict[str, tuple[float, float]]:
         half = self.half_life_days
+        hl = self._half_life_s()
         res: dict[str, tuple[float, float]] = {}
-        bl = self._blacklist_tuples()
         with self._lock:
             for key in keyset:
+                if self._key_blacklisted(key):
+                    continue
                 platform_map = self.store.get(key, {})
+                weights = self._weights.get(key, {})
                 for plat, ts_list in platform_map.items():
-                    if self._is_blacklisted(key, plat, bl):
-                        continue
-                    w_sum = 0.0
-                    last_seen = 0.0
-                    for ts in ts_list:
-                        age_days = max(0.0, (now - float(ts)) / 86400.0)
-                        w = _decay_weight(age_days, half)
-                        w_sum += w
-                        if ts > last_seen:
-                            last_seen = float(ts)
+                    agg = weights.get(plat)
+                    if agg is not None and now >= agg[1]:
+                        w_ref, ref, last_seen = agg
+                        w_sum = w_ref * math.pow(2.0, -(now - ref) / hl)
+                    else:
+                        # Querying before the newest observation: ages clamp to 0
+                        w_sum = 0.0
+                        last_seen = 0.0
+                        for ts in ts_list:
+                            age_days = max(0.0, (now - float(ts)) / 86400.0)
+                            w_sum += _decay_weight(age_days, half)
+                            if ts > last_seen:
+                                last_seen = float(ts)
                     if w_sum <= 0.0:
                         continue
                     cur_w, cur_last = res.get(plat, (0.0, 0.0))
@@ -278,43 +378,30 @@ class PlatformHabits:
             all_freqs=freqs,
         )
 
-    def _is_blacklisted(self, key, platform: str, bl: list[tuple[str, str, str]]) -> bool:
+    def _compile_blacklist(self) -> None:
+        """(nucleus, stop, route) set with empty fields as wildcards, for _key_blacklisted."""
+        self._blacklist_set = {
+            (bnuc or _ANY, bstop or _ANY, _ANY if broute in ("", "*") else broute)
+            for bnuc, bstop, broute in self.blacklist
+        }
+
+    def _key_blacklisted(self, key: tuple[str, str, str]) -> bool:
+        bl = self._blacklist_set
+        if not bl:
+            return False
         nuc, route, stop = key
-        for bnuc, bstop, broute in bl:
-            if bnuc and bnuc != nuc:
-                continue
-            if bstop and bstop != stop:
-                continue
-            if broute and broute not in ("*", route):
-                continue
-            return True
+        for n in (nuc, _ANY):
+            for st in (stop, _ANY):
+                if (n, st, route) in bl or (n, st, _ANY) in bl:
+                    return True
         return False
 
-    def _blacklist_tuples(self) -> list[tuple[str, str, str]]:
-        return self.blacklist
-
     def _load(self) -> None:
-        with self._lock:
-            if self.json_path.exists():
-                try:
-                    data = json.loads(self.json_path.read_text(encoding="utf-8"))
-                    entries = data.get("entries", {})
-                    store: dict[tuple[str, str, str], dict[str, list[float]]] = {}
-                    for k, v in entries.items():
-                        parts = k.split("|")
-                        if len(parts) == 3:
-                            tup = (parts[0], parts[1], parts[2])
-                        elif len(parts) >= 6:
-                            tup = (parts[0], parts[1], parts[4])
-                        else:
-                            continue
-                        platforms = {}
-                        for plat, ts_list in v.get("platforms", {}).items():
-                            platforms[plat] = [float(ts) for ts in ts_list]
-                        store[tup] = platforms
-                    self.store = store
-                except Exception:
-                    self.store = {}
+        with self._log_locked():
+            self._load_snapshot()
+            replayed = self._sync_log()
+            if replayed:
+                log.info("platform_habits replayed %s logged observations", replayed)
             self.blacklist = []
             if self.blacklist_csv.exists():
                 try:
@@ -330,10 +417,128 @@ class PlatformHabits:
                             )
                 except Exception:
                     self.blacklist = []
+            self._compile_blacklist()
 
-    def _save_json_async(self) -> None:
-        with contextlib.suppress(Exception):
+    def _stat_snapshot(self) -> tuple[int, int] | None:
+        try:
+            st = self.json_path.stat()
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _load_snapshot(self) -> None:
+        """Replace the store with json_path. Caller holds the log lock."""
+        self._snapshot_stamp = self._stat_snapshot()
+        self._snapshot_seq = 0
+        self.store = {}
+        if self._snapshot_stamp is not None:
+            try:
+                data = json.loads(self.json_path.read_text(encoding="utf-8"))
+                self._snapshot_seq = int((data.get("meta") or {}).get("log_seq") or 0)
+                entries = data.get("entries", {})
+                store: dict[tuple[str, str, str], dict[str, list[float]]] = {}
+                for k, v in entries.items():
+                    parts = k.split("|")
+                    if len(parts) == 3:
+                        tup = (parts[0], parts[1], parts[2])
+                    elif len(parts) >= 6:
+                        tup = (parts[0], parts[1], parts[4])
+                    else:
+                        continue
+                    platforms = {}
+                    for plat, ts_list in v.get("platforms", {}).items():
+                        platforms[plat] = [float(ts) for ts in ts_list]
+                    store[tup] = platforms
+                self.store = store
+            except Exception:
+                self.store = {}
+        self._log_seq = self._snapshot_seq
+        self._log_offset = 0
+        self._rebuild_indexes()
+        self._rebuild_weights()
+
+    # ---------------- Persistence: append-only log + snapshot ----------------
+
+    @contextlib.contextmanager
+    def _log_locked(self):
+        """Thread lock plus an exclusive flock: the log and snapshot are shared by workers."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            if self._lock_fh is None:
+                self._lock_fh = self.lock_path.open("a")
+            fcntl.flock(self._lock_fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_fh, fcntl.LOCK_UN)
+
+    def _sync_log(self) -> int:
+        """
+        Apply log lines this process hasn't read yet (its own are skipped by
+        offset, other workers' are applied). Caller holds the log lock.
+        """
+        if self._stat_snapshot() != self._snapshot_stamp:
+            # Another worker compacted: its snapshot has every line written so far
+            # (ours included) and the log was restarted
+            self._load_snapshot()
+        try:
+            size = self.log_path.stat().st_size
+        except FileNotFoundError:
+            self._log_offset = 0
+            return 0
+        if size <= self._log_offset:
+            return 0
+        with self.log_path.open("r+b") as fh:
+            fh.seek(self._log_offset)
+            data = fh.read()
+            end = data.rfind(b"\n") + 1
+            if end < len(data):
+                # Torn line from a writer that died mid-append: cut it so the
+                # next append doesn't get glued onto it
+                fh.truncate(self._log_offset + end)
+        self._log_offset += end
+        applied = 0
+        for raw in data[:end].splitlines():
+            try:
+                seq, nuc, rid, sid, p, ts = json.loads(raw)
+                seq = int(seq)
+            except Exception:
+                continue
+            if seq <= self._log_seq:
+                continue  # already folded in by a compaction that crashed before unlinking
+            self._log_seq = seq
+            self._apply((nuc, rid, sid), p, float(ts))
+            applied += 1
+        return applied
+
+    def _append_log(self, key: tuple[str, str, str], p: str, ts: float) -> None:
+        """Caller holds the log lock and has just run _sync_log."""
+        line = json.dumps([self._log_seq + 1, key[0], key[1], key[2], p, ts], ensure_ascii=False)
+        data = (line + "\n").encode("utf-8")
+        try:
+            with self.log_path.open("ab") as fh:
+                fh.write(data)
+        except Exception:
+            log.warning("platform_habits log append failed", exc_info=True)
+            return
+        self._log_seq += 1
+        self._log_offset += len(data)
+
+    def compact(self) -> bool:
+        """Write a snapshot with every logged observation (any worker's) and drop the log."""
+        with self._log_locked():
+            self._sync_log()
+            if self._log_seq == self._snapshot_seq and self._snapshot_stamp is not None:
+                return False
             self._save_json()
+            self._snapshot_seq = self._log_seq
+            self._snapshot_stamp = self._stat_snapshot()
+            with contextlib.suppress(FileNotFoundError):
+                self.log_path.unlink()
+            self._log_offset = 0
+        return True
 
     def _save_json(self) -> None:
         with self._lock:
@@ -348,11 +553,15 @@ class PlatformHabits:
                     "version": 2,
                     "updated_at": int(_now()),
                     "half_life_days": self.half_life_days,
+                    "log_seq": self._log_seq,
                 },
                 "entries": entries,
             }
             tmp = self.json_path.with_suffix(".json.tmp")
-            tmp.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+            with tmp.open("w", encoding="utf-8") as fh:
+                fh.write(json.dumps(payload, ensure_ascii=False))
+                fh.flush()
+                os.fsync(fh.fileno())
             tmp.replace(self.json_path)
 
 
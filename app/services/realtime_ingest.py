@@ -0,0 +1,136 @@
+# app/services/realtime_ingest.py
+from __future__ import annotations
+
+import contextlib
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from app.core.metrics import REFRESH_STAGE_SECONDS
+from app.services.live_trains_cache import get_live_trains_cache
+from app.services.trip_updates_cache import TripResolvedCtx, get_trip_updates_cache
+
+log = logging.getLogger("realtime_ingest")
+
+
+class RealtimeIngest:
+    """
+    Refresh vehicle positions and trip updates together.
+
+    Both feeds are fetched concurrently and resolved against one table built
+    from the trip updates of the same fetch, so positions no longer enrich
+    from a 10-20s old trip updates snapshot (and vice versa):
+
+    1. parse trip updates with only feed + trips.txt resolution,
+    2. parse positions resolving trips through that fresh table,
+    3. finish the trip updates (route/direction back-fill) from those positions,
+    4. merge both caches, then notify live listeners once for the pair.
+    """
+
+    def __init__(self):
+        self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="rt-fetch")
+        self._runs = 0
+        self._last_pair: dict[str, Any] = {}
+
+    def run(self) -> dict[str, Any]:
+        live = get_live_trains_cache()
+        tu_cache = get_trip_updates_cache()
+        t0 = time.perf_counter()
+
+        fut_live = self._pool.submit(live.fetch)
+        fut_tu = self._pool.submit(tu_cache.fetch)
+        live_data, live_source, live_err = fut_live.result()
+
+        # A trip updates failure must not hold up positions: every trip updates
+        # stage falls back to recording the error, and positions carry on alone
+        try:
+            tu_data, tu_source, tu_err = fut_tu.result()
+        except Exception as e:
+            log.exception("realtime_ingest trip_updates fetch failed")
+            tu_data, tu_source, tu_err = None, None, f"fetch_exc: {e!r}"
+        t_fetch = time.perf_counter()
+
+        tu_parsed = None
+        table: dict[str, TripResolvedCtx] = {}
+        if tu_data is not None and tu_source is not None:
+            try:
+                tu_parsed = tu_cache.parse(tu_data, tu_source, complete=False)
+                table = tu_cache.resolved_table(tu_parsed)
+            except Exception as e:
+                log.exception("realtime_ingest trip_updates parse failed")
+                tu_parsed, tu_err = None, f"parse_exc: {e!r}"
+
+        live_parsed = None
+        if live_data is not None and live_source is not None:
+            live_parsed = live.parse(
+                live_data,
+                live_source,
+                resolve=lambda trip_id: tu_cache.get_resolved_ctx(trip_id, table),
+            )
+
+        if tu_parsed is not None:
+            fresh = {}
+            if live_parsed is not None:
+                fresh = {(tp.trip_id or "").strip(): tp for tp in live_parsed[2] if tp.trip_id}
+
+            def live_lookup(trip_id: str):
+                # Trains retained from earlier snapshots (or all of them when the
+                # positions fetch failed) still back-fill through the cache
+                return fresh.get(trip_id) or live.get_by_trip_id(trip_id)
+
+            try:
+                tu_cache.complete(tu_parsed, live_lookup=live_lookup)
+            except Exception as e:
+                log.exception("realtime_ingest trip_updates back-fill failed")
+                tu_parsed, tu_err = None, f"complete_exc: {e!r}"
+        t_parse = time.perf_counter()
+
+        try:
+            tu_cache.apply(tu_source, tu_err, tu_parsed)
+        except Exception as e:
+            log.exception("realtime_ingest trip_updates merge failed")
+            tu_err = f"apply_exc: {e!r}"
+            with contextlib.suppress(Exception):
+                tu_cache.apply(None, tu_err, None)
+        live.apply(live_source, live_err, live_parsed)
+        t_done = time.perf_counter()
+        REFRESH_STAGE_SECONDS.observe(t_done - t0, "pair", "total")
+
+        self._runs += 1
+        self._last_pair = {
+            "at": time.time(),
+            "live_version": live.snapshot_version(),
+            "trip_updates_version": tu_cache.snapshot_version(),
+            "live_header_ts": live_parsed[0] if live_parsed else None,
+            "trip_updates_header_ts": tu_parsed[0] if tu_parsed else None,
+            "live_error": live_err,
+            "trip_updates_error": tu_err,
+            "resolved_from_pair": len(table),
+            "took_s": {
+                "fetch": round(t_fetch - t0, 3),
+                "parse": round(t_parse - t_fetch, 3),
+                "merge": round(t_done - t_parse, 3),
+            },
+        }
+        log.info(
+            "realtime_ingest pair live_v=%s tu_v=%s fetch=%.2fs parse=%.2fs",
+            self._last_pair["live_version"],
+            self._last_pair["trip_updates_version"],
+            t_fetch - t0,
+            t_parse - t_fetch,
+        )
+        return self._last_pair
+
+    def stats(self) -> dict[str, Any]:
+        return {"runs": self._runs, "last_pair": dict(self._last_pair)}
+
+
+_ingest: RealtimeIngest | None = None
+
+
+def get_realtime_ingest() -> RealtimeIngest:
+    global _ingest
+    if _ingest is None:
+        _ingest = RealtimeIngest()
+    return _ingest
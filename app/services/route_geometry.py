@@ -0,0 +1,186 @@
+# app/services/route_geometry.py
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Any
+from urllib.parse import quote, urlencode
+
+from app.core.fast_json import dumps
+from app.services.routes_repo import get_repo as get_routes_repo
+from app.services.shapes_repo import get_repo as get_shapes_repo
+from app.utils.simplify import dp_significance
+
+log = logging.getLogger("route_geometry")
+
+# (max map zoom, Douglas–Peucker tolerance in metres); zooms past the last
+# entry use its tolerance
+ZOOM_LEVELS: tuple[tuple[float, float], ...] = ((10.0, 60.0), (13.0, 15.0), (16.0, 4.0))
+DEFAULT_ZOOM = 12.0
+
+
+def level_for_zoom(zoom: float | None) -> int:
+    z = DEFAULT_ZOOM if zoom is None else zoom
+    for i, (max_zoom, _tol) in enumerate(ZOOM_LEVELS):
+        if z <= max_zoom:
+            return i
+    return len(ZOOM_LEVELS) - 1
+
+
+def zoom_range(level: int) -> tuple[float | None, float | None]:
+    """(exclusive min, inclusive max) map zoom served by a level; None = unbounded."""
+    lo = ZOOM_LEVELS[level - 1][0] if level > 0 else None
+    hi = ZOOM_LEVELS[level][0] if level < len(ZOOM_LEVELS) - 1 else None
+    return lo, hi
+
+
+def _stops_geojson(route_obj: Any) -> dict | None:
+    features = []
+    for st in getattr(route_obj, "stations", None) or ():
+        try:
+            lat_s = float(st.lat)
+            lon_s = float(st.lon)
+        except (TypeError, ValueError):
+            continue
+        features.append(
+            {
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [lon_s, lat_s]},
+                "properties": {"stop_id": st.stop_id, "name": st.stop_name, "seq": st.seq},
+            }
+        )
+    return {"type": "FeatureCollection", "features": features} if features else None
+
+
+class RouteGeometry:
+    """
+    Route LineString + stops FeatureCollection per (route, direction).
+
+    Built once per GTFS release from the ShapesRepo polyline, simplified with
+    Douglas–Peucker at every ``ZOOM_LEVELS`` tolerance and kept as encoded
+    JSON, so serving a map's geometry is a dict lookup. ``warm()`` fills the
+    table for every route-dir in RoutesRepo; other keys are built on demand.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._release: str | None = None
+        # (route_id, direction_id) -> encoded body per zoom level, None if no geometry
+        self._bodies: dict[tuple[str, str], tuple[bytes, ...] | None] = {}
+
+    def release(self) -> str:
+        """GTFS release the geometry is built from ("" until the trips repo knows it)."""
+        from app.services.trips_repo import peek_repo as peek_trips_repo
+
+        trips = peek_trips_repo()
+        return (trips.release_token if trips is not None else None) or ""
+
+    def _sync_release(self) -> str:
+        rel = self.release()
+        if rel != self._release:
+            with self._lock:
+                if rel != self._release:
+                    if self._release is not None:
+                        log.info("route_geometry: release changed, %d entries dropped", len(self))
+                    self._bodies = {}
+                    self._release = rel
+        return rel
+
+    def __len__(self) -> int:
+        return len(self._bodies)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._bodies = {}
+            self._release = None
+
+    def _build(self, route_id: str, direction_id: str, release: str) -> tuple[bytes, ...] | None:
+        route_obj = get_routes_repo().get_by_route_and_dir(route_id, direction_id)
+        poly = get_shapes_repo().polyline_for_route(route_id, direction_id or None)
+        coords = [[float(p.lon), float(p.lat)] for p in poly or ()]
+        stops = _stops_geojson(route_obj)
+        if not coords and stops is None:
+            return None
+        # One Douglas–Peucker pass serves every level
+        sig = dp_significance(coords, min(tol for _z, tol in ZOOM_LEVELS))
+        bodies = []
+        for level, (_max_zoom, tol) in enumerate(ZOOM_LEVELS):
+            line = [c for c, s in zip(coords, sig, strict=True) if s > tol]
+            bodies.append(
+                dumps(
+                    {
+                        "release": release,
+                        "route_id": route_id,
+                        "direction_id": direction_id,
+                        "tolerance_m": tol,
+                        "zoom_range": zoom_range(level),
+                        "route_geojson": (
+                            {"type": "LineString", "coordinates": line} if len(line) >= 2 else None
+                        ),
+                        "route_stops_geojson": stops,
+                    }
+                )
+            )
+        return tuple(bodies)
+
+    def body(
+        self, route_id: str, direction_id: str | None, zoom: float | None = None
+    ) -> tuple[str, bytes] | None:
+        """(release, encoded geometry) for the route-dir at the given map zoom, or None."""
+        release = self._sync_release()
+        table = self._bodies
+        key = ((route_id or "").strip(), (direction_id or "").strip())
+        if not key[0]:
+            return None
+        bodies = table.get(key, False)
+        if bodies is False:
+            bodies = self._build(key[0], key[1], release)
+            table[key] = bodies
+        if bodies is None:
+            return None
+        return release, bodies[level_for_zoom(zoom)]
+
+    def warm(self) -> int:
+        """Precompute every route-dir known to RoutesRepo; returns the number built."""
+        from app.services.trips_repo import get_repo as get_trips_repo
+
+        t0 = time.perf_counter()
+        get_trips_repo()  # the release token comes from the loaded repo
+        release = self._sync_release()
+        table = self._bodies
+        built = 0
+        for rid, did in list(get_routes_repo().by_route_dir):
+            if (rid, did) in table:
+                continue
+            table[(rid, did)] = self._build(rid, did, release)
+            built += 1
+        log.info(
+            "route_geometry: %d route-dirs built in %.2fs (release=%s)",
+            built,
+            time.perf_counter() - t0,
+            release or "-",
+        )
+        return built
+
+    def url(self, route_id: str, direction_id: str | None) -> str:
+        """Release-versioned geometry endpoint for a route-dir (the client adds ``z``)."""
+        query = urlencode({"direction_id": direction_id or "", "v": self.release()})
+        return f"/api/routes/{quote(route_id, safe='')}/geometry?{query}"
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "release": self._release,
+            "entries": len(self._bodies),
+            "bytes": sum(len(b) for bodies in self._bodies.values() if bodies for b in bodies),
+        }
+
+
+_route_geometry: RouteGeometry | None = None
+
+
+def get_route_geometry() -> RouteGeometry:
+    global _route_geometry
+    if _route_geometry is None:
+        _route_geometry = RouteGeometry()
+    return _route_geometry
@@ -6,6 +6,7 @@ import json
 import os
 
 from app.config import settings
+from app.core.metrics import REPO_LOAD_SECONDS
 from app.domain.models import LineRoute, StationOnLine
 
 
@@ -24,6 +25,24 @@ class RoutesRepo:
         self._route_colors_by_id: dict[str | None, tuple[str | None, str | None]] = {}
         self._route_colors_by_short: dict[str | None, tuple[str | None, str | None]] = {}
         self._line_by_route_id: dict[str, str] = {}
+        # Inverted index stop_id -> {(route_id, direction_id)} and stops per route-dir
+        self._route_dirs_by_stop: dict[str, set[tuple[str, str]]] = {}
+        self._stop_count_by_route_dir: dict[tuple[str, str], int] = {}
+        # (line_id, direction_id, stop_id) -> route-dirs of that line stopping there;
+        # direction "" also collects every direction (no direction filter)
+        self._variants_by_line_stop: dict[tuple[str, str, str], set[tuple[str, str]]] = {}
+        # Frozen per-nucleus stop sets and per route-dir station order / stop -> index / km
+        self._stop_ids_by_nucleus: dict[str, frozenset[str]] = {}
+        self._order_by_route_dir: dict[
+            tuple[str, str], tuple[tuple[str, ...], frozenset[str], dict[str, int]]
+        ] = {}
+        self._km_by_route_dir: dict[tuple[str, str], dict[str, float]] = {}
+        # Slugs of list_nuclei(), checked on every request by user_prefs
+        self._nucleus_slugs: frozenset[str] = frozenset()
+        # nucleus -> station_id -> serving route items; built per nucleus on first use
+        # and dropped when either repo reloads (see _serving_token)
+        self._serving_by_station: dict[str, dict[str, list[dict]]] = {}
+        self._serving_token: tuple[int, int] | None = None
 
         self._parity_path: str | None = None
         self._parity_mtime: float = 0.0
@@ -100,6 +119,7 @@ class RoutesRepo:
                 self._route_colors_by_short[rshort] = (bg, fg)
 
     # -------------------- main load --------------------
+    @REPO_LOAD_SECONDS.time("routes")
     def load(self) -> None:
         if not os.path.exists(self.csv_path):
             raise FileNotFoundError(f"Doesn't exist {self.csv_path}")
@@ -123,6 +143,14 @@ class RoutesRepo:
         self._by_nucleus_short_dir.clear()
         self._stop_names.clear()
         self._line_by_route_id.clear()
+        self._route_dirs_by_stop.clear()
+        self._stop_count_by_route_dir.clear()
+        self._variants_by_line_stop.clear()
+        self._order_by_route_dir.clear()
+        self._km_by_route_dir.clear()
+        stops_by_nucleus: dict[str, set[str]] = {}
+        self._serving_by_station = {}
+        self._serving_token = None
 
         for (rid, did_raw), rows in by_key_rows.items():
             did = did_raw or ""
@@ -186,10 +214,37 @@ class RoutesRepo:
             if nucleus_slug:
                 self._by_nucleus_short_dir[(nucleus_slug, short.lower(), did)] = lv
 
+            stop_ids = [st.stop_id for st in stations if st.stop_id]
+            order = tuple(stop_ids)
+            self._order_by_route_dir[(rid, did)] = (
+                order,
+                frozenset(order),
+                {sid: i for i, sid in enumerate(order)},
+            )
+            km_by_stop: dict[str, float] = {}
+            for st in stations:
+                km_by_stop.setdefault(st.stop_id, float(st.km))
+            self._km_by_route_dir[(rid, did)] = km_by_stop
+            if nucleus_slug:
+                stops_by_nucleus.setdefault(nucleus_slug, set()).update(stop_ids)
+
+            if stop_ids:
+                self._stop_count_by_route_dir[(rid, did)] = len(stop_ids)
+                for sid in stop_ids:
+                    self._route_dirs_by_stop.setdefault(sid, set()).add((rid, did))
+                    if lid:
+                        for d in {did, ""}:
+                            self._variants_by_line_stop.setdefault((lid, d, sid), set()).add(
+                                (rid, did)
+                            )
+
         for _rid, (slug, name) in self._nuclei_map.items():
             if slug and slug not in self._nuclei_names:
                 self._nuclei_names[slug] = name or slug.capitalize()
 
+        self._stop_ids_by_nucleus = {n: frozenset(ids) for n, ids in stops_by_nucleus.items()}
+        self._refresh_nucleus_slugs()
+
         self._parity_mtime = 0.0
         self._parity_map.clear()
         self._parity_status.clear()
@@ -259,6 +314,18 @@ class RoutesRepo:
         slugs = sorted(self._nuclei_names.keys())
         return [{"slug": s, "name": self._nuclei_names.get(s, s.capitalize())} for s in slugs]
 
+    def nucleus_slugs(self) -> frozenset[str]:
+        return self._nucleus_slugs
+
+    def add_nuclei_names(self, names: dict[str, str]) -> None:
+        self._nuclei_names.update(names)
+        self._refresh_nucleus_slugs()
+
+    def _refresh_nucleus_slugs(self) -> None:
+        self._nucleus_slugs = frozenset(
+            slug for n in self.list_nuclei() if (slug := (n.get("slug") or "").strip().lower())
+        )
+
     def list_lines_grouped_by_route(self, nucleus_slug: str) -> list[dict]:
         if not self._has_nuclei:
             return []
@@ -329,19 +396,52 @@ class RoutesRepo:
             return None
         return self._nuclei_names.get(slug, slug.capitalize())
 
-    def stop_ids_for_nucleus(self, nucleus_slug: str) -> set[str]:
-        n = (nucleus_slug or "").strip().lower()
-        if not n:
-            return set()
+    def stop_ids_for_nucleus(self, nucleus_slug: str) -> frozenset[str]:
+        return self._stop_ids_by_nucleus.get((nucleus_slug or "").strip().lower(), frozenset())
+
+    def _build_serving_index(self, n: str, stations_repo) -> dict[str, list[dict]]:
+        by_station: dict[str, dict[tuple[str, str], dict]] = {}
 
-        out: set[str] = set()
-        for lv in self._by_route_dir.values():
+        for (rid, did), lv in self._by_route_dir.items():
             if (lv.nucleus_id or "").strip().lower() != n:
                 continue
-            for st in lv.stations:
-                sid = (st.stop_id or "").strip()
-                if sid:
-                    out.add(sid)
+
+            for s in lv.stations:
+                stop_id = (s.stop_id or "").strip()
+                if not stop_id:
+                    continue
+                st = stations_repo.get_by_stop_id(n, stop_id)
+                sid = (st.station_id or "").strip() if st else ""
+                if not sid:
+                    continue
+                serving = by_station.setdefault(sid, {})
+                item = serving.get((rid, did))
+                if item is None:
+                    item = serving[(rid, did)] = {
+                        "route_id": rid,
+                        "route_short_name": lv.route_short_name,
+                        "route_long_name": lv.route_long_name,
+                        "direction_id": did,
+                        "nucleus_slug": n,
+                        "hits": [],
+                        "hits_count": 0,
+                        "color_bg": getattr(lv, "color_bg", None),
+                        "color_fg": getattr(lv, "color_fg", None),
+                    }
+                item["hits"].append({"seq": s.seq, "stop_id": stop_id, "km": s.km})
+                item["hits_count"] += 1
+
+        out: dict[str, list[dict]] = {}
+        for sid, serving in by_station.items():
+            items = list(serving.values())
+            items.sort(
+                key=lambda x: (
+                    x["route_short_name"].lower(),
+                    x["direction_id"] not in ("", "0"),
+                    x["direction_id"],
+                )
+            )
+            out[sid] = items
         return out
 
     def routes_serving_station(
@@ -352,43 +452,15 @@ class RoutesRepo:
         if not (n and sid):
             return []
 
-        serving: dict[tuple[str, str], dict] = {}
-
-        for (rid, did), lv in self._by_route_dir.items():
-            if (lv.nucleus_id or "").strip().lower() != n:
-                continue
-
-            hits = []
-            for s in lv.stations:
-                stop_id = (s.stop_id or "").strip()
-                if not stop_id:
-                    continue
-                st = stations_repo.get_by_stop_id(n, stop_id)
-                if st and (st.station_id or "").strip() == sid:
-                    hits.append({"seq": s.seq, "stop_id": stop_id, "km": s.km})
+        token = (id(stations_repo), getattr(stations_repo, "generation", 0))
+        if token != self._serving_token:
+            self._serving_by_station = {}
+            self._serving_token = token
 
-            if hits:
-                serving[(rid, did)] = {
-                    "route_id": rid,
-                    "route_short_name": lv.route_short_name,
-                    "route_long_name": lv.route_long_name,
-                    "direction_id": did,
-                    "nucleus_slug": n,
-                    "hits": hits,
-                    "hits_count": len(hits),
-                    "color_bg": getattr(lv, "color_bg", None),
-                    "color_fg": getattr(lv, "color_fg", None),
-                }
-
-        items = list(serving.values())
-        items.sort(
-            key=lambda x: (
-                x["route_short_name"].lower(),
-                x["direction_id"] not in ("", "0"),
-                x["direction_id"],
-            )
-        )
-        return items
+        index = self._serving_by_station.get(n)
+        if index is None:
+            index = self._serving_by_station[n] = self._build_serving_index(n, stations_repo)
+        return list(index.get(sid, ()))
 
     def get_stop_name(self, stop_id: str) -> str | None:
         return self._stop_names.get((stop_id or "").strip()) or None
@@ -398,21 +470,23 @@ class RoutesRepo:
         return self._stop_names.get(sid) or sid or "—"
 
     def km_for_stop_on_route(self, route_id: str, direction_id: str, stop_id: str) -> float | None:
-        lv = self._by_route_dir.get(((route_id or ""), (direction_id or "")))
-        if not lv:
+        km_by_stop = self._km_by_route_dir.get(((route_id or ""), (direction_id or "")))
+        if not km_by_stop:
             return None
-        sid = (stop_id or "").strip()
-        for s in lv.stations:
-            if (s.stop_id or "").strip() == sid:
-                return float(s.km)
-        return None
+        return km_by_stop.get((stop_id or "").strip())
+
+    def stations_order_set(
+        self, route_id: str, direction_id: str
+    ) -> tuple[tuple[str, ...], frozenset[str]]:
+        hit = self._order_by_route_dir.get(((route_id or ""), (direction_id or "")))
+        if not hit:
+            return (), frozenset()
+        return hit[0], hit[1]
 
-    def stations_order_set(self, route_id: str, direction_id: str) -> tuple[list[str], set[str]]:
-        lv = self._by_route_dir.get(((route_id or ""), (direction_id or "")))
-        if not lv:
-            return [], set()
-        ids = [s.stop_id for s in lv.stations if s.stop_id]
-        return ids, set(ids)
+    def stop_index_on_route(self, route_id: str, direction_id: str) -> dict[str, int]:
+        """stop_id -> position in the route-dir station order (read-only, shared)."""
+        hit = self._order_by_route_dir.get(((route_id or ""), (direction_id or "")))
+        return hit[2] if hit else {}
 
     def route_destination(self, route_id: str) -> str | None:
         rid = (route_id or "").strip()
@@ -568,6 +642,41 @@ class RoutesRepo:
         self._ensure_parity_loaded()
         return self._parity_status.get((route_id or "").strip(), "none")
 
+    def guess_route_for_stops(self, stop_ids) -> str | None:
+        """
+        Route whose stations share most stops with ``stop_ids``; ties go to the
+        route with more stations, then the greater route_id.
+        """
+        scores: dict[tuple[str, str], int] = {}
+        for sid in set(stop_ids):
+            for key in self._route_dirs_by_stop.get(sid, ()):
+                scores[key] = scores.get(key, 0) + 1
+        best: tuple[int, int, str] | None = None  # (score, len_route, route_id)
+        for (rid, did), score in scores.items():
+            cand = (score, self._stop_count_by_route_dir.get((rid, did), 0), rid)
+            if best is None or cand > best:
+                best = cand
+        return best[2] if best else None
+
+    def variant_routes_for_stop(
+        self, route_id: str, direction_id: str | None, stop_id: str
+    ) -> list[tuple[str, str]]:
+        """
+        (route_id, direction_id) of every route of the same line as ``route_id`` that
+        calls at ``stop_id`` (any direction when ``direction_id`` is empty), base first.
+        """
+        did = (direction_id or "").strip()
+        base = (
+            self._by_route_dir.get((route_id, did))
+            or self._by_route_dir.get((route_id, "0"))
+            or self._by_route_dir.get((route_id, "1"))
+        )
+        if not base:
+            return [(route_id, did)]
+
+        variants = self._variants_by_line_stop.get((base.line_id, did, str(stop_id)), ())
+        return [(route_id, did)] + sorted(v for v in variants if v != (route_id, did))
+
     @property
     def nuclei_names(self):
         return self._nuclei_names
@@ -621,7 +730,7 @@ def get_repo() -> RoutesRepo:
         nucleus_data_path = getattr(settings, "NUCLEI_DATA_CSV", "")
         extra_names = _load_nuclei_from_data(nucleus_data_path)
         if extra_names:
-            _repo.nuclei_names.update(extra_names)
+            _repo.add_nuclei_names(extra_names)
     return _repo
 
 
@@ -11,6 +11,7 @@ from typing import Any
 from zoneinfo import ZoneInfo
 
 from app.config import settings
+from app.core.metrics import REPO_LOAD_SECONDS
 from app.domain.models import ScheduledCall, ScheduledTrain
 from app.utils.train_numbers import extract_train_number_str
 
@@ -157,10 +158,11 @@ class ScheduledTrainsRepo:
         if self._loaded and not force:
             return
         log.info("ScheduledTrainsRepo.refresh() gtfs_dir=%s", self.gtfs_dir)
-        if not self._load_from_cache():
-            self._load_trips()
-            self._load_stop_times()
-            self._persist_cache()
+        with REPO_LOAD_SECONDS.time("scheduled_trains"):
+            if not self._load_from_cache():
+                self._load_trips()
+                self._load_stop_times()
+                self._persist_cache()
         self._by_date_trip.clear()
         self._by_date_stop.clear()
         self._active_services_by_date.clear()
@@ -9,6 +9,8 @@ from collections.abc import Iterable
 from dataclasses import dataclass
 
 from app.config import settings
+from app.core.metrics import REPO_LOAD_SECONDS
+from app.services.static_dataset import ShapesView, build_shapes_writer, dataset_key, open_or_build
 
 
 @dataclass(frozen=True)
@@ -28,6 +30,8 @@ class ShapesRepo:
         self._polylines: dict[str, list[ShapePoint]] = {}
         self._route_dir_shape: dict[tuple[str, str], str] = {}
         self._route_shape: dict[str, str] = {}
+        # Shared read-only polylines (GTFS_SHARED_DATASET); replaces _polylines
+        self._view: ShapesView | None = None
         self._loaded = False
         self._lock = threading.Lock()
 
@@ -119,12 +123,48 @@ class ShapesRepo:
             if chosen:
                 self._route_shape[rid] = chosen
 
+    def _load_shared(self) -> bool:
+        def build():
+            self._load_shapes()
+            self._load_route_shape_mapping()
+            if not self._polylines:
+                return None
+            return build_shapes_writer(self._polylines, self._route_dir_shape, self._route_shape)
+
+        from app.services.gtfs_static_manager import active_release_token
+
+        key = dataset_key(active_release_token(), self._shapes_csv, self._trips_csv)
+        try:
+            ds = open_or_build("shapes", key, build)
+        except Exception:
+            return False
+        if ds is None:
+            return False
+        self._view = ShapesView(ds, ShapePoint)
+        self._polylines = {}
+        self._route_dir_shape = self._view.route_dir_shape()
+        self._route_shape = self._view.route_shape()
+        return True
+
     def load(self) -> None:
         with self._lock:
             if self._loaded:
                 return
-            self._load_shapes()
-            self._load_route_shape_mapping()
+            with REPO_LOAD_SECONDS.time("shapes"):
+                if not (getattr(settings, "GTFS_SHARED_DATASET", False) and self._load_shared()):
+                    self._load_shapes()
+                    self._load_route_shape_mapping()
+            self._loaded = True
+
+    def reload(self) -> None:
+        """Re-read the GTFS files; readers keep the old polylines until the swap."""
+        fresh = ShapesRepo(self._shapes_csv, self._trips_csv)
+        fresh.load()
+        with self._lock:
+            self._polylines = fresh._polylines
+            self._route_dir_shape = fresh._route_dir_shape
+            self._route_shape = fresh._route_shape
+            self._view = fresh._view
             self._loaded = True
 
     # ------------- API -------------
@@ -148,6 +188,8 @@ class ShapesRepo:
             sid = self._route_shape.get(rid)
         if not sid:
             return None
+        if self._view is not None:
+            return self._view.polyline(sid)
         return self._polylines.get(sid)
 
     def project_distance(self, polyline: list[ShapePoint], lat: float, lon: float) -> float | None:
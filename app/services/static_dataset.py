@@ -0,0 +1,400 @@
+# app/services/static_dataset.py
+from __future__ import annotations
+
+import array
+import bisect
+import contextlib
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+from collections.abc import Callable, Iterator, Sequence
+from pathlib import Path
+from typing import Any
+
+from app.config import settings
+
+try:  # POSIX only; without it concurrent builders just race on os.replace
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore[assignment]
+
+log = logging.getLogger("static_dataset")
+
+MAGIC = b"DEMTDS01"
+_HEADER = struct.Struct("<8sI")
+_ALIGN = 8
+
+
+def dataset_dir() -> Path:
+    return Path(getattr(settings, "GTFS_DATASET_DIR", None) or "app/data/derived/static_dataset")
+
+
+def dataset_key(release_token: str | None, *sources: str | os.PathLike | None) -> str:
+    """Stable key for a dataset: active GTFS release plus size/mtime of its source files."""
+    h = hashlib.sha1((release_token or "").encode("utf-8"))
+    for src in sources:
+        if not src:
+            continue
+        try:
+            st = os.stat(src)
+            h.update(f"|{src}:{st.st_size}:{st.st_mtime_ns}".encode())
+        except OSError:
+            h.update(f"|{src}:-".encode())
+    return h.hexdigest()[:16]
+
+
+# ---------------------- Writer ----------------------
+
+
+class DatasetWriter:
+    """Collects flat arrays, string tables and a small JSON ``extra`` into one file."""
+
+    def __init__(self):
+        self._sections: list[tuple[str, str, bytes]] = []
+        self.extra: dict[str, Any] = {}
+
+    def add_array(self, name: str, typecode: str, values: Sequence[int] | Sequence[float]) -> None:
+        arr = values if isinstance(values, array.array) else array.array(typecode, values)
+        self._sections.append((name, typecode, arr.tobytes()))
+
+    def add_strings(self, name: str, values: Sequence[str]) -> None:
+        """Store ``values`` (must be sorted for StringTable.index) as blob + offsets."""
+        offsets = array.array("I", [0])
+        blob = bytearray()
+        for v in values:
+            blob += v.encode("utf-8")
+            offsets.append(len(blob))
+        self._sections.append((f"{name}.blob", "B", bytes(blob)))
+        self._sections.append((f"{name}.off", "I", offsets.tobytes()))
+
+    def write(self, path: Path) -> None:
+        layout: dict[str, list] = {}
+        pos = 0
+        for name, typecode, data in self._sections:
+            layout[name] = [pos, len(data), typecode]
+            pos += len(data) + (-len(data) % _ALIGN)
+        meta = json.dumps({"sections": layout, "extra": self.extra}).encode("utf-8")
+        base = _HEADER.size + len(meta)
+        base += -base % _ALIGN
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, len(meta)))
+            f.write(meta)
+            f.write(b"\0" * (base - _HEADER.size - len(meta)))
+            for _, _, data in self._sections:
+                f.write(data)
+                f.write(b"\0" * (-len(data) % _ALIGN))
+        os.replace(tmp, path)
+
+
+# ---------------------- Reader ----------------------
+
+
+class StringTable(Sequence[str]):
+    """Read-only sorted string table over a mapped blob."""
+
+    def __init__(self, blob: memoryview, offsets: memoryview):
+        self._blob = blob
+        self._off = offsets
+
+    def __len__(self) -> int:
+        return len(self._off) - 1
+
+    def __getitem__(self, i):  # type: ignore[override]
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        return bytes(self._blob[self._off[i] : self._off[i + 1]]).decode("utf-8")
+
+    def index(self, value: str, *_args) -> int | None:  # type: ignore[override]
+        i = bisect.bisect_left(self, value)
+        if i < len(self) and self[i] == value:
+            return i
+        return None
+
+
+class StaticDataset:
+    """Read-only memory map of a file produced by DatasetWriter."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, meta_len = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"not a static dataset: {path}")
+        meta = json.loads(bytes(self._mm[_HEADER.size : _HEADER.size + meta_len]))
+        base = _HEADER.size + meta_len
+        self._base = base + (-base % _ALIGN)
+        self._sections: dict[str, list] = meta.get("sections") or {}
+        self.extra: dict[str, Any] = meta.get("extra") or {}
+        self._view = memoryview(self._mm)
+
+    def array(self, name: str) -> memoryview:
+        off, length, typecode = self._sections[name]
+        start = self._base + off
+        return self._view[start : start + length].cast(typecode)
+
+    def strings(self, name: str) -> StringTable:
+        return StringTable(self.array(f"{name}.blob"), self.array(f"{name}.off"))
+
+    def size_bytes(self) -> int:
+        return len(self._mm)
+
+
+def open_or_build(
+    name: str, key: str, build: Callable[[], DatasetWriter | None]
+) -> StaticDataset | None:
+    """
+    Map ``<name>-<key>.bin``, building it first if needed.
+
+    The first worker to get here for a release builds the file under an
+    exclusive lock; the others wait on the lock and then just map it, so
+    the page cache holds a single copy shared by every process.
+    """
+    root = dataset_dir()
+    root.mkdir(parents=True, exist_ok=True)
+    path = root / f"{name}-{key}.bin"
+
+    with open(root / f"{name}.lock", "a+") as lock_fh:
+        if fcntl is not None:
+            fcntl.flock(lock_fh.fileno(), fcntl.LOCK_EX)
+        try:
+            if not path.exists():
+                writer = build()
+                if writer is None:
+                    return None
+                writer.write(path)
+                log.info("static_dataset built %s", path)
+                for old in root.glob(f"{name}-*.bin"):
+                    if old != path:
+                        with contextlib.suppress(OSError):
+                            old.unlink()  # mapped copies stay valid until unmapped
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_fh.fileno(), fcntl.LOCK_UN)
+
+    ds = StaticDataset(path)
+    log.info("static_dataset mapped %s (%.1f MB)", path, ds.size_bytes() / 1e6)
+    return ds
+
+
+# ---------------------- Stop times view ----------------------
+
+NONE_I32 = -1
+
+
+def _opt(v: int) -> int | None:
+    return None if v == NONE_I32 else v
+
+
+def build_stop_times_writer(
+    rows: Sequence[tuple[str, str, int, int | None, int | None]],
+    sched_by_route_stop: dict[tuple[str, str, str], list[tuple[int | None, int | None, str]]],
+    trip_directions: dict[str, str],
+) -> DatasetWriter:
+    """Flatten stop_times rows and the (route, dir, stop) schedule index."""
+    trips = sorted({r[0] for r in rows})
+    stops = sorted({r[1] for r in rows})
+    trip_idx = {t: i for i, t in enumerate(trips)}
+    stop_idx = {s: i for i, s in enumerate(stops)}
+
+    # Stable sort keeps file order for duplicated (trip, seq) rows
+    ordered = sorted(range(len(rows)), key=lambda i: (trip_idx[rows[i][0]], rows[i][2]))
+    trip_off = array.array("I", [0] * (len(trips) + 1))
+    st_stop, st_seq, st_arr, st_dep = (array.array("i") for _ in range(4))
+    for i in ordered:
+        tid, sid, seq, arr, dep = rows[i]
+        trip_off[trip_idx[tid] + 1] += 1
+        st_stop.append(stop_idx[sid])
+        st_seq.append(seq)
+        st_arr.append(NONE_I32 if arr is None else arr)
+        st_dep.append(NONE_I32 if dep is None else dep)
+    for i in range(len(trips)):
+        trip_off[i + 1] += trip_off[i]
+
+    keys = sorted(sched_by_route_stop)
+    sched_keys = ["\x1f".join(k) for k in keys]
+    sched_off = array.array("I", [0])
+    sched_trip, sched_arr, sched_dep = (array.array("i") for _ in range(3))
+    for k in keys:
+        for arr, dep, tid in sched_by_route_stop[k]:
+            ti = trip_idx.get(tid)
+            if ti is None:
+                continue  # no stop_times rows for it, so no trip to point at
+            sched_trip.append(ti)
+            sched_arr.append(NONE_I32 if arr is None else arr)
+            sched_dep.append(NONE_I32 if dep is None else dep)
+        sched_off.append(len(sched_trip))
+
+    trip_dir = array.array("b", (int(trip_directions.get(t, NONE_I32)) for t in trips))
+
+    w = DatasetWriter()
+    w.add_strings("trips", trips)
+    w.add_strings("stops", stops)
+    w.add_array("trip_off", "I", trip_off)
+    w.add_array("trip_dir", "b", trip_dir)
+    w.add_array("st_stop", "i", st_stop)
+    w.add_array("st_seq", "i", st_seq)
+    w.add_array("st_arr", "i", st_arr)
+    w.add_array("st_dep", "i", st_dep)
+    w.add_strings("sched_keys", sched_keys)
+    w.add_array("sched_off", "I", sched_off)
+    w.add_array("sched_trip", "i", sched_trip)
+    w.add_array("sched_arr", "i", sched_arr)
+    w.add_array("sched_dep", "i", sched_dep)
+    return w
+
+
+class StopTimesView:
+    """TripsRepo stop_times lookups over a mapped StaticDataset."""
+
+    def __init__(self, ds: StaticDataset):
+        self.ds = ds
+        self.trips = ds.strings("trips")
+        self.stops = ds.strings("stops")
+        self._trip_off = ds.array("trip_off")
+        self._trip_dir = ds.array("trip_dir")
+        self._stop = ds.array("st_stop")
+        self._seq = ds.array("st_seq")
+        self._arr = ds.array("st_arr")
+        self._dep = ds.array("st_dep")
+        self._sched_keys = ds.strings("sched_keys")
+        self._sched_off = ds.array("sched_off")
+        self._sched_trip = ds.array("sched_trip")
+        self._sched_arr = ds.array("sched_arr")
+        self._sched_dep = ds.array("sched_dep")
+
+    def _rows_for(self, trip_id: str) -> range:
+        i = self.trips.index(trip_id)
+        if i is None:
+            return range(0)
+        return range(self._trip_off[i], self._trip_off[i + 1])
+
+    def by_stop_id(
+        self, trip_id: str, stop_id: str
+    ) -> tuple[int | None, int | None, int | None] | None:
+        si = self.stops.index(stop_id)
+        if si is None:
+            return None
+        hit = None
+        for r in self._rows_for(trip_id):
+            if self._stop[r] == si:
+                hit = r  # highest seq wins (file order on ties), like the dict index
+        if hit is None:
+            return None
+        return _opt(self._arr[hit]), _opt(self._dep[hit]), self._seq[hit]
+
+    def by_seq(self, trip_id: str, seq: int) -> tuple[str, int | None, int | None] | None:
+        hit = None
+        for r in self._rows_for(trip_id):
+            if self._seq[r] == seq:
+                hit = r
+        if hit is None:
+            return None
+        return self.stops[self._stop[hit]], _opt(self._arr[hit]), _opt(self._dep[hit])
+
+    def calls_for_trip(self, trip_id: str) -> list[tuple[int, str, int | None, int | None]]:
+        """(seq, stop_id, arr_s, dep_s) ordered by seq, one row per seq."""
+        by_seq: dict[int, tuple[int, str, int | None, int | None]] = {}
+        for r in self._rows_for(trip_id):
+            seq = self._seq[r]
+            by_seq[seq] = (seq, self.stops[self._stop[r]], _opt(self._arr[r]), _opt(self._dep[r]))
+        return [by_seq[s] for s in sorted(by_seq)]
+
+    def sched_for(
+        self, route_id: str, direction_id: str, stop_id: str
+    ) -> list[tuple[int | None, int | None, str]]:
+        k = self._sched_keys.index(f"{route_id}\x1f{direction_id}\x1f{stop_id}")
+        if k is None:
+            return []
+        return [
+            (_opt(self._sched_arr[r]), _opt(self._sched_dep[r]), self.trips[self._sched_trip[r]])
+            for r in range(self._sched_off[k], self._sched_off[k + 1])
+        ]
+
+    def iter_trip_directions(self) -> Iterator[tuple[str, str]]:
+        for i, d in enumerate(self._trip_dir):
+            if d in (0, 1):
+                yield self.trips[i], str(d)
+
+
+# ---------------------- Shapes view ----------------------
+
+
+def build_shapes_writer(
+    polylines: dict[str, Sequence[Any]],
+    route_dir_shape: dict[tuple[str, str], str],
+    route_shape: dict[str, str],
+) -> DatasetWriter:
+    shape_ids = sorted(polylines)
+    off = array.array("I", [0])
+    lat, lon, cum = array.array("d"), array.array("d"), array.array("d")
+    for sid in shape_ids:
+        for p in polylines[sid]:
+            lat.append(p.lat)
+            lon.append(p.lon)
+            cum.append(p.cum_m)
+        off.append(len(lat))
+    w = DatasetWriter()
+    w.add_strings("shapes", shape_ids)
+    w.add_array("shape_off", "I", off)
+    w.add_array("shape_lat", "d", lat)
+    w.add_array("shape_lon", "d", lon)
+    w.add_array("shape_cum", "d", cum)
+    w.extra["route_dir_shape"] = [[r, d, s] for (r, d), s in route_dir_shape.items()]
+    w.extra["route_shape"] = route_shape
+    return w
+
+
+class PolylineView(Sequence[Any]):
+    """Sequence of ShapePoint materialized on access from mapped columns."""
+
+    def __init__(self, point_cls, lat, lon, cum, start: int, stop: int):
+        self._cls = point_cls
+        self._lat, self._lon, self._cum = lat, lon, cum
+        self._start, self._stop = start, stop
+
+    def __len__(self) -> int:
+        return self._stop - self._start
+
+    def __getitem__(self, i):  # type: ignore[override]
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        j = self._start + i
+        return self._cls(lat=self._lat[j], lon=self._lon[j], cum_m=self._cum[j])
+
+
+class ShapesView:
+    def __init__(self, ds: StaticDataset, point_cls):
+        self.ds = ds
+        self._cls = point_cls
+        self._shapes = ds.strings("shapes")
+        self._off = ds.array("shape_off")
+        self._lat = ds.array("shape_lat")
+        self._lon = ds.array("shape_lon")
+        self._cum = ds.array("shape_cum")
+
+    def route_dir_shape(self) -> dict[tuple[str, str], str]:
+        return {(r, d): s for r, d, s in self.ds.extra.get("route_dir_shape") or []}
+
+    def route_shape(self) -> dict[str, str]:
+        return dict(self.ds.extra.get("route_shape") or {})
+
+    def polyline(self, shape_id: str) -> PolylineView | None:
+        i = self._shapes.index(shape_id)
+        if i is None:
+            return None
+        return PolylineView(
+            self._cls, self._lat, self._lon, self._cum, self._off[i], self._off[i + 1]
+        )
@@ -2,11 +2,18 @@
 from __future__ import annotations
 
 import csv
+import heapq
 import os
 from collections import defaultdict
+from collections.abc import Callable
 
 from app.config import settings
+from app.core.metrics import REPO_LOAD_SECONDS
 from app.domain.models import Station
+from app.utils.geo_index import NearestIndex
+
+# Longest n-gram kept in the station search index; longer terms intersect their trigrams
+SEARCH_GRAM_MAX = 3
 
 
 def _slugify(s: str) -> str:
@@ -27,6 +34,37 @@ def _canonical_station_id(stop_row: dict) -> str:
     return parent or stop_id
 
 
+def _search_norm(s: str) -> str:
+    from app.viewkit import normalize_text
+
+    return normalize_text(s, strip_nonword=True)
+
+
+def _search_grams(term: str) -> set[str]:
+    if len(term) <= SEARCH_GRAM_MAX:
+        return {term}
+    return {term[i : i + SEARCH_GRAM_MAX] for i in range(len(term) - SEARCH_GRAM_MAX + 1)}
+
+
+def _score_match(name_norm: str, id_norm: str, query_terms: list[str]) -> tuple[int, int, int]:
+    missing = 0
+    penalty = 0
+
+    for t in query_terms:
+        in_name = t in name_norm
+        in_id = t in id_norm
+        if not (in_name or in_id):
+            missing += 1
+            continue
+
+        if in_name:
+            penalty += 0 if name_norm.startswith(t) else 1
+        if in_id:
+            penalty += 0 if id_norm.startswith(t) else 1
+
+    return missing, penalty, len(name_norm)
+
+
 def _fnum(s: str | None) -> float:
     if not s:
         return 0.0
@@ -72,12 +110,28 @@ class StationsRepo:
 
         self._station_lines_cache: dict[tuple[str, str], list] = {}
         self._correspondences: dict[str, dict] = {}
+        # Bumped on every load so dependents (RoutesRepo serving index) can invalidate
+        self.generation = 0
+
+        # Search index: entries are (nucleus, station, name_norm, id_norm, name_lower),
+        # grouped by nucleus; every 1..SEARCH_GRAM_MAX-gram of name/id maps to entry ids.
+        self._search_entries: list[tuple[str, Station, str, str, str]] = []
+        self._search_postings: dict[str, frozenset[int]] = {}
+        self._search_ranges: dict[str, range] = {}
 
+        # Nearest-station lookup: one KD-tree per nucleus plus one over all nuclei (key None)
+        self._geo_stations: dict[str | None, list[Station]] = {}
+        self._geo_index: dict[str | None, NearestIndex] = {}
+
+    @REPO_LOAD_SECONDS.time("stations")
     def load(self) -> None:
         self._read_stops_once()
         self._load_correspondences_map()  # ahora lee de route_stations.csv
         self._build_indexes_by_nucleus()
+        self._build_search_index()
+        self._build_geo_index()
         self._station_lines_cache.clear()
+        self.generation += 1
 
     # ---------- stops.csv → Group by station (parent_station) ----------
 
@@ -239,6 +293,40 @@ class StationsRepo:
             stations.sort(key=lambda s: s.name.lower())
             self._by_nucleus[slug] = stations
 
+    def _build_search_index(self) -> None:
+        entries: list[tuple[str, Station, str, str, str]] = []
+        ranges: dict[str, range] = {}
+        postings: dict[str, set[int]] = defaultdict(set)
+
+        for slug in sorted(self._by_nucleus):
+            lo = len(entries)
+            for st in self._by_nucleus[slug]:
+                idx = len(entries)
+                name_norm = _search_norm(st.name)
+                id_norm = _search_norm(st.station_id)
+                entries.append((slug, st, name_norm, id_norm, st.name.lower()))
+                for text in (name_norm, id_norm):
+                    for word in text.split(" "):
+                        for i in range(len(word)):
+                            for n in range(1, min(SEARCH_GRAM_MAX, len(word) - i) + 1):
+                                postings[word[i : i + n]].add(idx)
+            ranges[slug] = range(lo, len(entries))
+
+        self._search_entries = entries
+        self._search_postings = {g: frozenset(ids) for g, ids in postings.items()}
+        self._search_ranges = ranges
+
+    def _build_geo_index(self) -> None:
+        stations: dict[str | None, list[Station]] = {None: []}
+        for slug in sorted(self._by_nucleus):
+            stations[slug] = list(self._by_nucleus[slug])
+            stations[None].extend(stations[slug])
+
+        self._geo_index = {
+            key: NearestIndex([(st.lat, st.lon) for st in items]) for key, items in stations.items()
+        }
+        self._geo_stations = stations
+
     # ---------- API ----------
 
     def list_by_nucleus(self, nucleus_slug: str) -> list[Station]:
@@ -262,6 +350,67 @@ class StationsRepo:
         res = [st for st in self.list_by_nucleus(nucleus_slug) if s in st.name.lower()]
         return res[:limit]
 
+    def search(
+        self, q: str, nucleus_slug: str | None = None, limit: int = 20
+    ) -> list[tuple[str, Station, tuple[int, int, int]]]:
+        """
+        Stations whose normalized name or id contains every query term, best first.
+
+        Returns (nucleus, station, score) ordered by score, name and station id.
+        """
+        terms = [t for t in _search_norm(q).split(" ") if t]
+        if not terms:
+            return []
+
+        entries = self._search_entries
+        postings = self._search_postings
+        if nucleus_slug:
+            scope = self._search_ranges.get(nucleus_slug.strip().lower())
+            if not scope:
+                return []
+        else:
+            scope = range(len(entries))
+
+        lists = []
+        for g in set().union(*(_search_grams(t) for t in terms)):
+            ids = postings.get(g)
+            if not ids:
+                return []
+            lists.append(ids)
+        lists.sort(key=len)
+        candidates = lists[0].intersection(*lists[1:])
+
+        results = []
+        for idx in candidates:
+            if idx not in scope:
+                continue
+            slug, st, name_norm, id_norm, name_lower = entries[idx]
+            score = _score_match(name_norm, id_norm, terms)
+            if score[0] == 0:
+                results.append((score, name_lower, st.station_id, idx))
+
+        best = heapq.nsmallest(limit, results)
+        return [(entries[idx][0], entries[idx][1], score) for score, _, _, idx in best]
+
+    def nearest(
+        self,
+        lat: float,
+        lon: float,
+        k: int = 5,
+        nucleus_slug: str | None = None,
+        accept: Callable[[Station], bool] | None = None,
+    ) -> list[tuple[Station, float]]:
+        """The ``k`` stations closest to (lat, lon) as (station, distance_km), closest first."""
+        key = (nucleus_slug or "").strip().lower() or None
+        index = self._geo_index.get(key)
+        if index is None:
+            return []
+        stations = self._geo_stations[key]
+        hits = index.nearest(
+            lat, lon, k, accept=(lambda i: accept(stations[i])) if accept else None
+        )
+        return [(stations[i], dist_km) for i, dist_km in hits]
+
     def get_correspondences(self, station_id: str) -> dict:
         return dict(self._correspondences.get((station_id or "").strip(), {}))
 
@@ -7,6 +7,7 @@ import threading
 from collections import defaultdict
 from typing import TYPE_CHECKING, Any
 
+from app.core.metrics import REPO_LOAD_SECONDS
 from app.domain.models import Stop
 from app.services.platform_habits import get_service as get_platform_habits
 from app.services.routes_repo import get_repo as get_lines_repo
@@ -34,6 +35,7 @@ class StopsRepo:
         self._by_station: dict[tuple[str, str], list[Stop]] = defaultdict(list)
         self._lock = threading.RLock()
 
+    @REPO_LOAD_SECONDS.time("stops")
     def load(self) -> None:
         self._by_key.clear()
         self._by_slug.clear()
@@ -203,36 +205,7 @@ class StopsRepo:
     def _variant_routes_for_stop(
         self, base_route_id: str, direction_id: str | None, stop_id: str
     ) -> list[tuple[str, str]]:
-        lrepo = get_lines_repo()
-        did = (direction_id or "").strip()
-
-        base = (
-            lrepo._by_route_dir.get((base_route_id, did))
-            if did
-            else lrepo._by_route_dir.get((base_route_id, ""))  # noqa: SLF001
-        )
-        if not base:
-            base = lrepo._by_route_dir.get((base_route_id, "0")) or lrepo._by_route_dir.get(
-                (base_route_id, "1")
-            )
-        if not base:
-            return [(base_route_id, did)]
-
-        target_line = getattr(base, "line_id", None)
-        variants: set[tuple[str, str]] = {(base_route_id, did)}
-
-        if target_line:
-            for (rid, d), lv in lrepo._by_route_dir.items():  # noqa: SLF001
-                if getattr(lv, "line_id", None) != target_line:
-                    continue
-                if did and d != did:
-                    continue
-                for st in lv.stations:
-                    if (st.stop_id or "").strip() == str(stop_id):
-                        variants.add((rid, d))
-                        break
-
-        return list(variants)
+        return get_lines_repo().variant_routes_for_stop(base_route_id, direction_id, stop_id)
 
     def nearest_service_prediction(
         self,
@@ -1,10 +1,30 @@
 # app/services/train_pass_recorder.py
 from __future__ import annotations
 
+import contextlib
+import logging
+import re
+import sqlite3
 import time
 from collections.abc import Iterable
-from dataclasses import dataclass
+from dataclasses import astuple, dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
 from threading import Lock
+from zoneinfo import ZoneInfo
+
+from app.config import settings
+
+log = logging.getLogger("train_pass_recorder")
+
+SERVICE_TZ = "Europe/Madrid"
+# Service dates kept in memory: today and the previous N days (overnight services)
+RETAIN_SERVICE_DAYS = 1
+# Hard cap on tracked services; oldest service dates go first
+MAX_SERVICES = 20_000
+EVICT_CHECK_SECONDS = 60.0
+
+_SERVICE_DATE_RE = re.compile(r"^(\d{8}):")
 
 
 @dataclass
@@ -21,14 +41,241 @@ _passes_by_service: dict[str, dict[int, StopPassRecord]] = {}
 _last_seq_by_service: dict[str, int] = {}
 _service_to_train_ids: dict[str, set[str]] = {}
 _train_to_service: dict[str, str] = {}
+_services_by_date: dict[str, set[str]] = {}
+_date_by_service: dict[str, str] = {}
+_last_evict_check = 0.0
 _lock = Lock()
 
 
+def _today(now: float | None = None) -> str:
+    return datetime.fromtimestamp(now or time.time(), ZoneInfo(SERVICE_TZ)).strftime("%Y%m%d")
+
+
+def _service_date(service_key: str) -> str:
+    """YYYYMMDD prefix of ``service_key`` or, for keys without one, today's date."""
+    m = _SERVICE_DATE_RE.match(service_key)
+    return m.group(1) if m else _today()
+
+
+def _track_service(service_key: str) -> str:
+    """Register ``service_key`` under its service date. Caller holds _lock."""
+    date = _date_by_service.get(service_key)
+    if date is None:
+        date = _service_date(service_key)
+        _date_by_service[service_key] = date
+        _services_by_date.setdefault(date, set()).add(service_key)
+    return date
+
+
+def _forget_service(service_key: str) -> None:
+    """Drop every trace of ``service_key``. Caller holds _lock."""
+    _passes_by_service.pop(service_key, None)
+    _last_seq_by_service.pop(service_key, None)
+    for tid in _service_to_train_ids.pop(service_key, set()):
+        if _train_to_service.get(tid) == service_key:
+            _train_to_service.pop(tid, None)
+    date = _date_by_service.pop(service_key, None)
+    if date is not None:
+        bucket = _services_by_date.get(date)
+        if bucket is not None:
+            bucket.discard(service_key)
+            if not bucket:
+                _services_by_date.pop(date, None)
+
+
+def _cutoff_date(now: float | None = None) -> str:
+    d = datetime.fromtimestamp(now or time.time(), ZoneInfo(SERVICE_TZ))
+    return (d - timedelta(days=RETAIN_SERVICE_DAYS)).strftime("%Y%m%d")
+
+
+def evict_expired(now: float | None = None) -> int:
+    """Drop service dates older than the retention window, then enforce MAX_SERVICES."""
+    global _last_evict_check
+    cutoff = _cutoff_date(now)
+    removed = 0
+    # Services dropped by the size cap while still inside the retention window
+    capped: list[str] = []
+    with _lock:
+        _last_evict_check = time.monotonic()
+        for date in sorted(_services_by_date):
+            if date >= cutoff and len(_date_by_service) <= MAX_SERVICES:
+                break
+            for key in list(_services_by_date.get(date, ())):
+                if date >= cutoff and len(_date_by_service) <= MAX_SERVICES:
+                    break
+                _forget_service(key)
+                removed += 1
+                if date >= cutoff:
+                    capped.append(key)
+    if removed:
+        log.info("train_pass_recorder evicted=%s capped=%s cutoff=%s", removed, len(capped), cutoff)
+        journal = _get_journal()
+        if journal is not None:
+            journal.evict_before(cutoff)
+            # Capped services are still inside the window: replay() would restore them
+            journal.delete_services(capped)
+    return removed
+
+
+def _maybe_evict() -> None:
+    if time.monotonic() - _last_evict_check >= EVICT_CHECK_SECONDS:
+        evict_expired()
+
+
+def stats() -> dict:
+    with _lock:
+        return {
+            "services": len(_date_by_service),
+            "passes": sum(len(b) for b in _passes_by_service.values()),
+            "trains": len(_train_to_service),
+            "service_dates": {d: len(keys) for d, keys in sorted(_services_by_date.items())},
+            "journal": str(_journal.path) if _journal is not None else None,
+        }
+
+
+# ---------------------- Optional on-disk journal ----------------------
+
+
+class _Journal:
+    """
+    SQLite (WAL) copy of the recorder state so passes survive restarts.
+    Writes are small upserts per recorded service; replayed once at boot.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS passes (
+                service_key TEXT NOT NULL, service_date TEXT NOT NULL,
+                stop_sequence INTEGER NOT NULL, stop_id TEXT NOT NULL,
+                arrival_epoch INTEGER, departure_epoch INTEGER,
+                arrival_delay_sec INTEGER, departure_delay_sec INTEGER,
+                PRIMARY KEY (service_key, stop_sequence)
+            );
+            CREATE TABLE IF NOT EXISTS services (
+                service_key TEXT PRIMARY KEY, service_date TEXT NOT NULL,
+                last_seq INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS trains (
+                train_id TEXT PRIMARY KEY, service_key TEXT NOT NULL,
+                service_date TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS passes_date ON passes (service_date);
+            CREATE INDEX IF NOT EXISTS services_date ON services (service_date);
+            CREATE INDEX IF NOT EXISTS trains_date ON trains (service_date);
+            """)
+        self._lock = Lock()
+
+    def write_service(
+        self,
+        service_key: str,
+        date: str,
+        last_seq: int,
+        records: list[StopPassRecord],
+        train_id: str | None,
+    ) -> None:
+        with self._lock, contextlib.suppress(sqlite3.Error):
+            cur = self._db.cursor()
+            cur.execute("BEGIN")
+            cur.execute(
+                "INSERT OR REPLACE INTO services VALUES (?, ?, ?)", (service_key, date, last_seq)
+            )
+            cur.executemany(
+                "INSERT OR REPLACE INTO passes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(service_key, date, *astuple(r)) for r in records],
+            )
+            if train_id:
+                cur.execute(
+                    "INSERT OR REPLACE INTO trains VALUES (?, ?, ?)", (train_id, service_key, date)
+                )
+            cur.execute("COMMIT")
+
+    def delete_service(self, service_key: str) -> None:
+        self.delete_services([service_key])
+
+    def delete_services(self, service_keys: list[str]) -> None:
+        if not service_keys:
+            return
+        rows = [(key,) for key in service_keys]
+        with self._lock, contextlib.suppress(sqlite3.Error):
+            cur = self._db.cursor()
+            cur.execute("BEGIN")
+            for table in ("passes", "services", "trains"):
+                cur.executemany(f"DELETE FROM {table} WHERE service_key = ?", rows)
+            cur.execute("COMMIT")
+
+    def evict_before(self, cutoff: str) -> None:
+        with self._lock, contextlib.suppress(sqlite3.Error):
+            for table in ("passes", "services", "trains"):
+                self._db.execute(f"DELETE FROM {table} WHERE service_date < ?", (cutoff,))
+
+    def replay(self, cutoff: str) -> int:
+        """Load journaled services from ``cutoff`` on into the in-memory maps."""
+        with self._lock:
+            services = self._db.execute(
+                "SELECT service_key, last_seq FROM services WHERE service_date >= ?", (cutoff,)
+            ).fetchall()
+            passes = self._db.execute(
+                "SELECT service_key, stop_sequence, stop_id, arrival_epoch, departure_epoch,"
+                " arrival_delay_sec, departure_delay_sec FROM passes WHERE service_date >= ?",
+                (cutoff,),
+            ).fetchall()
+            trains = self._db.execute(
+                "SELECT train_id, service_key FROM trains WHERE service_date >= ?", (cutoff,)
+            ).fetchall()
+        with _lock:
+            for key, last_seq in services:
+                _track_service(key)
+                _last_seq_by_service[key] = max(int(last_seq), _last_seq_by_service.get(key, 0))
+            for key, *fields in passes:
+                _track_service(key)
+                bucket = _passes_by_service.setdefault(key, {})
+                bucket.setdefault(fields[0], StopPassRecord(*fields))
+            for tid, key in trains:
+                _train_to_service.setdefault(tid, key)
+                _service_to_train_ids.setdefault(key, set()).add(tid)
+        return len(services)
+
+
+_journal: _Journal | None = None
+_journal_ready = False
+# Held while the journal is opened and replayed; callers must not hold _lock
+_journal_lock = Lock()
+
+
+def _get_journal() -> _Journal | None:
+    """Journal from TRAIN_PASS_JOURNAL_PATH, opened and replayed on first use."""
+    global _journal, _journal_ready
+    if _journal_ready:
+        return _journal
+    with _journal_lock:
+        if _journal_ready:
+            return _journal
+        path = getattr(settings, "TRAIN_PASS_JOURNAL_PATH", None)
+        if path:
+            try:
+                journal = _Journal(Path(path))
+                cutoff = _cutoff_date()
+                journal.evict_before(cutoff)
+                n = journal.replay(cutoff)
+                log.info("train_pass_recorder journal=%s replayed services=%s", path, n)
+                _journal = journal
+            except Exception:
+                log.warning("train_pass_recorder journal unavailable: %s", path, exc_info=True)
+        _journal_ready = True
+    return _journal
+
+
 def register_service_train(service_key: str, train_id: str | None) -> None:
     if not service_key or train_id in (None, ""):
         return
     tid = str(train_id)
     with _lock:
+        _track_service(service_key)
         _train_to_service[tid] = service_key
         bucket = _service_to_train_ids.setdefault(service_key, set())
         bucket.add(tid)
@@ -38,11 +285,10 @@ def cleanup_train(service_key: str) -> None:
     if not service_key:
         return
     with _lock:
-        _passes_by_service.pop(service_key, None)
-        _last_seq_by_service.pop(service_key, None)
-        train_ids = _service_to_train_ids.pop(service_key, set())
-        for tid in train_ids:
-            _train_to_service.pop(tid, None)
+        _forget_service(service_key)
+    journal = _get_journal()
+    if journal is not None:
+        journal.delete_service(service_key)
 
 
 def cleanup_train_by_vehicle(train_id: str | None) -> None:
@@ -58,6 +304,7 @@ def cleanup_train_by_vehicle(train_id: str | None) -> None:
 def get_stop_pass_records(service_key: str) -> list[StopPassRecord]:
     if not service_key:
         return []
+    _get_journal()
     with _lock:
         bucket = _passes_by_service.get(service_key, {})
         return [bucket[idx] for idx in sorted(bucket.keys())]
@@ -66,6 +313,7 @@ def get_stop_pass_records(service_key: str) -> list[StopPassRecord]:
 def get_last_seq(service_key: str) -> int:
     if not service_key:
         return 0
+    _get_journal()
     with _lock:
         return int(_last_seq_by_service.get(service_key, 0))
 
@@ -83,6 +331,8 @@ def record_stop_passes_for_service(
     if not service_key or last_passed_seq is None:
         return
 
+    journal = _get_journal()
+    _maybe_evict()
     register_service_train(service_key, train_id)
 
     rows_by_seq: dict[int, dict] = {}
@@ -159,6 +409,7 @@ def record_stop_passes_for_service(
         return None
 
     with _lock:
+        _track_service(service_key)
         bucket = _passes_by_service.setdefault(service_key, {})
 
     for seq in sorted(rows_by_seq.keys()):
@@ -201,4 +452,10 @@ def record_stop_passes_for_service(
                     rec.departure_delay_sec = int(dep_epoch - sched_arr)
 
     with _lock:
-        _last_seq_by_service[service_key] = max(prev_seq, int(last_passed_seq))
+        new_last = max(prev_seq, int(last_passed_seq))
+        _last_seq_by_service[service_key] = new_last
+        if journal is None:
+            return
+        date = _track_service(service_key)
+        touched = [bucket[seq] for seq in sorted(bucket) if prev_seq < seq <= int(last_passed_seq)]
+    journal.write_service(service_key, date, new_last, touched, str(train_id) if train_id else None)
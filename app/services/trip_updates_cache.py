@@ -3,15 +3,21 @@ from __future__ import annotations
 
 import logging
 import time
+from collections import deque
 from contextlib import suppress
 from dataclasses import dataclass, field
 from datetime import UTC, datetime
 
+from app.core.metrics import REFRESH_STAGE_SECONDS
 from app.services.common_fetch import fetch_with_retry
 from app.services.trips_repo import get_repo as get_trips_repo
+from app.utils.bounded_cache import BoundedCache
 
 log = logging.getLogger("trip_updates")
 
+# Label for the refresh stage timings (see app.core.metrics)
+METRICS_FEED = "trip_updates"
+
 # Fast retries to avoid intermittent failures.
 FAST_RETRY_ATTEMPTS = 2
 FAST_RETRY_DELAY = 0.4
@@ -25,6 +31,14 @@ MISSING_TTL_SECONDS = 15 * 60
 # Prefer departure when train is already at the platform (anti-flicker margin)
 DEPARTURE_PREFERENCE_FUDGE_S = 45
 
+# Bounds for the resolution caches (dropped entirely on GTFS release change)
+RESOLVED_CTX_CACHE_MAX = 20_000
+RESOLVED_CTX_CACHE_TTL_S = 6 * 3600
+DIRECTION_INFER_CACHE_MAX = 5_000
+
+# Snapshot versions for which the set of changed trips is kept
+CHANGED_LOG_MAX = 32
+
 
 # ---------------------- Data models ----------------------
 
@@ -70,6 +84,34 @@ class _Entry:
     item: TripUpdateItem
     last_seen_wall_s: float
     last_source_ts: int
+    fingerprint: int = 0
+
+
+def _fingerprint(it: TripUpdateItem) -> int:
+    """Content hash of a trip update, ignoring its feed timestamp."""
+    return hash(
+        (
+            it.route_id,
+            it.direction_id,
+            it.start_time,
+            it.start_date,
+            it.schedule_relationship,
+            it.delay,
+            tuple(
+                (
+                    s.stop_id,
+                    s.stop_sequence,
+                    s.arrival_time,
+                    s.arrival_delay,
+                    s.departure_time,
+                    s.departure_delay,
+                    s.uncertainty,
+                    s.schedule_relationship,
+                )
+                for s in it.stop_updates
+            ),
+        )
+    )
 
 
 class TripUpdatesCache:
@@ -90,22 +132,34 @@ class TripUpdatesCache:
         self._last_fetch_kind: str | None = None
         self._last_fetch_took_s: float = 0.0
 
-        self._resolved_by_trip_id: dict[str, TripResolvedCtx] = {}
+        # Trips whose entry changed since the last view rebuild, and the index
+        # keys each trip owns so it can be re-indexed on its own
+        self._dirty: set[str] = set()
+        self._index_keys: dict[str, tuple[list[tuple[str, str]], list[tuple[str, int]]]] = {}
+        self._views_ready = False
 
-        # Cache for direction inference by (route_id, observed_stops)
-        self._direction_infer_cache: dict[
-            tuple[str, tuple], tuple[tuple[int, int], tuple[int, int]]
-        ] = {}
+        # Bumped whenever the views change; tags resolved contexts (see _resolve_and_cache_trip_ctx)
+        self._version: int = 0
+        self._changed_log: deque[tuple[int, frozenset[str]]] = deque(maxlen=CHANGED_LOG_MAX)
+
+        # normalized trip_id -> (TU version, TripResolvedCtx)
+        self._resolved_by_trip_id = BoundedCache(
+            RESOLVED_CTX_CACHE_MAX, ttl_s=RESOLVED_CTX_CACHE_TTL_S
+        )
+
+        # Cache for direction inference by (route_id, observed_stops) -> (score0, score1)
+        self._direction_infer_cache = BoundedCache(DIRECTION_INFER_CACHE_MAX)
 
     # ---------------------- Helpers: enrichment ----------------------
 
-    def _enrich_from_live_trains(self, it: TripUpdateItem) -> None:
+    def _enrich_from_live_trains(self, it: TripUpdateItem, live_lookup=None) -> None:
         try:
-            from app.services.live_trains_cache import get_live_trains_cache
+            if live_lookup is None:
+                from app.services.live_trains_cache import get_live_trains_cache
 
-            ltc = get_live_trains_cache()
+                live_lookup = get_live_trains_cache().get_by_trip_id
             # O(1) dict lookup instead of O(n) linear search
-            t = ltc.get_by_trip_id(it.trip_id)
+            t = live_lookup(it.trip_id)
             if t:
                 if not getattr(it, "route_id", None) and getattr(t, "route_id", None):
                     it.route_id = t.route_id
@@ -125,20 +179,9 @@ class TripUpdatesCache:
             obs = [s.stop_id for s in (it.stop_updates or []) if getattr(s, "stop_id", None)]
             if not obs:
                 return
-            obs_set = set(obs)
-            best: tuple[int, int, str] | None = None  # (score, len_route, route_id)
-            for (rid, _did), lv in repo.by_route_dir.items():
-                seq_ids = [s.stop_id for s in lv.stations if getattr(s, "stop_id", None)]
-                if not seq_ids:
-                    continue
-                score = len(obs_set.intersection(seq_ids))
-                if score <= 0:
-                    continue
-                cand = (score, len(seq_ids), rid)
-                if best is None or cand > best:
-                    best = cand
-            if best:
-                it.route_id = best[2]
+            rid = repo.guess_route_for_stops(obs)
+            if rid:
+                it.route_id = rid
         except Exception:
             pass
 
@@ -161,7 +204,11 @@ class TripUpdatesCache:
         normalized_tid = self._normalize_trip_id(tid)
         hit = self._resolved_by_trip_id.get(normalized_tid)
         if hit:
-            return hit
+            version, ctx = hit
+            # Partial contexts are retried once new trip updates have arrived
+            complete = ctx.route_id is not None and ctx.direction_id is not None
+            if complete or version == self._version:
+                return ctx
 
         it = self._by_trip_id.get(normalized_tid)
         route_id = getattr(it, "route_id", None) if it else None
@@ -186,12 +233,34 @@ class TripUpdatesCache:
             direction_id=direction_id,
             resolved_by=source or "unknown",
         )
-        self._resolved_by_trip_id[normalized_tid] = ctx
+        self._resolved_by_trip_id.put(normalized_tid, (self._version, ctx))
         return ctx
 
-    def get_resolved_ctx(self, trip_id: str) -> TripResolvedCtx:
+    def get_resolved_ctx(
+        self, trip_id: str, table: dict[str, TripResolvedCtx] | None = None
+    ) -> TripResolvedCtx:
+        """``table`` (see ``resolved_table``) is consulted first when given."""
+        if table:
+            hit = table.get(self._normalize_trip_id(trip_id))
+            if hit is not None and hit.route_id and hit.direction_id:
+                return hit
         return self._resolve_and_cache_trip_ctx(trip_id)
 
+    def resolved_table(
+        self, parsed: tuple[int, int, list[TripUpdateItem]]
+    ) -> dict[str, TripResolvedCtx]:
+        """Trip contexts carried by a parsed (not yet applied) snapshot."""
+        table: dict[str, TripResolvedCtx] = {}
+        for it in parsed[2]:
+            if it.route_id or it.direction_id in ("0", "1"):
+                table[self._normalize_trip_id(it.trip_id)] = TripResolvedCtx(
+                    trip_id=it.trip_id,
+                    route_id=it.route_id,
+                    direction_id=it.direction_id if it.direction_id in ("0", "1") else None,
+                    resolved_by="trip_updates",
+                )
+        return table
+
     # ---------------------- Fetch & parse ----------------------
 
     def _fetch_pb_once(self):
@@ -226,7 +295,22 @@ class TripUpdatesCache:
             self._last_fetch_took_s = time.time() - t0
             return None, f"client_exc: {e!r}"
 
-    def _parse_pb(self, feed) -> tuple[int, int, list[TripUpdateItem]]:
+    def _complete_item(self, it: TripUpdateItem, header_ts: int, live_lookup=None) -> None:
+        """Fill route/direction the feed and trips.txt left open, and default the timestamp."""
+        if not getattr(it, "route_id", None) or not getattr(it, "direction_id", None):
+            self._enrich_from_live_trains(it, live_lookup)
+
+        if not getattr(it, "route_id", None):
+            self._guess_route_from_stops(it)
+
+        if not getattr(it, "direction_id", None):
+            with suppress(Exception):
+                self._infer_direction_from_stu(it)
+
+        if not getattr(it, "timestamp", None):
+            it.timestamp = header_ts or None
+
+    def _parse_pb(self, feed, complete: bool = True) -> tuple[int, int, list[TripUpdateItem]]:
         # feed: google.transit.gtfs_realtime_pb2.FeedMessage
         header_ts = int(getattr(getattr(feed, "header", None), "timestamp", 0) or 0)
         now_s = int(time.time())
@@ -290,24 +374,16 @@ class TripUpdatesCache:
                 )
                 it.stop_updates.append(pred)
 
-            if not getattr(it, "route_id", None) or not getattr(it, "direction_id", None):
-                self._enrich_from_live_trains(it)
-
-            if not getattr(it, "route_id", None):
-                self._guess_route_from_stops(it)
-
-            if not getattr(it, "direction_id", None):
-                with suppress(Exception):
-                    self._infer_direction_from_stu(it)
-
-            if not getattr(it, "timestamp", None):
-                it.timestamp = header_ts or None
+            if complete:
+                self._complete_item(it, header_ts)
 
             items.append(it)
 
         return header_ts, now_s, items
 
-    def _parse_json(self, raw: dict) -> tuple[int, int, list[TripUpdateItem]]:
+    def _parse_json(
+        self, raw: dict, complete: bool = True
+    ) -> tuple[int, int, list[TripUpdateItem]]:
         hdr = raw.get("header") or {}
         try:
             header_ts = int(hdr.get("timestamp") or 0)
@@ -375,18 +451,8 @@ class TripUpdatesCache:
                 )
                 it.stop_updates.append(pred)
 
-            if not getattr(it, "route_id", None) or not getattr(it, "direction_id", None):
-                self._enrich_from_live_trains(it)
-
-            if not getattr(it, "route_id", None):
-                self._guess_route_from_stops(it)
-
-            if not getattr(it, "direction_id", None):
-                with suppress(Exception):
-                    self._infer_direction_from_stu(it)
-
-            if not getattr(it, "timestamp", None):
-                it.timestamp = header_ts or None
+            if complete:
+                self._complete_item(it, header_ts)
 
             items.append(it)
 
@@ -406,15 +472,26 @@ class TripUpdatesCache:
             normalized_tid = self._normalize_trip_id(tid)
             entry = self._entries.get(normalized_tid)
             last_source_ts = int(it.timestamp or header_ts or 0)
+            fp = _fingerprint(it)
             if entry is None:
                 self._entries[normalized_tid] = _Entry(
-                    item=it, last_seen_wall_s=float(now_s), last_source_ts=last_source_ts
+                    item=it,
+                    last_seen_wall_s=float(now_s),
+                    last_source_ts=last_source_ts,
+                    fingerprint=fp,
                 )
+                self._dirty.add(normalized_tid)
                 created += 1
             else:
-                entry.item = it
                 entry.last_seen_wall_s = float(now_s)
                 entry.last_source_ts = last_source_ts
+                if entry.fingerprint == fp:
+                    # Same predictions: keep the indexed item, just refresh its timestamp
+                    entry.item.timestamp = it.timestamp
+                    continue
+                entry.item = it
+                entry.fingerprint = fp
+                self._dirty.add(normalized_tid)
                 updated += 1
         return updated, created
 
@@ -425,29 +502,110 @@ class TripUpdatesCache:
                 to_del.append(tid)
         for tid in to_del:
             del self._entries[tid]
+        self._dirty.update(to_del)
         if to_del:
             log.info(
                 "trip_updates sweep_expired removed=%s ttl=%s", len(to_del), MISSING_TTL_SECONDS
             )
         return len(to_del)
 
-    def _rebuild_views(self) -> None:
-        items = [e.item for e in self._entries.values()]
-        self._items = items
-        self._by_trip_id = {self._normalize_trip_id(it.trip_id): it for it in items if it.trip_id}
+    def _index_item(self, normalized_tid: str, it: TripUpdateItem) -> None:
+        stopid_keys: list[tuple[str, str]] = []
+        seq_keys: list[tuple[str, int]] = []
+        for stu in it.stop_updates:
+            if stu.stop_id:
+                k = (normalized_tid, str(stu.stop_id))
+                self._by_trip_stopid[k] = stu
+                stopid_keys.append(k)
+            if isinstance(stu.stop_sequence, int):
+                k2 = (normalized_tid, int(stu.stop_sequence))
+                self._by_trip_seq[k2] = stu
+                seq_keys.append(k2)
+        self._by_trip_id[normalized_tid] = it
+        self._index_keys[normalized_tid] = (stopid_keys, seq_keys)
+
+    def _reindex_trip(self, normalized_tid: str, it: TripUpdateItem | None) -> None:
+        """
+        Swap one trip's index entries for those of ``it`` (None: the trip is gone).
+
+        Readers in the HTTP threadpool look these dicts up without a lock, so the
+        new keys are written (replacing values in place) before the stale ones
+        are popped: a trip present before and after is never seen missing.
+        """
+        old_stopid, old_seq = self._index_keys.get(normalized_tid, ((), ()))
+        if it is not None:
+            self._index_item(normalized_tid, it)
+            new_stopid, new_seq = self._index_keys[normalized_tid]
+        else:
+            self._by_trip_id.pop(normalized_tid, None)
+            self._index_keys.pop(normalized_tid, None)
+            new_stopid, new_seq = [], []
+        for k in set(old_stopid).difference(new_stopid):
+            self._by_trip_stopid.pop(k, None)
+        for k2 in set(old_seq).difference(new_seq):
+            self._by_trip_seq.pop(k2, None)
+
+    def _rebuild_views(self, full: bool = False) -> None:
+        """
+        Re-index the trips marked dirty since the last call (all of them on the
+        first build or with ``full``). No-op when nothing changed.
+        """
+        t0 = time.perf_counter()
+        dirty, self._dirty = self._dirty, set()
+        if full or not self._views_ready:
+            changed = set(self._by_trip_id) | set(self._entries)
+            self._by_trip_id = {}
+            self._by_trip_stopid = {}
+            self._by_trip_seq = {}
+            self._index_keys = {}
+            for tid, entry in self._entries.items():
+                self._index_item(tid, entry.item)
+            self._views_ready = True
+        elif dirty:
+            changed = dirty
+            for tid in dirty:
+                entry = self._entries.get(tid)
+                self._reindex_trip(tid, entry.item if entry is not None else None)
+        else:
+            return
 
-        # Reindex by (trip_id, stop_id) and (trip_id, stop_seq)
-        m_stopid: dict[tuple[str, str], StopTimePred] = {}
-        m_seq: dict[tuple[str, int], StopTimePred] = {}
-        for it in items:
-            normalized_tid = self._normalize_trip_id(it.trip_id)
-            for stu in it.stop_updates:
-                if stu.stop_id:
-                    m_stopid[(normalized_tid, str(stu.stop_id))] = stu
-                if isinstance(stu.stop_sequence, int):
-                    m_seq[(normalized_tid, int(stu.stop_sequence))] = stu
-        self._by_trip_stopid = m_stopid
-        self._by_trip_seq = m_seq
+        self._items = [e.item for e in self._entries.values()]
+        self._version += 1
+        self._changed_log.append((self._version, frozenset(changed)))
+        self._retag_caches()
+        REFRESH_STAGE_SECONDS.observe(time.perf_counter() - t0, METRICS_FEED, "rebuild_views")
+
+    def _retag_caches(self) -> None:
+        """Drop resolution caches computed against a previous GTFS release."""
+        try:
+            release = get_trips_repo().release_token
+        except Exception:
+            return
+        if self._resolved_by_trip_id.retag(release) | self._direction_infer_cache.retag(release):
+            log.info("trip_updates resolution caches reset for release=%s", release)
+
+    def snapshot_version(self) -> int:
+        return self._version
+
+    def last_changed_trips(self) -> frozenset[str]:
+        """Normalized trip_ids whose predictions changed (or vanished) in the last rebuild."""
+        return self._changed_log[-1][1] if self._changed_log else frozenset()
+
+    def changed_trips_since(self, version: int) -> set[str] | None:
+        """
+        Normalized trip_ids changed after snapshot ``version``, or None when that
+        version is too old to answer and the caller must recompute everything.
+        """
+        if version >= self._version:
+            return set()
+        log_versions = [v for v, _ in self._changed_log]
+        if not log_versions or log_versions[0] > version + 1:
+            return None
+        out: set[str] = set()
+        for v, tids in self._changed_log:
+            if v > version:
+                out |= tids
+        return out
 
     # ---------- Infer direction from STUs ----------
 
@@ -467,10 +625,10 @@ class TripUpdatesCache:
         from app.services.routes_repo import get_repo as get_routes_repo
 
         repo = get_routes_repo()
-        seq0, _ = repo.stations_order_set(rid, "0")
-        seq1, _ = repo.stations_order_set(rid, "1")
-        in0 = bool(seq0) and (sid in set(seq0))
-        in1 = bool(seq1) and (sid in set(seq1))
+        _, set0 = repo.stations_order_set(rid, "0")
+        _, set1 = repo.stations_order_set(rid, "1")
+        in0 = sid in set0
+        in1 = sid in set1
 
         if in0 and not in1:
             it.direction_id = "0"
@@ -505,10 +663,9 @@ class TripUpdatesCache:
         repo = get_routes_repo()
 
         def score_dir(did: str) -> tuple[int, int]:
-            seq_list, _ = repo.stations_order_set(rid, did)
-            if not seq_list:
+            idx = repo.stop_index_on_route(rid, did)
+            if not idx:
                 return (0, 0)
-            idx = {sid: i for i, sid in enumerate(seq_list)}
             mapped = [idx.get(sid) for sid in obs if sid in idx]
             matches = len(mapped)
             asc = sum(
@@ -522,7 +679,7 @@ class TripUpdatesCache:
         s1 = score_dir("1")
 
         # Cache the result
-        self._direction_infer_cache[cache_key] = (s0, s1)
+        self._direction_infer_cache.put(cache_key, (s0, s1))
 
         if s0 > s1:
             it.direction_id = "0"
@@ -531,19 +688,44 @@ class TripUpdatesCache:
 
     # ---------------------- Public API ----------------------
 
-    def refresh(self) -> tuple[int, float]:
-        self._last_error = None
+    # Staged refresh (fetch -> parse -> complete -> apply), also driven by RealtimeIngest
 
-        data, source, err = fetch_with_retry(
-            self._fetch_pb_once,
-            self._fetch_json_once,
-            attempts=1 + FAST_RETRY_ATTEMPTS,
-            delay=FAST_RETRY_DELAY,
-            primary_label="pb",
-            fallback_label="json",
-        )
+    def fetch(self):
+        self._last_error = None
+        with REFRESH_STAGE_SECONDS.time(METRICS_FEED, "fetch"):
+            return fetch_with_retry(
+                self._fetch_pb_once,
+                self._fetch_json_once,
+                attempts=1 + FAST_RETRY_ATTEMPTS,
+                delay=FAST_RETRY_DELAY,
+                primary_label="pb",
+                fallback_label="json",
+            )
 
-        if data is None or source is None:
+    def parse(
+        self, data, source: str, complete: bool = True
+    ) -> tuple[int, int, list[TripUpdateItem]]:
+        """Decode the feed; ``complete=False`` leaves the back-fill to ``complete``."""
+        with REFRESH_STAGE_SECONDS.time(METRICS_FEED, "decode"):
+            if source == "pb":
+                return self._parse_pb(data, complete=complete)
+            return self._parse_json(data, complete=complete)
+
+    def complete(self, parsed: tuple[int, int, list[TripUpdateItem]], live_lookup=None) -> None:
+        """Route/direction back-fill; ``live_lookup(trip_id)`` defaults to the live cache."""
+        header_ts = parsed[0]
+        with REFRESH_STAGE_SECONDS.time(METRICS_FEED, "enrich"):
+            for it in parsed[2]:
+                self._complete_item(it, header_ts, live_lookup=live_lookup)
+
+    def apply(
+        self,
+        source: str | None,
+        err: str | None,
+        parsed: tuple[int, int, list[TripUpdateItem]] | None,
+    ) -> tuple[int, float]:
+        """Merge a parsed snapshot (or record the fetch error when ``parsed`` is None)."""
+        if parsed is None or source is None:
             self._errors_streak += 1
             self._last_error = err
             log.warning(
@@ -556,10 +738,7 @@ class TripUpdatesCache:
             self._rebuild_views()
             return len(self._items), self._last_fetch_s
 
-        if source == "pb":
-            header_ts, now_s, items = self._parse_pb(data)
-        else:
-            header_ts, now_s, items = self._parse_json(data)
+        header_ts, now_s, items = parsed
         self._last_source = source
 
         if header_ts:
@@ -575,15 +754,64 @@ class TripUpdatesCache:
             return len(self._items), self._last_fetch_s
 
         self._consecutive_empty = 0
+        t0 = time.perf_counter()
         updated, created = self._merge_snapshot(items, now_s, header_ts)
         self._sweep_expired(now_s)
+        REFRESH_STAGE_SECONDS.observe(time.perf_counter() - t0, METRICS_FEED, "merge")
         self._rebuild_views()
 
         return len(self._items), self._last_fetch_s
 
+    def refresh(self) -> tuple[int, float]:
+        with REFRESH_STAGE_SECONDS.time(METRICS_FEED, "total"):
+            data, source, err = self.fetch()
+            parsed = None
+            if data is not None and source is not None:
+                # Decode and back-fill separately so both show up in the stage timings
+                parsed = self.parse(data, source, complete=False)
+                self.complete(parsed)
+            return self.apply(source, err, parsed)
+
     def list_all(self) -> list[TripUpdateItem]:
         return list(self._items)
 
+    # Fields shared between workers (see live_coordinator)
+    _SHARED_FIELDS = (
+        "_entries",
+        "_last_fetch_s",
+        "_last_snapshot_ts",
+        "_errors_streak",
+        "_last_error",
+        "_consecutive_empty",
+        "_last_source",
+        "_last_fetch_kind",
+        "_last_fetch_took_s",
+    )
+
+    def export_state(self) -> dict:
+        return {name: getattr(self, name) for name in self._SHARED_FIELDS}
+
+    def import_state(self, state: dict) -> None:
+        """Replace the cache content with a snapshot published by the poller worker."""
+        entries = state.get("_entries")
+        if entries is not None:
+            old = self._entries
+            self._dirty.update(set(old) - set(entries))
+            for tid, b in entries.items():
+                a = old.get(tid)
+                if a is None or a.fingerprint != b.fingerprint:
+                    self._dirty.add(tid)
+                    continue
+                # Unchanged trip: keep the indexed item, take the fresh bookkeeping
+                a.last_seen_wall_s = b.last_seen_wall_s
+                a.last_source_ts = b.last_source_ts
+                a.item.timestamp = b.item.timestamp
+                entries[tid] = a
+        for name in self._SHARED_FIELDS:
+            if name in state:
+                setattr(self, name, state[name])
+        self._rebuild_views()
+
     # ---------- Lookups ----------
 
     def get_by_trip_id(self, trip_id: str) -> TripUpdateItem | None:
@@ -705,6 +933,10 @@ class TripUpdatesCache:
             "consecutive_empty": self._consecutive_empty,
             "is_stale": self.is_stale(),
             "ttl_seconds": MISSING_TTL_SECONDS,
+            "version": self._version,
+            "last_changed_trips": len(self.last_changed_trips()),
+            "resolved_ctx_cache": self._resolved_by_trip_id.stats(),
+            "direction_infer_cache": self._direction_infer_cache.stats(),
         }
 
 
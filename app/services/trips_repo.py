@@ -14,6 +14,13 @@ from pathlib import Path
 from zoneinfo import ZoneInfo
 
 from app.config import settings
+from app.core.metrics import REPO_LOAD_SECONDS
+from app.services.static_dataset import (
+    StopTimesView,
+    build_stop_times_writer,
+    dataset_key,
+    open_or_build,
+)
 from app.utils.train_numbers import extract_train_number_str
 
 log = logging.getLogger("trips_repo")
@@ -67,6 +74,8 @@ class TripsRepo:
             None
         )
         self._stop_times_cache_load_ts: float | None = None
+        # Shared read-only stop_times (GTFS_SHARED_DATASET); replaces the dicts above
+        self._stop_times_view: StopTimesView | None = None
 
     # --------------------------- util csv trips ---------------------------
 
@@ -142,14 +151,11 @@ class TripsRepo:
 
     def _current_release_token(self) -> str | None:
         try:
-            from app.services.gtfs_static_manager import STATE_FILE
+            from app.services.gtfs_static_manager import active_release_token
 
-            if STATE_FILE.exists():
-                state = json.loads(STATE_FILE.read_text(encoding="utf-8"))
-                return state.get("active_release") or state.get("sha256")
+            return active_release_token()
         except Exception:
-            pass
-        return None
+            return None
 
     def _sync_direction_upper_cache(self) -> None:
         self._trip_to_direction_up = {k.upper(): v for k, v in self._trip_to_direction.items()}
@@ -408,6 +414,7 @@ class TripsRepo:
 
     # ------------------------------ Load ------------------------------
 
+    @REPO_LOAD_SECONDS.time("trips")
     def load(self) -> None:
         self._trip_to_route.clear()
         self._trip_to_route_up.clear()
@@ -426,6 +433,7 @@ class TripsRepo:
         self._trips_by_route_dir_number.clear()
         self._stop_times_cache_loaded = False
         self._stop_times_cached_rows = None
+        self._stop_times_view = None
 
         if not os.path.exists(self.trips_csv_path):
             raise FileNotFoundError(f"trips.txt not found: {self.trips_csv_path}")
@@ -450,12 +458,59 @@ class TripsRepo:
         self._directions_release_token = self._current_release_token()
         self._load_cached_directions()
 
-        stop_rows = self._load_stop_times_rows()
-        self._precompute_directions_from_stop_times(stop_rows)
-        self._index_stop_times(stop_rows)
+        if getattr(settings, "GTFS_SHARED_DATASET", False):
+            self._load_shared_stop_times()
+        else:
+            stop_rows = self._load_stop_times_rows()
+            self._precompute_directions_from_stop_times(stop_rows)
+            self._index_stop_times(stop_rows)
         self._load_calendar()
         self._build_train_number_indexes(rows)
 
+    def _load_shared_stop_times(self) -> None:
+        """
+        Map the stop_times dataset of the active release, building it if this is
+        the first worker to need it. Only the builder parses stop_times.txt.
+        """
+
+        def build():
+            stop_rows = self._load_stop_times_rows()
+            if not stop_rows:
+                return None
+            self._precompute_directions_from_stop_times(stop_rows)
+            self._index_stop_times(stop_rows)
+            return build_stop_times_writer(
+                stop_rows, self._sched_by_route_stop, self._trip_to_direction
+            )
+
+        key = dataset_key(
+            self._current_release_token(), self.trips_csv_path, self.stop_times_csv_path
+        )
+        try:
+            ds = open_or_build("stop_times", key, build)
+        except Exception as exc:
+            log.warning("trips_repo: shared stop_times dataset unavailable: %r", exc)
+            ds = None
+
+        # Drop the per-process copies whether they were built here or not
+        self._stop_times_by_stopid.clear()
+        self._stop_times_by_seq.clear()
+        self._sched_by_route_stop.clear()
+        self._stop_times_cached_rows = None
+
+        if ds is None:
+            stop_rows = self._load_stop_times_rows()
+            self._precompute_directions_from_stop_times(stop_rows)
+            self._index_stop_times(stop_rows)
+            return
+
+        view = StopTimesView(ds)
+        for trip_id, did in view.iter_trip_directions():
+            self._trip_to_direction.setdefault(trip_id, did)
+        self._sync_direction_upper_cache()
+        self._directions_ready = True
+        self._stop_times_view = view
+
     # ----------------- Infer direction from stop_times -----------------
 
     def _precompute_directions_from_stop_times(
@@ -479,18 +534,6 @@ class TripsRepo:
 
         repo = get_routes_repo()
 
-        order_cache: dict[tuple[str, str], tuple[list[str], dict[str, int]]] = {}
-
-        def order_for(rid: str, did: str) -> tuple[list[str], dict[str, int]]:
-            key = (rid, did)
-            hit = order_cache.get(key)
-            if hit:
-                return hit
-            seq_list, _ = repo.stations_order_set(rid, did)
-            idx = {sid: i for i, sid in enumerate(seq_list)}
-            order_cache[key] = (seq_list, idx)
-            return order_cache[key]
-
         fixed = 0
         for trip_id, obs_pairs in tmp.items():
             if trip_id in self._trip_to_direction:
@@ -507,8 +550,8 @@ class TripsRepo:
                 continue
 
             def score(did: str, rid=rid, obs_ids=obs_ids) -> tuple[int, int]:
-                seq_list, idx = order_for(rid, did)
-                if not seq_list:
+                idx = repo.stop_index_on_route(rid, did)
+                if not idx:
                     return (0, 0)
                 mapped = [idx.get(sid) for sid in obs_ids if sid in idx]
                 matches = len(mapped)
@@ -660,7 +703,11 @@ class TripsRepo:
             rows = self._load_stop_times_rows()
 
         for tid, sid, seq, arr_s, dep_s in rows:
-            self._stop_times_by_stopid[(tid, sid)] = (arr_s, dep_s, seq)
+            # A stop served twice by one trip keeps its later call whatever the
+            # file order, matching the seq-ordered stop_times view
+            prev = self._stop_times_by_stopid.get((tid, sid))
+            if prev is None or seq >= prev[2]:
+                self._stop_times_by_stopid[(tid, sid)] = (arr_s, dep_s, seq)
             self._stop_times_by_seq[(tid, seq)] = (sid, arr_s, dep_s)
             rid = self.route_id_for_trip(tid)
             did = self.direction_for_trip(tid)
@@ -694,12 +741,19 @@ class TripsRepo:
         tid = (trip_id or "").strip()
         if not tid:
             return None, None, None
+        view = self._stop_times_view
         if stop_id:
-            v = self._stop_times_by_stopid.get((tid, stop_id))
+            if view is not None:
+                v = view.by_stop_id(tid, stop_id)
+            else:
+                v = self._stop_times_by_stopid.get((tid, stop_id))
             if v:
                 return v
         if isinstance(stop_sequence, int):
-            v2 = self._stop_times_by_seq.get((tid, int(stop_sequence)))
+            if view is not None:
+                v2 = view.by_seq(tid, int(stop_sequence))
+            else:
+                v2 = self._stop_times_by_seq.get((tid, int(stop_sequence)))
             if v2:
                 sid, arr, dep = v2
                 return arr, dep, int(stop_sequence)
@@ -759,6 +813,16 @@ class TripsRepo:
             return []
 
         rows: list[dict] = []
+        if self._stop_times_view is not None:
+            return [
+                {
+                    "stop_sequence": int(seq),
+                    "stop_id": sid,
+                    "arrival_s": arr_s,
+                    "departure_s": dep_s,
+                }
+                for seq, sid, arr_s, dep_s in self._stop_times_view.calls_for_trip(tid)
+            ]
         for (t_k, seq), (sid, arr_s, dep_s) in self._stop_times_by_seq.items():
             if t_k != tid:
                 continue
@@ -976,8 +1040,10 @@ class TripsRepo:
     ) -> tuple[str | None, int | None, str | None]:
         if not route_id or direction_id not in ("0", "1") or not stop_id:
             return None, None, None
-        key = (route_id, direction_id, stop_id)
-        lst = self._sched_by_route_stop.get(key) or []
+        if self._stop_times_view is not None:
+            lst = self._stop_times_view.sched_for(route_id, direction_id, stop_id)
+        else:
+            lst = self._sched_by_route_stop.get((route_id, direction_id, stop_id)) or []
         if not lst:
             return None, None, None
         if since_ts is None:
@@ -1014,6 +1080,11 @@ class TripsRepo:
         with self._lock:
             self.load()
 
+    @property
+    def release_token(self) -> str | None:
+        """GTFS release the repo was last loaded from."""
+        return self._directions_release_token
+
     def train_number_for_trip(self, trip_id: str) -> str | None:
         if not trip_id:
             return None
@@ -1119,3 +1190,8 @@ def get_repo() -> TripsRepo:
         _repo = TripsRepo(trips_path, stop_times_csv_path=stop_times_path)
         _repo.load()
     return _repo
+
+
+def peek_repo() -> TripsRepo | None:
+    """The loaded repo, or None if nothing asked for it yet (never triggers a load)."""
+    return _repo
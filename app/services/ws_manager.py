@@ -2,14 +2,160 @@
 from __future__ import annotations
 
 import asyncio
+import contextlib
 import logging
-from dataclasses import dataclass
+import time
+from collections import deque
+from dataclasses import dataclass, field
 from typing import Any
 
 from fastapi import WebSocket
 
+from app.core.fast_json import dumps
+
 log = logging.getLogger("ws_manager")
 
+# Version of the trains_update / trains_delta wire protocol.
+TRAINS_PROTOCOL_VERSION = 2
+
+# Max pending messages per connection before the oldest one is dropped
+SEND_QUEUE_MAX = 32
+# A connection whose oldest pending message is older than this is disconnected
+SLOW_CONSUMER_LAG_S = 15.0
+# ...as is one that keeps overflowing its queue without ever draining it
+SLOW_CONSUMER_MAX_DROPS = 64
+
+
+@dataclass
+class NucleusSnapshot:
+    """Last train list published for a nucleus, used as base for deltas."""
+
+    seq: int = 0
+    trains: dict[str, dict[str, Any]] = field(default_factory=dict)
+    order: list[str] = field(default_factory=list)
+
+    def as_list(self) -> list[dict[str, Any]]:
+        return [self.trains[tid] for tid in self.order if tid in self.trains]
+
+
+def diff_trains(
+    prev: dict[str, dict[str, Any]], curr: dict[str, dict[str, Any]]
+) -> tuple[list[dict[str, Any]], dict[str, dict[str, Any]], list[str]]:
+    """
+    Compare two train maps keyed by train_id.
+    Returns (added, changed, removed) where changed only carries modified fields.
+    """
+    added: list[dict[str, Any]] = []
+    changed: dict[str, dict[str, Any]] = {}
+    for tid, data in curr.items():
+        old = prev.get(tid)
+        if old is None:
+            added.append(data)
+            continue
+        fields = {k: v for k, v in data.items() if old.get(k) != v}
+        fields.update({k: None for k in old if k not in data})
+        if fields:
+            changed[tid] = fields
+    removed = [tid for tid in prev if tid not in curr]
+    return added, changed, removed
+
+
+def _coalesce_key(message: dict[str, Any]) -> str | None:
+    """
+    Key under which a pending message is replaced by a newer one of the same kind.
+    Messages without key (pong, subscribed, error...) are delivered in order.
+    """
+    mtype = message.get("type")
+    if mtype in ("trains_update", "trains_delta"):
+        return "trains"
+    if mtype == "train_update":
+        return f"train:{message.get('train_id')}"
+    return None
+
+
+class OutboundQueue:
+    """
+    Bounded per-connection send queue.
+
+    Keyed messages coalesce to the latest pending one, unkeyed ones are FIFO;
+    when full, the oldest pending message is dropped. A ``trains_delta`` that
+    replaces a pending trains message can no longer be applied by the client,
+    so the entry is turned into a resync marker that the writer resolves to a
+    full snapshot at send time.
+    """
+
+    RESYNC = "resync"
+
+    def __init__(self, maxsize: int = SEND_QUEUE_MAX):
+        self._maxsize = maxsize
+        # Entries are [key, message, enqueued_at]; the list is mutated in place on coalesce
+        self._items: deque[list[Any]] = deque()
+        self._by_key: dict[str, list[Any]] = {}
+        self._event = asyncio.Event()
+        self.enqueued = 0
+        self.sent = 0
+        self.bytes_sent = 0
+        self.dropped = 0
+        # Drops since the writer last emptied the queue (the slow-consumer signal)
+        self.dropped_since_drain = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def put(self, message: dict[str, Any]) -> None:
+        self.enqueued += 1
+        key = _coalesce_key(message)
+        entry = self._by_key.get(key) if key else None
+        if entry is not None:
+            self.coalesced += 1
+            if message.get("type") == "trains_delta":
+                entry[1] = self.RESYNC
+            else:
+                entry[1] = message
+            return
+
+        if len(self._items) >= self._maxsize:
+            old = self._items.popleft()
+            if old[0]:
+                self._by_key.pop(old[0], None)
+            self.dropped += 1
+            self.dropped_since_drain += 1
+
+        entry = [key, message, time.monotonic()]
+        self._items.append(entry)
+        if key:
+            self._by_key[key] = entry
+        self._event.set()
+
+    async def get(self) -> dict[str, Any] | str:
+        while not self._items:
+            self._event.clear()
+            await self._event.wait()
+        key, message, _ = self._items.popleft()
+        if key:
+            self._by_key.pop(key, None)
+        if not self._items:
+            self.dropped_since_drain = 0
+        return message
+
+    def lag_s(self) -> float:
+        """Age of the oldest pending message."""
+        if not self._items:
+            return 0.0
+        return time.monotonic() - self._items[0][2]
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "depth": len(self._items),
+            "lag_s": round(self.lag_s(), 3),
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "bytes_sent": self.bytes_sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
+
 
 @dataclass
 class ConnectionInfo:
@@ -18,6 +164,8 @@ class ConnectionInfo:
     station_id: str | None = None
     train_id: str | None = None
     subscribed_at: float = 0.0
+    queue: OutboundQueue = field(default_factory=OutboundQueue)
+    writer: asyncio.Task | None = None
 
 
 class WebSocketManager:
@@ -34,15 +182,25 @@ class WebSocketManager:
         self._by_train: dict[tuple[str, str], set[int]] = {}
         # Lock for thread-safe operations
         self._lock = asyncio.Lock()
-        # Send timeout to avoid slow consumers blocking others
+        # Send timeout for a single frame; writers are per connection so this
+        # only delays the slow connection itself
         self._send_timeout = 2.0
+        self._slow_consumer_lag_s = SLOW_CONSUMER_LAG_S
+        self._slow_consumer_max_drops = SLOW_CONSUMER_MAX_DROPS
+        self._slow_disconnects = 0
+        # Last published train list per nucleus (base for trains_delta)
+        self._snapshots: dict[str, NucleusSnapshot] = {}
+        # Queue counters of closed connections, so the totals never go backwards
+        self._closed_totals = {"sent": 0, "bytes_sent": 0, "dropped": 0, "coalesced": 0}
 
     async def connect(self, websocket: WebSocket) -> int:
         """Accept a new WebSocket connection and return its ID."""
         await websocket.accept()
         conn_id = id(websocket)
+        info = ConnectionInfo(websocket=websocket, subscribed_at=time.time())
+        info.writer = asyncio.create_task(self._writer(info))
         async with self._lock:
-            self._connections[conn_id] = ConnectionInfo(websocket=websocket)
+            self._connections[conn_id] = info
         log.info("ws_connect id=%s total=%s", conn_id, len(self._connections))
         return conn_id
 
@@ -52,13 +210,13 @@ class WebSocketManager:
         async with self._lock:
             info = self._connections.pop(conn_id, None)
             if info:
+                if info.writer and info.writer is not asyncio.current_task():
+                    info.writer.cancel()
+                for name in self._closed_totals:
+                    self._closed_totals[name] += getattr(info.queue, name)
                 # Remove from nucleus index
                 if info.nucleus:
-                    nucleus_set = self._by_nucleus.get(info.nucleus)
-                    if nucleus_set:
-                        nucleus_set.discard(conn_id)
-                        if not nucleus_set:
-                            del self._by_nucleus[info.nucleus]
+                    self._leave_nucleus(info.nucleus, conn_id)
                 # Remove from station index
                 if info.nucleus and info.station_id:
                     key = (info.nucleus, info.station_id)
@@ -77,6 +235,19 @@ class WebSocketManager:
                             del self._by_train[key]
         log.info("ws_disconnect id=%s total=%s", conn_id, len(self._connections))
 
+    def _leave_nucleus(self, nucleus: str, conn_id: int) -> None:
+        """
+        Drop a connection from a nucleus index (lock held). The last one out also
+        drops the nucleus snapshot; the next subscriber starts from a fresh one.
+        """
+        nucleus_set = self._by_nucleus.get(nucleus)
+        if nucleus_set is None:
+            return
+        nucleus_set.discard(conn_id)
+        if not nucleus_set:
+            del self._by_nucleus[nucleus]
+            self._snapshots.pop(nucleus, None)
+
     async def subscribe(
         self,
         websocket: WebSocket,
@@ -96,9 +267,7 @@ class WebSocketManager:
 
             # Remove from old subscriptions if changing
             if info.nucleus and info.nucleus != nucleus:
-                old_set = self._by_nucleus.get(info.nucleus)
-                if old_set:
-                    old_set.discard(conn_id)
+                self._leave_nucleus(info.nucleus, conn_id)
             if info.nucleus and info.station_id:
                 old_key = (info.nucleus, info.station_id)
                 old_station_set = self._by_station.get(old_key)
@@ -171,149 +340,182 @@ class WebSocketManager:
 
         log.debug("ws_subscribe_train id=%s nucleus=%s train=%s", conn_id, nucleus, train_id)
 
-    async def _send_with_timeout(self, websocket: WebSocket, message: dict[str, Any]) -> bool:
-        """Send a JSON message with a short timeout; return True on success."""
+    async def _writer(self, info: ConnectionInfo) -> None:
+        """Drain a connection's queue; the only place that writes to its socket."""
+        ws = info.websocket
         try:
-            await asyncio.wait_for(websocket.send_json(message), timeout=self._send_timeout)
-            return True
+            while True:
+                message = await info.queue.get()
+                if message == OutboundQueue.RESYNC:
+                    message = await self._current_snapshot_message(info.nucleus)
+                    if message is None:
+                        continue
+                data = dumps(message)
+                await asyncio.wait_for(ws.send_text(data.decode()), timeout=self._send_timeout)
+                info.queue.sent += 1
+                info.queue.bytes_sent += len(data)
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            log.debug("ws_send_error err=%s", e)
+            log.debug("ws_send_error id=%s err=%s", id(ws), e)
+            await self.disconnect(ws)
+
+    def _enqueue(self, info: ConnectionInfo, message: dict[str, Any]) -> bool:
+        """Non-blocking send; flags the connection for removal if it is too slow."""
+        q = info.queue
+        q.put(message)
+        if (
+            q.lag_s() > self._slow_consumer_lag_s
+            or q.dropped_since_drain > self._slow_consumer_max_drops
+        ):
+            self._slow_disconnects += 1
+            log.info(
+                "ws_slow_consumer id=%s lag_s=%.1f dropped=%s",
+                id(info.websocket),
+                q.lag_s(),
+                q.dropped_since_drain,
+            )
+            asyncio.get_running_loop().create_task(self._close_slow(info.websocket))
             return False
+        return True
 
-    async def broadcast_to_nucleus(self, nucleus: str, message: dict[str, Any]) -> int:
-        """Send a message to all connections subscribed to a nucleus."""
-        nucleus = (nucleus or "").strip().lower()
-        if not nucleus:
-            return 0
+    async def _close_slow(self, websocket: WebSocket) -> None:
+        await self.disconnect(websocket)
+        with contextlib.suppress(Exception):
+            await websocket.close(code=1013)
 
+    async def _broadcast(
+        self, index: dict[Any, set[int]], key: Any, message: dict[str, Any]
+    ) -> int:
         async with self._lock:
-            conn_ids = list(self._by_nucleus.get(nucleus, []))
+            infos = [
+                info
+                for conn_id in index.get(key, ())
+                if (info := self._connections.get(conn_id)) is not None
+            ]
+        return sum(1 for info in infos if self._enqueue(info, message))
 
-        if not conn_ids:
+    async def broadcast_to_nucleus(self, nucleus: str, message: dict[str, Any]) -> int:
+        """Queue a message for all connections subscribed to a nucleus."""
+        nucleus = (nucleus or "").strip().lower()
+        if not nucleus:
             return 0
-
-        sent = 0
-        disconnected = []
-
-        websockets = []
-        for conn_id in conn_ids:
-            info = self._connections.get(conn_id)
-            if not info:
-                continue
-            websockets.append(info.websocket)
-
-        if websockets:
-            results = await asyncio.gather(
-                *(self._send_with_timeout(ws, message) for ws in websockets),
-                return_exceptions=True,
-            )
-            for idx, res in enumerate(results):
-                if res is True:
-                    sent += 1
-                else:
-                    disconnected.append(websockets[idx])
-
-        # Clean up disconnected
-        for ws in disconnected:
-            await self.disconnect(ws)
-
-        return sent
+        return await self._broadcast(self._by_nucleus, nucleus, message)
 
     async def broadcast_to_station(
         self, nucleus: str, station_id: str, message: dict[str, Any]
     ) -> int:
-        """Send a message to all connections subscribed to a specific station."""
+        """Queue a message for all connections subscribed to a specific station."""
         nucleus = (nucleus or "").strip().lower()
         station_id = (station_id or "").strip()
         if not nucleus or not station_id:
             return 0
-
-        key = (nucleus, station_id)
-        async with self._lock:
-            conn_ids = list(self._by_station.get(key, []))
-
-        if not conn_ids:
-            return 0
-
-        sent = 0
-        disconnected = []
-
-        websockets = []
-        for conn_id in conn_ids:
-            info = self._connections.get(conn_id)
-            if not info:
-                continue
-            websockets.append(info.websocket)
-
-        if websockets:
-            results = await asyncio.gather(
-                *(self._send_with_timeout(ws, message) for ws in websockets),
-                return_exceptions=True,
-            )
-            for idx, res in enumerate(results):
-                if res is True:
-                    sent += 1
-                else:
-                    disconnected.append(websockets[idx])
-
-        for ws in disconnected:
-            await self.disconnect(ws)
-
-        return sent
+        return await self._broadcast(self._by_station, (nucleus, station_id), message)
 
     async def broadcast_to_train(self, nucleus: str, train_id: str, message: dict[str, Any]) -> int:
-        """Send a message to all connections subscribed to a specific train."""
+        """Queue a message for all connections subscribed to a specific train."""
         nucleus = (nucleus or "").strip().lower()
         train_id = (train_id or "").strip()
         if not nucleus or not train_id:
             return 0
+        return await self._broadcast(self._by_train, (nucleus, train_id), message)
 
-        key = (nucleus, train_id)
+    async def send_to_connection(self, websocket: WebSocket, message: dict[str, Any]) -> bool:
+        """Queue a message for a specific connection."""
         async with self._lock:
-            conn_ids = list(self._by_train.get(key, []))
-
-        if not conn_ids:
-            return 0
+            info = self._connections.get(id(websocket))
+        if info is None:
+            return False
+        return self._enqueue(info, message)
 
-        sent = 0
-        disconnected = []
+    @staticmethod
+    def _snapshot_message(nucleus: str, snap: NucleusSnapshot) -> dict[str, Any]:
+        data = snap.as_list()
+        return {
+            "type": "trains_update",
+            "v": TRAINS_PROTOCOL_VERSION,
+            "nucleus": nucleus,
+            "seq": snap.seq,
+            "count": len(data),
+            "timestamp": int(time.time() * 1000),
+            "data": data,
+        }
 
-        websockets = []
-        for conn_id in conn_ids:
-            info = self._connections.get(conn_id)
-            if not info:
-                continue
-            websockets.append(info.websocket)
+    async def publish_trains(self, nucleus: str, trains_data: list[dict[str, Any]]) -> int:
+        """
+        Store the new train list for a nucleus and broadcast it to subscribers.
 
-        if websockets:
-            results = await asyncio.gather(
-                *(self._send_with_timeout(ws, message) for ws in websockets),
-                return_exceptions=True,
-            )
-            for idx, res in enumerate(results):
-                if res is True:
-                    sent += 1
-                else:
-                    disconnected.append(websockets[idx])
+        The first publication for a nucleus is sent as a full ``trains_update``
+        snapshot; subsequent ones as ``trains_delta`` against the previous sequence.
+        Nothing is sent when the list did not change; an empty list is a change
+        like any other, so trains that left the feed are removed client-side.
+        """
+        nucleus = (nucleus or "").strip().lower()
+        if not nucleus:
+            return 0
 
-        for ws in disconnected:
-            await self.disconnect(ws)
+        curr: dict[str, dict[str, Any]] = {}
+        order: list[str] = []
+        for item in trains_data:
+            tid = item.get("train_id")
+            if not tid:
+                continue
+            tid = str(tid)
+            if tid not in curr:
+                order.append(tid)
+            curr[tid] = item
 
-        return sent
+        async with self._lock:
+            if nucleus not in self._by_nucleus:
+                # Nobody to send it to; keep no snapshot around for it either
+                self._snapshots.pop(nucleus, None)
+                return 0
+            prev = self._snapshots.get(nucleus)
+            if prev is None:
+                snap = NucleusSnapshot(seq=1, trains=curr, order=order)
+                self._snapshots[nucleus] = snap
+                message = self._snapshot_message(nucleus, snap)
+            else:
+                added, changed, removed = diff_trains(prev.trains, curr)
+                if not (added or changed or removed):
+                    return 0
+                snap = NucleusSnapshot(seq=prev.seq + 1, trains=curr, order=order)
+                self._snapshots[nucleus] = snap
+                message = {
+                    "type": "trains_delta",
+                    "v": TRAINS_PROTOCOL_VERSION,
+                    "nucleus": nucleus,
+                    "seq": snap.seq,
+                    "base_seq": prev.seq,
+                    "count": len(order),
+                    "timestamp": int(time.time() * 1000),
+                    "added": added,
+                    "changed": changed,
+                    "removed": removed,
+                }
+
+        return await self.broadcast_to_nucleus(nucleus, message)
+
+    async def _current_snapshot_message(self, nucleus: str | None) -> dict[str, Any] | None:
+        nucleus = (nucleus or "").strip().lower()
+        async with self._lock:
+            snap = self._snapshots.get(nucleus)
+            return self._snapshot_message(nucleus, snap) if snap else None
 
-    async def send_to_connection(self, websocket: WebSocket, message: dict[str, Any]) -> bool:
-        """Send a message to a specific connection."""
-        try:
-            await asyncio.wait_for(websocket.send_json(message), timeout=self._send_timeout)
-            return True
-        except Exception:
-            await self.disconnect(websocket)
+    async def send_snapshot(self, websocket: WebSocket, nucleus: str) -> bool:
+        """Send the last published train list of a nucleus (used on subscribe/resync)."""
+        message = await self._current_snapshot_message(nucleus)
+        if message is None:
             return False
+        return await self.send_to_connection(websocket, message)
 
     async def active_nuclei(self) -> list[str]:
-        """Return a snapshot of nuclei with at least one subscriber."""
-        async with self._lock:
-            return list(self._by_nucleus.keys())
+        """Return a snapshot of nuclei with at least one nucleus or train subscriber."""
+        return await self._active_nuclei_internal()
+
+    async def trains_for_nucleus(self, nucleus: str) -> set[str]:
+        """Return the train_ids with subscribers in a nucleus."""
+        return await self._trains_for_nucleus_internal((nucleus or "").strip().lower())
 
     async def _active_nuclei_internal(self) -> list[str]:
         async with self._lock:
@@ -357,6 +559,14 @@ class WebSocketManager:
             log.debug("trains_for_nucleus_blocking error: %s", e)
         return {train for (nuc, train) in self._by_train if nuc == nucleus}
 
+    def queue_totals(self) -> dict[str, int]:
+        """sent / bytes_sent / dropped / coalesced over every connection, open or closed."""
+        totals = dict(self._closed_totals)
+        for info in list(self._connections.values()):
+            for name in totals:
+                totals[name] += getattr(info.queue, name)
+        return totals
+
     def get_stats(self) -> dict[str, Any]:
         """Get current connection statistics."""
         return {
@@ -364,6 +574,17 @@ class WebSocketManager:
             "nuclei_with_subscribers": len(self._by_nucleus),
             "stations_with_subscribers": len(self._by_station),
             "by_nucleus": {k: len(v) for k, v in self._by_nucleus.items()},
+            "snapshot_seq": {k: v.seq for k, v in self._snapshots.items()},
+            "slow_disconnects": self._slow_disconnects,
+            "queues": {
+                "depth_total": sum(len(i.queue) for i in self._connections.values()),
+                "max_lag_s": round(
+                    max((i.queue.lag_s() for i in self._connections.values()), default=0.0), 3
+                ),
+                "dropped_total": sum(i.queue.dropped for i in self._connections.values()),
+                "coalesced_total": sum(i.queue.coalesced for i in self._connections.values()),
+            },
+            "totals": self.queue_totals(),
         }
 
 
@@ -388,7 +609,7 @@ def set_event_loop(loop) -> None:
 def broadcast_trains_sync(nucleus: str, trains_data: list[dict]) -> None:
     """
     Broadcast train updates from synchronous code (e.g., scheduler jobs).
-    This schedules the broadcast on the event loop.
+    This schedules the delta computation and broadcast on the event loop.
     """
     global _event_loop
     if _event_loop is None:
@@ -398,19 +619,9 @@ def broadcast_trains_sync(nucleus: str, trains_data: list[dict]) -> None:
     if not manager._by_nucleus.get(nucleus):
         return  # No subscribers for this nucleus
 
-    import time
-
-    message = {
-        "type": "trains_update",
-        "nucleus": nucleus,
-        "count": len(trains_data),
-        "timestamp": int(time.time() * 1000),
-        "data": trains_data,
-    }
-
     try:
         asyncio.run_coroutine_threadsafe(
-            manager.broadcast_to_nucleus(nucleus, message),
+            manager.publish_trains(nucleus, trains_data),
             _event_loop,
         )
         # Don't wait for result to avoid blocking the scheduler
@@ -454,8 +665,6 @@ def broadcast_train_sync(nucleus: str, train_data: dict) -> None:
     if not train_id:
         return
 
-    import time
-
     message = {
         "type": "train_update",
         "nucleus": nucleus,
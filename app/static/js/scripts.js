@@ -50,6 +50,8 @@
         lastTrainId: null,
         fallbackTimer: null,
         fallbackPollMs: 30000,
+        trains: new Map(),
+        trainsSeq: null,
 
         connect(nucleus) {
             if (!nucleus) return;
@@ -80,6 +82,11 @@
                     try {
                         const data = JSON.parse(event.data);
                         console.debug('[ws] Message:', data.type);
+                        if (data.type === 'trains_delta') {
+                            this.applyTrainsDelta(data);
+                            return;
+                        }
+                        if (data.type === 'trains_update') this.applyTrainsSnapshot(data);
                         this.emit(data.type, data);
                     } catch (e) {
                         console.debug('[ws] Parse error:', e);
@@ -89,6 +96,7 @@
                 this.socket.onclose = (event) => {
                     console.debug('[ws] Closed:', event.code, event.reason);
                     this.connected = false;
+                    this.trainsSeq = null;
                     this.emit('disconnected', { code: event.code });
 
                     // Attempt reconnection
@@ -145,6 +153,43 @@
             return this.send({ type: 'ping' });
         },
 
+        applyTrainsSnapshot(msg) {
+            this.trains = new Map();
+            for (const t of msg.data || []) {
+                if (t && t.train_id != null) this.trains.set(String(t.train_id), t);
+            }
+            this.trainsSeq = typeof msg.seq === 'number' ? msg.seq : null;
+        },
+
+        applyTrainsDelta(msg) {
+            // Out of sync (missed a delta or no base snapshot): ask for a full snapshot
+            if (this.trainsSeq === null || msg.base_seq !== this.trainsSeq) {
+                console.debug('[ws] Trains seq gap', this.trainsSeq, '->', msg.base_seq, ', resyncing');
+                this.trainsSeq = null;
+                this.send({ type: 'resync' });
+                return;
+            }
+            for (const tid of msg.removed || []) this.trains.delete(String(tid));
+            for (const t of msg.added || []) {
+                if (t && t.train_id != null) this.trains.set(String(t.train_id), t);
+            }
+            for (const [tid, fields] of Object.entries(msg.changed || {})) {
+                const prev = this.trains.get(tid) || { train_id: tid };
+                this.trains.set(tid, Object.assign({}, prev, fields));
+            }
+            this.trainsSeq = msg.seq;
+            const data = Array.from(this.trains.values());
+            this.emit('trains_update', {
+                type: 'trains_update',
+                nucleus: msg.nucleus,
+                seq: msg.seq,
+                count: data.length,
+                timestamp: msg.timestamp,
+                data,
+                delta: msg,
+            });
+        },
+
         on(event, callback) {
             if (!this.listeners.has(event)) {
                 this.listeners.set(event, []);
@@ -2566,21 +2611,12 @@
             if (st.abort) { try { st.abort.abort(); } catch (_) {} }
             st.abort = new AbortController();
 
-            let url = apiUrl;
-            try {
-                const u = new URL(apiUrl, location.origin);
-                u.searchParams.set('_ts', Date.now().toString());
-                url = u.toString();
-            } catch (_) {
-                const sep = apiUrl.includes('?') ? '&' : '?';
-                url = `${apiUrl}${sep}_ts=${Date.now()}`;
-            }
-
+            // Revalidate with the ETag instead of cache-busting: unchanged snapshots answer 304
             try {
-                const resp = await fetch(url, {
+                const resp = await fetch(apiUrl, {
                     signal: st.abort.signal,
                     headers: { 'Accept': 'application/json' },
-                    cache: 'no-store',
+                    cache: 'no-cache',
                 });
                 if (!resp.ok) throw new Error('HTTP ' + resp.status);
                 const payload = await resp.json();
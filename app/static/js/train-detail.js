@@ -918,21 +918,12 @@
         st.abort = new AbortController();
         st.inFlight = true;
 
-        let url = apiUrl;
+        // Revalidate with the ETag instead of cache-busting: unchanged snapshots answer 304
         try {
-            const u = new URL(apiUrl, location.origin);
-            u.searchParams.set('_ts', Date.now().toString());
-            url = u.toString();
-        } catch (_) {
-            const sep = apiUrl.includes('?') ? '&' : '?';
-            url = `${apiUrl}${sep}_ts=${Date.now()}`;
-        }
-
-        try {
-            const resp = await fetch(url, {
+            const resp = await fetch(apiUrl, {
                 signal: st.abort.signal,
                 headers: { 'Accept': 'application/json' },
-                cache: 'no-store',
+                cache: 'no-cache',
             });
             if (!resp.ok) throw new Error('HTTP ' + resp.status);
             const payload = await resp.json();
@@ -464,18 +464,6 @@
             if (Number.isFinite(toNumber(snap.heading))) {
                 state.heading = toNumber(snap.heading);
             }
-            if (data.route_geojson) {
-                root.setAttribute('data-map-route-geojson', JSON.stringify(data.route_geojson));
-            }
-            if (data.route_stops_geojson) {
-                root.setAttribute('data-map-stops-geojson', JSON.stringify(data.route_stops_geojson));
-            }
-            if (data.route_geojson || data.route_stops_geojson) {
-                state.routeCtx = buildRouteCtx(
-                    data.route_geojson || readGeoJSON(root, 'data-map-route-geojson', 'train-route-geojson'),
-                    data.route_stops_geojson || readGeoJSON(root, 'data-map-stops-geojson', 'train-route-stops-geojson')
-                );
-            }
             setRouteSegment(state, data);
             if (hasPosition) {
                 if (!state.marker && state.map) {
@@ -504,6 +492,82 @@
         }
     }
 
+    async function fetchRouteGeometry(api, zoom) {
+        if (!api) return null;
+        const url = new URL(api, window.location.origin);
+        if (Number.isFinite(zoom)) url.searchParams.set('z', String(zoom));
+        // Versioned by GTFS release: the browser cache serves repeats
+        const resp = await fetch(url.toString());
+        if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
+        return resp.json();
+    }
+
+    function drawRouteGeometry(root, routeData, stopsData) {
+        const state = root.__trainMap;
+        if (!state || !state.map || (!routeData && !stopsData)) return;
+        const map = state.map;
+        const lineColorFinal = state.lineColor || routeData?.properties?.color || DEFAULT_LINE_COLOR;
+        const uid = state.routeSourceId;
+        const stopsId = `${uid}-stops`;
+        if (routeData) {
+            if (map.getSource(uid)) {
+                map.getSource(uid).setData(routeData);
+            } else {
+                map.addSource(uid, { type: 'geojson', data: routeData });
+                map.addLayer({
+                    id: `${uid}-line`,
+                    type: 'line',
+                    source: uid,
+                    paint: {
+                        'line-color': lineColorFinal,
+                        'line-width': 4,
+                        'line-opacity': 0.9,
+                    },
+                });
+            }
+        }
+        if (stopsData) {
+            if (map.getSource(stopsId)) {
+                map.getSource(stopsId).setData(stopsData);
+            } else {
+                map.addSource(stopsId, { type: 'geojson', data: stopsData });
+                map.addLayer({
+                    id: `${stopsId}-layer`,
+                    type: 'circle',
+                    source: stopsId,
+                    paint: {
+                        'circle-radius': 4,
+                        'circle-color': '#ffffff',
+                        'circle-stroke-color': lineColorFinal,
+                        'circle-stroke-width': 2,
+                    },
+                });
+            }
+        }
+    }
+
+    async function loadRouteGeometry(root) {
+        const state = root.__trainMap;
+        if (!state || !state.map || !state.geometryApi) return;
+        // The server simplifies per zoom band; refetch only when leaving the current one
+        const zoom = Math.round(state.map.getZoom());
+        const range = state.geometryZoomRange;
+        if (range && (range[0] === null || zoom > range[0]) && (range[1] === null || zoom <= range[1])) {
+            return;
+        }
+        state.geometryZoomRange = [zoom - 1, zoom];
+        try {
+            const geo = await fetchRouteGeometry(state.geometryApi, zoom);
+            if (!geo || root.__trainMap !== state) return;
+            state.geometryZoomRange = geo.zoom_range || null;
+            state.routeCtx = buildRouteCtx(geo.route_geojson, geo.route_stops_geojson) || state.routeCtx;
+            drawRouteGeometry(root, geo.route_geojson, geo.route_stops_geojson);
+        } catch (err) {
+            state.geometryZoomRange = null;
+            console.warn('No se pudo cargar la geometría de la ruta', err);
+        }
+    }
+
     function renderInteractive(root, center, heading, routeLabel, routeData, stopsData, lineColor, hasPosition = true) {
         if (!window.maplibregl) return false;
         try {
@@ -542,42 +606,18 @@
                 lastPos: hasPosition ? { lon: center[0], lat: center[1] } : null,
                 routeCtx: buildRouteCtx(routeData, stopsData),
                 positionApi: root.dataset.mapApi || '',
+                geometryApi: root.dataset.mapGeometryApi || '',
+                geometryZoomRange: null,
+                routeSourceId: `train-route-${routeLabel || root.dataset.mapTrain || Date.now()}`,
                 lineColor: lineColor || '',
                 routeLabel: routeLabel || '',
             };
 
             map.on('load', () => {
-                const lineColorFinal = lineColor || routeData?.properties?.color || DEFAULT_LINE_COLOR;
-                const uid = `train-route-${routeLabel || root.dataset.mapTrain || Date.now()}`;
-                if (routeData) {
-                    map.addSource(uid, { type: 'geojson', data: routeData });
-                    map.addLayer({
-                        id: `${uid}-line`,
-                        type: 'line',
-                        source: uid,
-                        paint: {
-                            'line-color': lineColorFinal,
-                            'line-width': 4,
-                            'line-opacity': 0.9,
-                        },
-                    });
-                }
-                if (stopsData) {
-                    const stopsId = `${uid}-stops`;
-                    map.addSource(stopsId, { type: 'geojson', data: stopsData });
-                    map.addLayer({
-                        id: `${stopsId}-layer`,
-                        type: 'circle',
-                        source: stopsId,
-                        paint: {
-                            'circle-radius': 4,
-                            'circle-color': '#ffffff',
-                            'circle-stroke-color': lineColorFinal,
-                            'circle-stroke-width': 2,
-                        },
-                    });
-                }
+                drawRouteGeometry(root, routeData, stopsData);
+                loadRouteGeometry(root);
             });
+            map.on('zoomend', () => loadRouteGeometry(root));
 
             root.dataset.mapMounted = 'interactive';
             refreshPosition(root);
@@ -606,12 +646,6 @@
                 delete root.dataset.mapLon;
                 delete root.dataset.mapHasPosition;
             }
-            if (snap.data?.route_geojson) {
-                root.setAttribute('data-map-route-geojson', JSON.stringify(snap.data.route_geojson));
-            }
-            if (snap.data?.route_stops_geojson) {
-                root.setAttribute('data-map-stops-geojson', JSON.stringify(snap.data.route_stops_geojson));
-            }
             root.dataset.mapMounted = '';
             initElement(root);
             if (root.__trainMap) {
@@ -0,0 +1,95 @@
+# app/utils/bounded_cache.py
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Hashable
+from typing import Any
+
+__all__ = ["BoundedCache"]
+
+_MISSING = object()
+
+
+class BoundedCache:
+    """
+    Thread-safe LRU cache with optional TTL and a validity tag.
+
+    ``retag(tag)`` drops every entry when the tag changes (e.g. a new GTFS
+    release), so callers never serve values computed against stale data.
+    """
+
+    def __init__(self, maxsize: int, ttl_s: float | None = None):
+        self.maxsize = max(1, int(maxsize))
+        self.ttl_s = ttl_s
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._tag: Any = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def retag(self, tag: Any) -> bool:
+        """Set the validity tag; clears the cache and returns True if it changed."""
+        with self._lock:
+            if tag == self._tag:
+                return False
+            self._tag = tag
+            if self._data:
+                self._data.clear()
+                self.invalidations += 1
+            return True
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            hit = self._data.get(key, _MISSING)
+            if hit is _MISSING:
+                self.misses += 1
+                return default
+            stored_at, value = hit
+            if self.ttl_s is not None and (time.monotonic() - stored_at) > self.ttl_s:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            hit = self._data.pop(key, _MISSING)
+            return default if hit is _MISSING else hit[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_s": self.ttl_s,
+            "tag": self._tag,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,88 @@
+# app/utils/geo_index.py
+from __future__ import annotations
+
+import heapq
+import math
+from collections.abc import Callable, Sequence
+
+__all__ = ["NearestIndex"]
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def _to_xyz(lat: float, lon: float) -> tuple[float, float, float]:
+    phi = math.radians(lat)
+    lmb = math.radians(lon)
+    c = math.cos(phi)
+    return (c * math.cos(lmb), c * math.sin(lmb), math.sin(phi))
+
+
+class NearestIndex:
+    """
+    Static KD-tree over (lat, lon) points projected onto the unit sphere.
+
+    Straight-line (chord) distance on the sphere grows with great-circle
+    distance, so k-nearest queries are exact and cost O(log n + k) on
+    average. Points are addressed by their position in the input sequence.
+    """
+
+    def __init__(self, points: Sequence[tuple[float, float]]):
+        self._xyz = [_to_xyz(float(lat), float(lon)) for lat, lon in points]
+        self._root = self._build(list(range(len(self._xyz))), 0)
+
+    def __len__(self) -> int:
+        return len(self._xyz)
+
+    def _build(self, ids: list[int], axis: int):
+        if not ids:
+            return None
+        xyz = self._xyz
+        ids.sort(key=lambda i: (xyz[i][axis], i))
+        mid = len(ids) // 2
+        nxt = (axis + 1) % 3
+        return (ids[mid], axis, self._build(ids[:mid], nxt), self._build(ids[mid + 1 :], nxt))
+
+    def nearest(
+        self,
+        lat: float,
+        lon: float,
+        k: int,
+        accept: Callable[[int], bool] | None = None,
+    ) -> list[tuple[int, float]]:
+        """
+        The ``k`` closest points as (index, distance_km), closest first.
+
+        ``accept`` filters candidates by index; ties keep input order.
+        """
+        if k <= 0 or self._root is None:
+            return []
+        q = _to_xyz(float(lat), float(lon))
+        xyz = self._xyz
+        # Max-heap of the best k as (-d2, -idx): the root is the current worst
+        best: list[tuple[float, int]] = []
+
+        def visit(node) -> None:
+            idx, axis, left, right = node
+            p = xyz[idx]
+            dx, dy, dz = p[0] - q[0], p[1] - q[1], p[2] - q[2]
+            d2 = dx * dx + dy * dy + dz * dz
+            if accept is None or accept(idx):
+                item = (-d2, -idx)
+                if len(best) < k:
+                    heapq.heappush(best, item)
+                elif item > best[0]:
+                    heapq.heapreplace(best, item)
+
+            diff = q[axis] - p[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            if near is not None:
+                visit(near)
+            if far is not None and (len(best) < k or diff * diff <= -best[0][0]):
+                visit(far)
+
+        visit(self._root)
+        out = sorted((-d2, -neg_idx) for d2, neg_idx in best)
+        return [
+            (idx, 2.0 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(d2) / 2.0)))
+            for d2, idx in out
+        ]
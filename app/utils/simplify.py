@@ -0,0 +1,61 @@
+# app/utils/simplify.py
+from __future__ import annotations
+
+import math
+from collections.abc import Sequence
+
+__all__ = ["dp_significance"]
+
+_M_PER_DEG = 111_320.0
+
+
+def dp_significance(coords: Sequence[Sequence[float]], min_tolerance_m: float) -> list[float]:
+    """
+    Douglas–Peucker over [lon, lat] pairs, recording per point the largest
+    tolerance (metres) at which it is still kept.
+
+    The split order doesn't depend on the tolerance, so one pass down to
+    ``min_tolerance_m`` answers every coarser level: a point survives at
+    ``t`` iff its value is > ``t`` (endpoints are ``inf``, dropped points 0).
+    Distances use a local equirectangular projection (fine at route scale).
+    """
+    n = len(coords)
+    sig = [0.0] * n
+    if n == 0:
+        return sig
+    sig[0] = sig[-1] = math.inf
+    if n <= 2:
+        return sig
+    lat0 = math.radians(sum(c[1] for c in coords) / n)
+    kx = _M_PER_DEG * math.cos(lat0)
+    xs = [c[0] * kx for c in coords]
+    ys = [c[1] * _M_PER_DEG for c in coords]
+    tol2 = max(0.0, min_tolerance_m) ** 2
+
+    # (first, last, tolerance cap inherited from the enclosing split)
+    stack = [(0, n - 1, math.inf)]
+    while stack:
+        a, b, cap = stack.pop()
+        if b - a < 2:
+            continue
+        ax, ay = xs[a], ys[a]
+        dx, dy = xs[b] - ax, ys[b] - ay
+        den = dx * dx + dy * dy
+        worst, worst_d2 = -1, tol2
+        for i in range(a + 1, b):
+            px, py = xs[i] - ax, ys[i] - ay
+            if den > 0.0:
+                t = (px * dx + py * dy) / den
+                if t > 1.0:
+                    px, py = px - dx, py - dy
+                elif t > 0.0:
+                    px, py = px - t * dx, py - t * dy
+            d2 = px * px + py * py
+            if d2 > worst_d2:
+                worst, worst_d2 = i, d2
+        if worst >= 0:
+            eff = min(cap, math.sqrt(worst_d2))
+            sig[worst] = eff
+            stack.append((a, worst, eff))
+            stack.append((worst, b, eff))
+    return sig